@@ -1,12 +1,27 @@
 import datetime
 import asyncio
+from collections import Counter
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
 
 import keadapter
 from crud.algorithms.profit_increase_algorithm import ProfitIncreaseAlgorithm
-from crud.bin import get_current_bin, get_max_profit_bin, get_optimal_bin, get_bin_by_number
 from crud import get_shop_db, convert_product_db, get_competitors_db, get_nearest_delivery
+from crud.algorithms.bin_ladder import BinLadder
+from crud.algorithms.calendar_index import CalendarEventEntry
+from crud.algorithms.competitor_cache import CompetitorCache
+from crud.algorithms.delivery_solver import days_until_delivery
+from crud.algorithms.event_loop import iter_sync, run_sync
+from crud.algorithms.fingerprint import FingerprintStore
+from crud.algorithms.instrumentation import AlgorithmInstrumentation
+from crud.algorithms.memo import AlgorithmMemo
 from crud.algorithms.models import CheckResult
+from crud.algorithms.notifications import LOG, MESSAGE, TASK, NotificationDispatcher, \
+    responsible_person_username
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from crud.algorithms.product_reduce import CALENDAR_PRICE_FOR_EVERY_SKU, ProductReduce
 from crud.algorithms.sales_acceleration_algorithm import SalesAccelerationAlgorithm
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+from crud.algorithms.trace import DecisionTrace
 from crud.timer_discount import get_product_timer_discount_conditions_db, get_timer_discount_db
 from database import Bin, ProductsParticipationInCalendarEvent, TimerDiscount
 from database.models import CalculationResult, Delivery, Competitor, ShopProduct, Shop, Product as ProductDb, \
@@ -16,33 +31,142 @@ from sqlalchemy.orm import Session
 
 from utils import dt
 
-
-class AlgorithmDataForSku:
-    def __init__(self, product_db: ProductDb, db: Session):
-        self.competitors: list[Competitor] = asyncio.run(get_competitors_db(product_db.sku_id, db))
-        self.current_bin: Bin = asyncio.run(get_current_bin(product_db, db))
-        self.max_profit_bin: Bin = asyncio.run(get_max_profit_bin(product_db, db))
-        self.nearest_delivery: Delivery = asyncio.run(get_nearest_delivery(product_db.sku_id, db))
-        shop_product: ShopProduct = convert_product_db([product_db], product_db.shop, db)[0]
-        self.result: CalculationResult = CalculationResult(shop=shop_product.shop,
-                                                           product=shop_product.product,
-                                                           error=False, path="", text="")
-        self.timer_discount: TimerDiscount = asyncio.run(get_timer_discount_db(product_db.sku_id, db))
-        self.timer_discount_condition = asyncio.run(get_product_timer_discount_conditions_db([product_db.sku_id], db))[0]
-
-        # заглушка для цены бОльшей, чем бины
-        if self.current_bin is None and product_db.last_price > product_db.min_price:
-            BINS_QUANTYITY = 20
-            self.current_bin: Bin = asyncio.run(get_bin_by_number(BINS_QUANTYITY, product_db, db))
-            product_db.last_price = self.current_bin.to_value
+BINS_QUANTYITY = 20
 
 
-class Algorithm:
-    def __init__(self, shop_id: int, product_id: int, db: Session, sku_list: list[ProductDb] = None):
+class AlgorithmDataForSku:
+    competitors: list[Competitor]
+    bin_ladder: BinLadder
+    current_bin: Bin
+    max_profit_bin: Bin
+    nearest_delivery: Delivery
+    shop_product: ShopProduct
+    timer_discount: TimerDiscount
+    # None - акции с таймером не распределялись, skuid занимает любую свободную
+    timer_slot: Optional[bool]
+    # без prefetch - None до первого обращения к calendar_event_entry
+    calendar_event: Optional[CalendarEventEntry]
+    result: CalculationResult
+    memo: AlgorithmMemo
+    trace: DecisionTrace
+
+    @classmethod
+    async def load(cls, product_db: ProductDb, db: Session, prefetch: Optional[AlgorithmPrefetch] = None,
+                   instrumentation: Optional[AlgorithmInstrumentation] = None,
+                   competitor_cache: Optional[CompetitorCache] = None) -> "AlgorithmDataForSku":
+        data = cls()
+        # до загрузки: set_bin_ladder кладет в него текущий бин
+        data.memo = AlgorithmMemo()
+        if prefetch is not None:
+            data.load_from_prefetch(product_db, prefetch)
+        else:
+            await data.load_from_db(product_db, db, instrumentation, competitor_cache)
+        data.result = CalculationResult(shop=data.shop_product.shop,
+                                        product=data.shop_product.product,
+                                        error=False, path="", text="")
+        data.trace = DecisionTrace()
+        data.memo.seed("competitors", data.competitors)
+        data.memo.seed("nearest_delivery", data.nearest_delivery)
+        data.memo.seed("max_profit_bin", data.max_profit_bin)
+        return data
+
+    async def load_from_db(self, product_db: ProductDb, db: Session,
+                           instrumentation: Optional[AlgorithmInstrumentation] = None,
+                           competitor_cache: Optional[CompetitorCache] = None):
+        competitors = get_competitors_db(product_db.sku_id, db) if competitor_cache is None else \
+            competitor_cache.aget(product_db.sku_id, lambda: get_competitors_db(product_db.sku_id, db))
+        loads = (
+            ("get_competitors_db", competitors),
+            ("get_nearest_delivery", get_nearest_delivery(product_db.sku_id, db)),
+            ("get_timer_discount_db", get_timer_discount_db(product_db.sku_id, db)),
+            ("get_product_timer_discount_conditions_db",
+             get_product_timer_discount_conditions_db([product_db.sku_id], db)),
+        )
+        if instrumentation is not None:
+            loads = tuple((name, instrumentation.acrud_call(name, coro)) for name, coro in loads)
+        # по очереди: все загрузки идут через одну сессию, а Session нельзя использовать конкурентно.
+        # crud-функции выполняют запросы синхронно, так что gather здесь ничего бы и не выиграл
+        (self.competitors, self.nearest_delivery,
+         self.timer_discount, timer_discount_conditions) = [await coro for _, coro in loads]
+        self.timer_discount_condition = timer_discount_conditions[0]
+        self.timer_slot = None
+        self.calendar_event = None
+        if instrumentation is None:
+            self.shop_product = convert_product_db([product_db], product_db.shop, db)[0]
+            self.set_bin_ladder(BinLadder.load(product_db.sku_id, db), product_db)
+            return
+        with instrumentation.crud_call("convert_product_db"):
+            self.shop_product = convert_product_db([product_db], product_db.shop, db)[0]
+        with instrumentation.crud_call("BinLadder.load"):
+            bin_ladder = BinLadder.load(product_db.sku_id, db)
+        self.set_bin_ladder(bin_ladder, product_db)
+
+    def load_from_prefetch(self, product_db: ProductDb, prefetch: AlgorithmPrefetch):
+        self.competitors: list[Competitor] = prefetch.competitors.get(product_db.sku_id, [])
+        self.nearest_delivery: Delivery = prefetch.nearest_delivery.get(product_db.sku_id)
+        self.shop_product: ShopProduct = prefetch.shop_product[product_db.sku_id]
+        self.timer_discount: TimerDiscount = prefetch.timer_discount.get(product_db.sku_id)
+        self.timer_discount_condition = prefetch.timer_discount_condition.get(product_db.sku_id)
+        self.timer_slot = None if prefetch.timer_slots is None else product_db.sku_id in prefetch.timer_slots
+        self.calendar_event = prefetch.calendar_events.get(product_db)
+        self.set_bin_ladder(prefetch.bin_ladders.get(product_db.sku_id) or BinLadder([]), product_db)
+
+    def calendar_event_entry(self, product_db: ProductDb) -> CalendarEventEntry:
+        # без prefetch участия разбираются при первом обращении: до календарных веток доходят не все skuid
+        if self.calendar_event is None:
+            self.calendar_event = CalendarEventEntry.of(product_db)
+        return self.calendar_event
+
+    def set_bin_ladder(self, bin_ladder: BinLadder, product_db: ProductDb):
+        self.bin_ladder = bin_ladder
+        self.current_bin = bin_ladder.current(product_db.last_price)
+        self.memo.seed("current_bin", self.current_bin, depends_on=("last_price",))
+        self.max_profit_bin = bin_ladder.max_profit()
+
+        # заглушка для цены бОльшей, чем бины; цена в промежутке между бинами (199.5 между 199 и 200) остается
+        # без текущего бина, а не переписывается на верхний. Без бина BINS_QUANTYITY заглушка падает, как и раньше
+        top_bin = bin_ladder.by_number(BINS_QUANTYITY)
+        if self.current_bin is None and product_db.last_price > product_db.min_price and \
+                (top_bin is None or product_db.last_price > top_bin.to_value):
+            self.set_last_price(product_db, top_bin.to_value)
+            self.current_bin = top_bin
+            self.memo.seed("current_bin", top_bin, depends_on=("last_price",))
+
+    def set_last_price(self, product_db: ProductDb, value: float):
+        product_db.last_price = value
+        self.memo.invalidate("last_price")
+
+
+class AsyncAlgorithm:
+    def __init__(self, shop_id: int, product_id: int, db: Session, sku_list: list[ProductDb] = None,
+                 prefetch: AlgorithmPrefetch = None, render_trace: bool = True,
+                 instrumentation: AlgorithmInstrumentation = None, fingerprints: FingerprintStore = None,
+                 two_phase: bool = False, competitor_cache: CompetitorCache = None,
+                 notifier: NotificationDispatcher = None, strategy: StrategyConfig = None):
         super().__init__()
         self.product_id: int = product_id
         self.shop_id = shop_id
-        self.db = db
+        # None - расчет без БД по уже загруженным sku_list и prefetch (read_snapshot),
+        # измененные дельты конкурентов остаются в competitor_cache и пишутся вызывающим
+        self.db: Optional[Session] = db
+        self.prefetch: Optional[AlgorithmPrefetch] = prefetch
+        # False - path/text в CalculationResult не собираются, трассировка остается в product_db_data.trace
+        self.render_trace = render_trace
+        self.instrumentation: Optional[AlgorithmInstrumentation] = instrumentation
+        # без сессии (read_snapshot) запросов во время расчета нет: снимок замеряет тот, кто его читает
+        if instrumentation is not None and db is not None:
+            instrumentation.attach(db)
+        # отпечатки входных данных: run_for_product не пересчитывает продукт, если его skuid не изменились
+        self.fingerprints: Optional[FingerprintStore] = fingerprints
+        # run_for_product считает skuid независимо, а продуктовые решения применяет одним ProductReduce
+        self.two_phase = two_phase
+        self.product_reduce: Optional[ProductReduce] = None
+        # общий кэш конкурентов процесса (get_competitor_cache), измененные дельты пишутся после skuid/продукта
+        self.competitor_cache: Optional[CompetitorCache] = competitor_cache
+        # без notifier send_message / add_to_tasks / add_to_logs ничего не делают
+        self.notifier: Optional[NotificationDispatcher] = notifier
+        # пороги и шаги цен веток ProfitIncreaseAlgorithm / SalesAccelerationAlgorithm
+        self.strategy: StrategyConfig = strategy or DEFAULT_STRATEGY
 
         self.sku_list: list[ProductDb] = sku_list or self.db.query(ProductDb).filter(
             ProductDb.product_id == self.product_id).all()
@@ -51,43 +175,129 @@ class Algorithm:
         self.product_db: ProductDb
         self.product_db_data: AlgorithmDataForSku
         self.product_db_data_result_list: list[CalculationResult] = []
+        self.memo_stats: Counter = Counter()
 
         self.sales_acceleration_algorithm: SalesAccelerationAlgorithm
 
-    def init_sku(self, sku: ProductDb):
+    @property
+    def memo(self) -> AlgorithmMemo:
+        return self.product_db_data.memo
+
+    async def init_sku(self, sku: ProductDb):
         self.product_db: ProductDb = sku
-        self.product_db_data: AlgorithmDataForSku = AlgorithmDataForSku(self.product_db, self.db)
+        self.product_db_data: AlgorithmDataForSku = await AlgorithmDataForSku.load(self.product_db, self.db,
+                                                                                   self.prefetch,
+                                                                                   self.instrumentation,
+                                                                                   self.competitor_cache)
         self.sales_acceleration_algorithm: SalesAccelerationAlgorithm = SalesAccelerationAlgorithm(self)
         self.profit_increase_algorithm: ProfitIncreaseAlgorithm = ProfitIncreaseAlgorithm(self, self.sales_acceleration_algorithm)
 
-    def run_by_sku_id(self, sku_id: int):
+    async def run_by_sku_id(self, sku_id: int):
         for sku in self.sku_list:
             if sku.sku_id == sku_id:
-                return self.run_for_sku(sku)
-
-    def run_for_sku(self, sku):
-        self.init_sku(sku)
-        return self.run()
-
-    def run_for_product(self):
+                return await self.run_for_sku(sku)
+
+    async def run_for_sku(self, sku):
+        if self.instrumentation is not None:
+            self.instrumentation.start_sku(sku.sku_id)
+        await self.init_sku(sku)
+        if self.product_reduce is not None:
+            self.product_reduce.add_sku(sku, self.product_db_data)
+        try:
+            result = await self.run()
+        finally:
+            self.memo_stats.update(self.memo.stats())
+            if self.instrumentation is not None:
+                self.instrumentation.finish_sku(sku.mark)
+        # в двухфазном режиме трассировку допишет и соберет reduce
+        if self.render_trace and self.product_reduce is None:
+            self.product_db_data.trace.render_into(result)
+        if not self.ran_for_product:
+            self.write_competitor_deltas()
+        return result
+
+    def restore_sku(self, sku: ProductDb, product_db_data: AlgorithmDataForSku):
+        self.product_db = sku
+        self.product_db_data = product_db_data
+
+    async def run_for_product(self):
         self.ran_for_product = True
-        for sku in self.sku_list:
-            self.product_db_data_result_list.append(self.run_for_sku(sku))
+        self.prefetch = self.prefetch or await AlgorithmPrefetch.for_sku_list(self.sku_list, self.db,
+                                                                              self.instrumentation,
+                                                                              self.competitor_cache)
+        if self.fingerprints is not None:
+            reused = self.fingerprints.reuse_product(self.sku_list, self.prefetch, strategy=self.strategy)
+            if reused is not None:
+                self.product_db_data_result_list.extend(reused)
+                return self.product_db_data_result_list
+        if self.two_phase:
+            await self.run_for_product_in_two_phases()
+        else:
+            for sku in self.sku_list:
+                self.product_db_data_result_list.append(await self.run_for_sku(sku))
+        if self.fingerprints is not None:
+            self.fingerprints.remember_product(self.sku_list,
+                                               self.product_db_data_result_list[-len(self.sku_list):],
+                                               self.prefetch)
+        self.write_competitor_deltas()
         return self.product_db_data_result_list
 
+    def write_competitor_deltas(self):
+        competitor_cache = self.competitor_cache or (self.prefetch.competitor_cache if self.prefetch else None)
+        if competitor_cache is not None and self.db is not None:
+            competitor_cache.write_deltas(self.db)
+
+    async def run_for_product_in_two_phases(self):
+        """
+        Первая фаза считает skuid независимо друг от друга, вторая применяет продуктовые решения ProductReduce.
+        Skuid первой фазы идут по очереди: они разделяют состояние алгоритма (product_db, product_db_data, ветки)
+        и сессию, а расчет skuid не ждет ввода-вывода - gather в одном цикле событий ничего бы не распараллелил.
+        Параллельно считаются продукты в процессах run_for_shops; независимость skuid делает возможным разнести
+        и skuid одного продукта, но этого режим не делает.
+        """
+        self.product_reduce = ProductReduce()
+        try:
+            results = [await self.run_for_sku(sku) for sku in self.sku_list]
+            self.product_reduce.apply(self)
+            if self.render_trace:
+                for sku in self.product_reduce.skus:
+                    sku.product_db_data.trace.render_into(sku.product_db_data.result)
+        finally:
+            self.product_reduce = None
+        self.product_db_data_result_list.extend(results)
+
+    async def iter_for_product(self) -> AsyncIterator[CalculationResult]:
+        """
+        Результаты продукта по одному. Решения skuid окончательны только после расчета всего продукта
+        (цена на весь продукт, добавление продукта в акцию), поэтому отдаются после run_for_product,
+        а накопленный список сразу отпускается.
+        """
+        results = await self.run_for_product()
+        self.product_db_data_result_list = []
+        for result in results:
+            yield result
+
     def add_to_path(func):
+        if asyncio.iscoroutinefunction(func):
+            async def async_wrapper(self, *args, **kwargs):
+                if self.instrumentation is None:
+                    return self.product_db_data.trace.apply(await func(self, *args, **kwargs))
+                with self.instrumentation.check(func.__qualname__):
+                    return self.product_db_data.trace.apply(await func(self, *args, **kwargs))
+
+            return async_wrapper
+
         def wrapper(self, *args, **kwargs):
-            result: CheckResult = func(self, *args, **kwargs)
-            if result.path is not None:
-                self.product_db_data.result.path += result.path
-            if result.text is not None:
-                self.product_db_data.result.text += result.text
-            if result.full_text is not None:
-                self.product_db_data.result.text = self.product_db_data.result.full_text
-            return result.result
+            if self.instrumentation is None:
+                return self.product_db_data.trace.apply(func(self, *args, **kwargs))
+            with self.instrumentation.check(func.__qualname__):
+                return self.product_db_data.trace.apply(func(self, *args, **kwargs))
 
         return wrapper
 
+    def add_text(self, text: str, intern: bool = True):
+        self.product_db_data.trace.add_text(text, intern)
+
     def validate(self, obj, fields_that_should_not_be_none: list):
         for field in fields_that_should_not_be_none:
             if getattr(obj, field) is None:
@@ -125,8 +335,7 @@ class Algorithm:
 
     @add_to_path
     def is_bin_number(self, value: int):
-        self.product_db_data.current_bin = self.product_db_data.current_bin or asyncio.run(
-            get_current_bin(self.product_db, self.db))
+        self.product_db_data.current_bin = self.get_current_bin()
         if self.product_db_data.current_bin.number == value:
             return CheckResult(path=f"Текущий бин продукта номер '{value}',", result=True)
         else:
@@ -163,8 +372,8 @@ class Algorithm:
 
     @add_to_path
     def is_price_with_max_profit(self):
-        self.product_db_data.max_profit_bin = asyncio.run(get_max_profit_bin(self.product_db, self.db))
-        self.product_db_data.current_bin = asyncio.run(get_current_bin(self.product_db, self.db))
+        self.product_db_data.max_profit_bin = self.get_max_profit_bin()
+        self.product_db_data.current_bin = self.get_current_bin()
         if self.product_db_data.current_bin == self.product_db_data.max_profit_bin:
             return CheckResult(path="Максимальная прибыль,", result=True)
         else:
@@ -236,8 +445,8 @@ class Algorithm:
             return CheckResult(path="Факт скорость продаж <= min скорость продаж,", result=False)
 
     @add_to_path
-    def has_info_about_deliveries(self):
-        self.nearest_delivery: Delivery = asyncio.run(get_nearest_delivery(self.product_db.sku_id, self.db))
+    async def has_info_about_deliveries(self):
+        self.nearest_delivery: Delivery = await self.memo.aget("nearest_delivery", self.load_nearest_delivery)
         if self.nearest_delivery:
             return CheckResult(path="Есть инфо о поставках,", result=True)
         else:
@@ -271,7 +480,7 @@ class Algorithm:
 
     @add_to_path
     def can_be_added_to_any_calendar_event(self):
-        if p := self.product_db.most_suitable_calendar_event:
+        if p := self.calendar_event().most_suitable:
             return CheckResult(path=f"Может быть добавлена в календарную акцию с приоритетом {p.priority},",
                                result=True)
         else:
@@ -279,16 +488,49 @@ class Algorithm:
                                result=False)
 
     @add_to_path
-    def is_price_for_calendar_event_calculated_for_every_sku_in_product(self):
-        for product_db_data in self.product_db_data_result_list:
-            if not product_db_data.product.sku.price.for_calendar_event:
-                return CheckResult(path="НЕ для всех skuid одного prodid подсчитана цена,", result=False)
+    def is_price_for_calendar_event_calculated_for_every_sku_in_product(self, calculated: Optional[bool] = None):
+        # calculated передает ProductReduce, который считает условие сразу для всех skuid продукта
+        if calculated is None:
+            calculated = all(product_db_data.product.sku.price.for_calendar_event
+                             for product_db_data in self.product_db_data_result_list)
+        if not calculated:
+            return CheckResult(path="НЕ для всех skuid одного prodid подсчитана цена,", result=False)
         return CheckResult(path="Для всех skuid одного prodid подсчитана цена,", result=True)
 
+    def product_check(self, kind: str, on_true: Callable[[], None], on_false: Callable[[], None]):
+        """Проверка, зависящая от других skuid продукта: в двухфазном режиме откладывается до ProductReduce."""
+        if self.product_reduce is not None:
+            self.product_reduce.defer(kind, on_true, on_false)
+        elif self.run_product_check(kind):
+            on_true()
+        else:
+            on_false()
+
+    def run_product_check(self, kind: str, calculated: Optional[bool] = None) -> bool:
+        if kind == CALENDAR_PRICE_FOR_EVERY_SKU:
+            return self.is_price_for_calendar_event_calculated_for_every_sku_in_product(calculated)
+        return self.sales_acceleration_algorithm.is_price_calculated_for_every_sku_in_product(calculated)
+
+    def load_nearest_delivery(self) -> Awaitable[Optional[Delivery]]:
+        coro = get_nearest_delivery(self.product_db.sku_id, self.db)
+        if self.instrumentation is None:
+            return coro
+        return self.instrumentation.acrud_call("get_nearest_delivery", coro)
+
+    def get_current_bin(self) -> Optional[Bin]:
+        return self.memo.get("current_bin", lambda: self.product_db_data.bin_ladder.current(self.product_db.last_price),
+                             depends_on=("last_price",))
+
+    def get_max_profit_bin(self) -> Optional[Bin]:
+        return self.memo.get("max_profit_bin", self.product_db_data.bin_ladder.max_profit)
+
     def set_new_price(self, value: float):
         self.product_db_data.result.product.sku.price.new = value
 
     def set_new_price_for_product(self, value: float):
+        if self.product_reduce is not None:
+            self.product_reduce.set_price_for_product(value)
+            return
         for product_db_data in self.product_db_data_result_list:
             product_db_data.product.sku.price.new = value
 
@@ -296,18 +538,26 @@ class Algorithm:
         self.product_db_data.result.product.sku.price.for_calendar_event = value
 
     def maximization_profit(self):
-        self.product_db_data.max_profit_bin = asyncio.run(get_max_profit_bin(self.product_db, self.db))
+        self.product_db_data.max_profit_bin = self.get_max_profit_bin()
         self.set_new_price(self.product_db_data.max_profit_bin.to_value)
 
     def minimization_overlap_oos_date_and_delivery_date(self):
-        days = (datetime.date.today() - self.nearest_delivery.date).days
-        optimal_sales_quantity_per_day = int(round(self.product_db.stock / days))
-        self.product_db_data.max_profit_bin = asyncio.run(
-            get_optimal_bin(self.product_db.sku_id, optimal_sales_quantity_per_day, self.db))
-        self.maximization_profit()
+        # тот же выбор, что delivery_solver.solve_delivery_prices для пачки
+        days = days_until_delivery(self.nearest_delivery.date, datetime.date.today())
+        if days <= 0:
+            # поставка сегодня или уже прошла: растягивать остаток не до чего
+            self.maximization_profit()
+            return
+        optimal_sales_quantity_per_day = self.product_db.stock / days
+        optimal_bin = self.memo.get(("optimal_bin", optimal_sales_quantity_per_day),
+                                    lambda: self.product_db_data.bin_ladder.optimal(optimal_sales_quantity_per_day))
+        if optimal_bin is None:
+            self.maximization_profit()
+            return
+        self.set_new_price(optimal_bin.to_value)
 
     def set_bin_number(self, value: int):
-        new_bin: Bin = asyncio.run(get_bin_by_number(value, self.product_db, self.db))
+        new_bin: Bin = self.product_db_data.bin_ladder.by_number(value)
         self.set_new_price(new_bin.to_value)
 
     def increment_bin_number(self):
@@ -316,11 +566,14 @@ class Algorithm:
     def decrement_bin_number(self):
         self.set_bin_number(self.product_db_data.current_bin.number - 1)
 
+    def calendar_event(self) -> CalendarEventEntry:
+        return self.product_db_data.calendar_event_entry(self.product_db)
+
     def add_product_to_calendar_event(self):
-        self.product_db_data.result.product.add_calendar_event_id_in_lk = self.product_db.most_suitable_calendar_event.calendar_event_id_in_lk
+        self.product_db_data.result.product.add_calendar_event_id_in_lk = self.calendar_event().most_suitable.calendar_event_id_in_lk
 
     def remove_product_from_calendar_event(self):
-        self.product_db_data.result.product.remove_calendar_event_id_in_lk = self.product_db.involved_calendar_event.calendar_event_id_in_lk
+        self.product_db_data.result.product.remove_calendar_event_id_in_lk = self.calendar_event().involved.calendar_event_id_in_lk
 
     def add_sku_to_timer_discount(self, for_hours: int = 48):
         self.product_db_data.result.product.sku.add_to_timer_discount_for_hours = for_hours
@@ -336,22 +589,26 @@ class Algorithm:
         self.product_db.mark += value
         self.product_db_data.result.product.sku.mark += value
 
+    def notify(self, kind: str, message: str):
+        if self.notifier is not None:
+            self.notifier.enqueue(kind, self.product_db.shop_id, self.get_responsible_person_username(), message)
+
     def send_message(self, message: str):
-        pass
+        self.notify(MESSAGE, message)
 
     def add_to_tasks(self, message: str):
-        pass
+        self.notify(TASK, message)
 
     def add_to_logs(self, message: str):
-        pass
+        self.notify(LOG, message)
 
     def set_update_price_datetime(self):
         pass
 
     def get_responsible_person_username(self):
-        return f"{self.product_db.shop.responsible_person.username if self.product_db.shop.responsible_person else 'НЕ УКАЗАН ОТВЕТСТВЕННЫЙ'}"
+        return responsible_person_username(self.product_db.shop)
 
-    def run(self):
+    async def run(self):
         if not self.validate_product_db():
             return self.product_db_data.result
         self.product_db.mark = ""
@@ -362,7 +619,7 @@ class Algorithm:
                 f"разобраться в блокировке товара {self.get_responsible_person_username()}")
             # self.add_to_logs("") КАКОЕ ДЕЙСТВИЕ???
             self.set_mark("1.1")
-            self.product_db_data.result.text += (
+            self.add_text(
                 "1. Оповестить в чат о том, что skuid заблокирован с указанием ответственного за магазин\n"
                 "2. Добавить в задачи разобраться в блокировке товара с указанием ответственного\n"
                 "3. Отметить действие в таблице с логами\n"
@@ -375,16 +632,21 @@ class Algorithm:
                 if self.is_stock_empty():
                     if self.is_reserved_stock_empty():
                         if self.can_be_added_to_any_calendar_event():
-                            self.set_new_calendar_event_price(self.product_db.most_suitable_calendar_event.recommended_price)
-                            if self.is_price_for_calendar_event_calculated_for_every_sku_in_product():
-                                self.product_db_data.result.text += "Вставляем в распродажу весь продукт"
+                            self.set_new_calendar_event_price(self.calendar_event().recommended_price)
+
+                            def add_product_to_calendar_event():
+                                self.add_text("Вставляем в распродажу весь продукт")
                                 self.add_product_to_calendar_event()
                                 self.set_mark("1.10B")
-                            else:
-                                self.product_db_data.result.text += "Переходим к подсчетам для следующего skuid, относящего к одному prodid"
+
+                            def go_to_next_sku():
+                                self.add_text("Переходим к подсчетам для следующего skuid, относящего к одному prodid")
+
+                            self.product_check(CALENDAR_PRICE_FOR_EVERY_SKU, add_product_to_calendar_event,
+                                               go_to_next_sku)
                         else:
                             if self.is_bin_number(15):
-                                self.product_db_data.result.text += "Переходим к подсчетам для следующего skuid, относящего к одному prodid"
+                                self.add_text("Переходим к подсчетам для следующего skuid, относящего к одному prodid")
                             else:
                                 """
                                 1. Поставить цену 15 бина (если считать снизу)  в день
@@ -393,10 +655,10 @@ class Algorithm:
                                 4. Оповестить в чат о действии
                                 """
                                 self.set_bin_number(15)
-                                self.product_db_data.result.text += "Поставить цену 15 бина (если считать снизу)  в день"
+                                self.add_text("Поставить цену 15 бина (если считать снизу)  в день")
                                 self.set_mark("1.3")
                     else:
-                        self.product_db_data.result.text += "Есть необходимость пополнения товара с СДХ (склад длительного хранения)"
+                        self.add_text("Есть необходимость пополнения товара с СДХ (склад длительного хранения)")
                         self.set_mark("1.4")
                 else:
                     if self.is_status("В продаже"):
@@ -405,12 +667,12 @@ class Algorithm:
                                 if self.is_avg_sales_speed__greater_than__min_sales_speed():
                                     # self.price_change_algorithm.run()
                                     # TODO: запуск 3 алгоритма вместо поднятия цены на один бин
-                                    self.product_db_data.result.text += "Меняем цену согласно алгоритму #3\n"
-                                    self.profit_increase_algorithm.run()
+                                    self.add_text("Меняем цену согласно алгоритму #3\n")
+                                    await self.profit_increase_algorithm.run()
                                 else:
 
-                                    self.product_db_data.result.text += "Меняем цену, согласно алгоритму #2\n"
-                                    self.sales_acceleration_algorithm.run()
+                                    self.add_text("Меняем цену, согласно алгоритму #2\n")
+                                    await self.sales_acceleration_algorithm.run()
                             else:
                                 if self.is_min_price_border_reached():
                                     if self.is_days_without_sales__greater_than__three():
@@ -419,7 +681,7 @@ class Algorithm:
                                         self.add_to_logs("")
                                         self.add_to_tasks("Прокачать/Найти причину отсутствия продаж для skuid")
                                         self.set_mark("1.9")
-                                        self.product_db_data.result.text += (
+                                        self.add_text(
                                             "1. Критическое оповещение в чате со списком всех skuid, о том, что\n"
                                             "Skuid не продается уже ? дней,  ключевик 'Лубрикант', позиция 12 с отметкой управляющего магазина\n"
                                             "2. Отметить действие в таблице с логами\n"
@@ -434,7 +696,7 @@ class Algorithm:
                                                 self.add_to_tasks(
                                                     f"Найти причину отсутствия продаж для {self.product_db.sku_full_title}")
                                                 self.set_mark("1.11")
-                                                self.product_db_data.result.text += (
+                                                self.add_text(
                                                     "1. Критическое оповещение в чат с отметкой управляющего и меня, что 'ТОП товар skuid не продается уже ? дней'\n"
                                                     "2. Отметить действие в таблице с логами\n"
                                                     "3. Добавить в задачи 'Найти причину отсутствия продаж для skuid'\n"
@@ -448,31 +710,31 @@ class Algorithm:
                                                     self.add_to_tasks(
                                                         f"Необходимо прокачать отзывами {self.product_db.sku_full_title}")
                                                     self.set_mark("1.10")
-                                                self.product_db_data.result.text += (
+                                                self.add_text(
                                                     "1. Оповещение в чат с отметкой управляющего, что ТОП нуждается в прокачке\n"
                                                     "2. Отметить действие в таблице с логами\n"
                                                     "3. Добавить в задачи 'Необходимо прокачать отзывами skuid'\n"
                                                     "4. Метка 1.10\n"
                                                 )
-                                            self.product_db_data.result.text += "Переход к след СКУ"
+                                            self.add_text("Переход к след СКУ")
                                             self.set_new_price(None)
                                         else:
-                                            self.product_db_data.result.text += "Переход к след СКУ"
+                                            self.add_text("Переход к след СКУ")
                                             self.set_new_price(None)
                                 else:
                                     if self.is_top():
                                         self.send_message(
                                             f"ТОП товар {self.product_db.sku_full_title} не продаётся {self.get_responsible_person_username()}\n")
                                         self.add_to_logs("")
-                                        self.product_db_data.result.text += (
+                                        self.add_text(
                                             "1. Оповещаем в чат, что ТОП товар не продается\n"
                                             "2. Отметить действие в таблице с логами\n")
-                                    self.product_db_data.result.text += "Понижаем цену, согласно алгоритму #2:\n"
-                                    self.sales_acceleration_algorithm.run()
+                                    self.add_text("Понижаем цену, согласно алгоритму #2:\n")
+                                    await self.sales_acceleration_algorithm.run()
             else:
                 self.set_mark("1.2")
-                self.product_db_data.result.text += ("1. Переходим к след SKU\n"
-                                                     "2. Метка 1.2\n")
+                self.add_text("1. Переходим к след SKU\n"
+                              "2. Метка 1.2\n")
                 self.set_new_price(None)
         return self.product_db_data.result
 
@@ -528,3 +790,41 @@ class Algorithm:
         #             if self.is_sku_in_timer_discount():
         #                 pass
         #         return self.result
+
+
+class Algorithm:
+    """Синхронная обертка над AsyncAlgorithm: все вызовы идут через один долгоживущий event loop."""
+
+    def __init__(self, shop_id: int, product_id: int, db: Session, sku_list: list[ProductDb] = None,
+                 prefetch: AlgorithmPrefetch = None, render_trace: bool = True,
+                 instrumentation: AlgorithmInstrumentation = None,
+                 fingerprints: FingerprintStore = None, two_phase: bool = False,
+                 competitor_cache: CompetitorCache = None, notifier: NotificationDispatcher = None,
+                 strategy: StrategyConfig = None):
+        self.async_algorithm: AsyncAlgorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list, prefetch,
+                                                              render_trace=render_trace,
+                                                              instrumentation=instrumentation,
+                                                              fingerprints=fingerprints, two_phase=two_phase,
+                                                              competitor_cache=competitor_cache, notifier=notifier,
+                                                              strategy=strategy)
+
+    def __getattr__(self, item):
+        return getattr(self.async_algorithm, item)
+
+    def init_sku(self, sku: ProductDb):
+        run_sync(self.async_algorithm.init_sku(sku))
+
+    def run_by_sku_id(self, sku_id: int):
+        return run_sync(self.async_algorithm.run_by_sku_id(sku_id))
+
+    def run_for_sku(self, sku):
+        return run_sync(self.async_algorithm.run_for_sku(sku))
+
+    def run_for_product(self):
+        return run_sync(self.async_algorithm.run_for_product())
+
+    def iter_for_product(self) -> Iterator[CalculationResult]:
+        return iter_sync(self.async_algorithm.iter_for_product())
+
+    def run(self):
+        return run_sync(self.async_algorithm.run())
@@ -0,0 +1,414 @@
+"""
+Бэктест дерева решений на исторических дневных снимках skuid в колоночном виде.
+
+Снимок - словарь колонок одинаковой длины (строка = skuid за день): скалярные колонки SNAPSHOT_COLUMNS
+и матрицы лестницы бинов BIN_COLUMNS формы (строки, бины), отсортированные по номеру бина и дополненные NaN.
+build_snapshot_batch векторно строит из снимка ту же пачку, что build_sku_batch из ORM, и ее считает DecisionEngine.
+Выручка моделируется как цена, умноженная на скорость продаж бина, в который эта цена попадает.
+Строки с fallback считаются строками без изменения цены: иначе прирост выручки считался бы только по skuid,
+которые дерево решило без продуктовых веток, и завышался бы долей остальных.
+"""
+import datetime
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from crud.algorithms.algorithm import BINS_QUANTYITY
+from crud.algorithms.decision_tree import Batch, DecisionBatchResult, DecisionEngine, timer_discount_age_hours
+from crud.algorithms.delivery_solver import days_until_delivery, solve_delivery_prices
+from database.models import Product as ProductDb
+
+BACKTEST_CHUNK_SIZE = 1_000_000
+
+SNAPSHOT_COLUMNS = (
+    "day", "sku_id", "product_id",
+    "status_title", "active", "top", "stock", "reserved_stock", "last_price", "min_price", "days_without_sales",
+    "average_sales_speed", "min_sales_speed", "search_position",
+    "on_calendar_event", "on_timer_discount", "can_be_added_to_calendar_event", "in_calendar_event_top100",
+    "has_free_timer_discounts", "timer_slot", "timer_max_price", "timer_discount_id", "timer_discount_age_hours",
+    "has_competitor", "competitor_stock", "competitor_price", "competitor_sales_speed", "competitor_search_position",
+    "competitor_price_age_days", "competitor_last_delta",
+    "delivery_days",
+)
+BIN_COLUMNS = ("bin_number", "bin_from", "bin_to", "bin_profit", "bin_sales_speed")
+# проверки валидации skuid, которые объектный путь делает перед деревом
+VALIDATED_COLUMNS = ("stock", "min_price", "last_price", "days_without_sales", "average_sales_speed",
+                     "min_sales_speed")
+
+Snapshot = dict[str, np.ndarray]
+
+# метка строк с fallback в распределении меток и выручки по меткам
+FALLBACK_MARK = "fallback"
+
+
+def _nan(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+def snapshot_from_data(sku_list: list[ProductDb], data_list: list, day: datetime.date = None) -> Snapshot:
+    """Дневной снимок из загруженных AlgorithmDataForSku - так копится история для бэктеста."""
+    day = day or datetime.date.today()
+    # срок в акции с таймером считается на момент снимка
+    now = datetime.datetime.now()
+    width = max((len(data.bin_ladder) for data in data_list), default=0)
+    n = len(sku_list)
+    snapshot: Snapshot = {name: np.full((n, width), np.nan) for name in BIN_COLUMNS}
+    rows: dict[str, list] = {name: [] for name in SNAPSHOT_COLUMNS}
+
+    for i, (product_db, data) in enumerate(zip(sku_list, data_list)):
+        competitor = data.competitors[0] if data.competitors else None
+        delivery = data.nearest_delivery
+        condition = data.timer_discount_condition
+        calendar_event = data.calendar_event_entry(product_db)
+        values = {
+            "day": np.datetime64(day, "D"), "sku_id": product_db.sku_id, "product_id": product_db.product_id,
+            "status_title": product_db.status_title or "", "active": bool(product_db.active),
+            "top": bool(product_db.top),
+            "search_position": _nan(product_db.search_position),
+            "on_calendar_event": bool(product_db.on_calendar_event),
+            "on_timer_discount": bool(product_db.on_timer_discount),
+            "can_be_added_to_calendar_event": bool(calendar_event.most_suitable),
+            "in_calendar_event_top100": calendar_event.in_top100,
+            "has_free_timer_discounts": product_db.shop.quantity_available_timer_discounts > 0,
+            "timer_slot": data.timer_slot is not False,
+            "timer_max_price": _nan(condition.max_price if condition else None),
+            "timer_discount_id": _nan(data.timer_discount.discount_id if data.timer_discount else None),
+            "timer_discount_age_hours": timer_discount_age_hours(data.timer_discount, now),
+            "has_competitor": competitor is not None,
+            "competitor_stock": _nan(competitor.stock if competitor else None),
+            "competitor_price": _nan(competitor.price if competitor else None),
+            "competitor_sales_speed": _nan(competitor.average_sales_speed if competitor else None),
+            "competitor_search_position": _nan(competitor.search_position if competitor else None),
+            "competitor_price_age_days": _nan((day - competitor.price_change_date).days
+                                              if competitor and competitor.price_change_date else None),
+            "competitor_last_delta": _nan(competitor.last_delta_between_us_and_cmp if competitor else None),
+            "delivery_days": _nan(days_until_delivery(delivery.date, day) if delivery else None),
+        }
+        for name in ("stock", "reserved_stock", "last_price", "min_price", "days_without_sales",
+                     "average_sales_speed", "min_sales_speed"):
+            values[name] = _nan(getattr(product_db, name))
+        for name in SNAPSHOT_COLUMNS:
+            rows[name].append(values[name])
+        for j, bin_db in enumerate(data.bin_ladder.bins):
+            snapshot["bin_number"][i, j] = bin_db.number
+            snapshot["bin_from"][i, j] = bin_db.from_value
+            snapshot["bin_to"][i, j] = bin_db.to_value
+            snapshot["bin_profit"][i, j] = _nan(bin_db.profit)
+            snapshot["bin_sales_speed"][i, j] = _nan(bin_db.sales_speed)
+
+    for name, values in rows.items():
+        if name == "day":
+            snapshot[name] = np.array(values, dtype="datetime64[D]")
+        elif name == "status_title":
+            snapshot[name] = np.array(values, dtype=str)
+        elif name in ("sku_id", "product_id"):
+            snapshot[name] = np.array(values, dtype=np.int64)
+        elif values and isinstance(values[0], bool):
+            snapshot[name] = np.array(values, dtype=bool)
+        else:
+            snapshot[name] = np.array(values, dtype=float)
+    return snapshot
+
+
+def concat_snapshots(snapshots: Iterable[Snapshot]) -> Snapshot:
+    """Склеивает дневные снимки; матрицы бинов дополняются NaN до самой широкой лестницы."""
+    snapshots = list(snapshots)
+    width = max(s["bin_to"].shape[1] for s in snapshots)
+    result: Snapshot = {}
+    for name in snapshots[0]:
+        if name in BIN_COLUMNS:
+            result[name] = np.concatenate([
+                np.pad(s[name], ((0, 0), (0, width - s[name].shape[1])), constant_values=np.nan) for s in snapshots])
+        else:
+            result[name] = np.concatenate([s[name] for s in snapshots])
+    return result
+
+
+def save_snapshot(path: str, snapshot: Snapshot):
+    np.savez_compressed(path, **snapshot)
+
+
+def load_snapshot(path: str) -> Snapshot:
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def iter_chunks(snapshot: Snapshot, chunk_size: int = BACKTEST_CHUNK_SIZE) -> Iterator[Snapshot]:
+    n = len(snapshot["sku_id"])
+    for start in range(0, n, chunk_size):
+        yield {name: values[start:start + chunk_size] for name, values in snapshot.items()}
+
+
+class BinMatrix:
+    """Векторные аналоги методов BinLadder для матриц бинов (строки, бины) с NaN-хвостом."""
+
+    def __init__(self, snapshot: Snapshot):
+        self.number = snapshot["bin_number"]
+        self.from_value = snapshot["bin_from"]
+        self.to_value = snapshot["bin_to"]
+        self.profit = snapshot["bin_profit"]
+        self.sales_speed = snapshot["bin_sales_speed"]
+        self.count = np.sum(~np.isnan(self.to_value), axis=1)
+        self.rows = np.arange(len(self.count))
+
+    def take(self, values: np.ndarray, index: np.ndarray) -> np.ndarray:
+        """values[строка, index], NaN там, где бина с таким индексом нет."""
+        found = (index >= 0) & (index < self.count)
+        result = np.full(len(index), np.nan)
+        result[found] = values[self.rows[found], index[found]]
+        return result
+
+    def current_index(self, price: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            index = np.sum(self.from_value <= price[:, None], axis=1) - 1
+            inside = price <= self.take(self.to_value, index)
+        return np.where(inside, index, -1)
+
+    def by_number(self, number: int) -> np.ndarray:
+        match = self.number == number
+        return np.where(match.any(axis=1), np.argmax(match, axis=1), -1)
+
+    def max_profit(self) -> np.ndarray:
+        profit = np.where(np.isnan(self.profit), -np.inf, self.profit)
+        return np.where(self.count > 0, np.argmax(profit, axis=1), -1)
+
+    def lower(self, price: np.ndarray, min_price: np.ndarray) -> np.ndarray:
+        index = self.current_index(price)
+        return self.above_min_price(np.where(index >= 0, index - 1, -1), min_price)
+
+    def upper(self, price: np.ndarray) -> np.ndarray:
+        index = self.current_index(price)
+        return np.where(index >= 0, index + 1, -1)
+
+    def lower_by_competitor(self, competitor_price: np.ndarray, min_price: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            index = np.sum(self.to_value < competitor_price[:, None], axis=1) - 1
+        return self.above_min_price(np.where(np.isnan(competitor_price), -1, index), min_price)
+
+    def upper_by_competitor(self, competitor_price: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            index = np.sum(self.from_value <= competitor_price[:, None], axis=1)
+        return np.where(np.isnan(competitor_price), -1, index)
+
+    def above_min_price(self, index: np.ndarray, min_price: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            below = self.take(self.to_value, index) <= min_price
+        return np.where(below, -1, index)
+
+    def sales_speed_at(self, price: np.ndarray) -> np.ndarray:
+        return self.take(self.sales_speed, self.current_index(price))
+
+
+def build_snapshot_batch(snapshot: Snapshot) -> tuple[Batch, BinMatrix]:
+    """Пачка для DecisionEngine из снимка, с заглушкой цены выше бинов, как в AlgorithmDataForSku.set_bin_ladder."""
+    bins = BinMatrix(snapshot)
+    n = len(snapshot["sku_id"])
+    last_price = snapshot["last_price"].copy()
+    min_price = snapshot["min_price"]
+
+    current = bins.current_index(last_price)
+    top_bin = bins.by_number(BINS_QUANTYITY)
+    with np.errstate(invalid="ignore"):
+        # только выше верхнего бина: цена в промежутке между бинами остается без текущего бина
+        stub = (current < 0) & (last_price > min_price) & ~(last_price <= bins.take(bins.to_value, top_bin))
+    # без бина BINS_QUANTYITY объектный путь падает в заглушке - такие строки уходят в fallback как невалидные
+    broken = stub & (top_bin < 0)
+    stub &= ~broken
+    current = np.where(stub, top_bin, current)
+    last_price[stub] = bins.take(bins.to_value, top_bin)[stub]
+
+    valid = ~broken
+    for name in VALIDATED_COLUMNS:
+        valid &= ~np.isnan(last_price if name == "last_price" else snapshot[name])
+    with np.errstate(invalid="ignore"):
+        valid &= last_price >= min_price
+
+    search_position = snapshot["search_position"]
+    delivery_days = snapshot["delivery_days"]
+    has_delivery = ~np.isnan(delivery_days)
+    competitor_price = snapshot["competitor_price"]
+
+    def price_of(index: np.ndarray) -> np.ndarray:
+        return bins.take(bins.to_value, index)
+
+    batch: Batch = {
+        "valid": valid,
+        "status_title": snapshot["status_title"].astype(object),
+        "active": snapshot["active"],
+        "top": snapshot["top"],
+        "stock": snapshot["stock"],
+        "reserved_stock": snapshot["reserved_stock"],
+        "last_price": last_price,
+        "min_price": min_price,
+        "days_without_sales": snapshot["days_without_sales"],
+        "average_sales_speed": snapshot["average_sales_speed"],
+        "min_sales_speed": snapshot["min_sales_speed"],
+        # -1 - "нет в выдаче", NaN - позиция неизвестна
+        "search_position": search_position,
+        "in_top100_search_results": ~np.isnan(search_position) & (search_position != -1),
+        "result_mark": snapshot["result_mark"].astype(object) if "result_mark" in snapshot
+        else np.full(n, "", dtype=object),
+        "current_bin_number": bins.take(bins.number, current),
+        "bin_15_price": price_of(bins.by_number(15)),
+        "max_profit_price": price_of(bins.max_profit()),
+        "lower_bin_price": np.where(valid, price_of(bins.lower(last_price, min_price)), np.nan),
+        "upper_bin_price": np.where(valid, price_of(bins.upper(last_price)), np.nan),
+        "has_competitor": snapshot["has_competitor"],
+        "competitor_has_stock": snapshot["has_competitor"] & ~np.isnan(snapshot["competitor_stock"]) &
+        (np.nan_to_num(snapshot["competitor_stock"]) != 0),
+        "competitor_price": competitor_price,
+        "competitor_sales_speed": snapshot["competitor_sales_speed"],
+        "competitor_search_position": snapshot["competitor_search_position"],
+        "competitor_price_age_days": snapshot["competitor_price_age_days"],
+        "competitor_last_delta": snapshot["competitor_last_delta"],
+        "lower_bin_by_competitor_price": np.where(valid, price_of(bins.lower_by_competitor(competitor_price,
+                                                                                           min_price)), np.nan),
+        "upper_bin_by_competitor_price": price_of(bins.upper_by_competitor(competitor_price)),
+        "has_delivery": has_delivery,
+        "delivery_days": delivery_days,
+        "delivery_bin_price": solve_delivery_prices(snapshot["stock"], delivery_days, bins.to_value,
+                                                    bins.sales_speed, price_of(bins.max_profit())),
+        "on_calendar_event": snapshot["on_calendar_event"],
+        "on_timer_discount": snapshot["on_timer_discount"],
+        "can_be_added_to_calendar_event": snapshot["can_be_added_to_calendar_event"],
+        "in_calendar_event_top100": snapshot["in_calendar_event_top100"],
+        "has_free_timer_discounts": snapshot["has_free_timer_discounts"],
+        # снимки, сохраненные до распределения акций, его не знают
+        "timer_slot": snapshot["timer_slot"] if "timer_slot" in snapshot else np.ones(n, dtype=bool),
+        "timer_max_price": snapshot["timer_max_price"],
+        "timer_discount_id": snapshot["timer_discount_id"],
+        # в снимках, сохраненных до этой колонки, срок неизвестен: skuid ждут окончания акции
+        "timer_discount_age_hours": snapshot["timer_discount_age_hours"] if "timer_discount_age_hours" in snapshot
+        else np.full(n, np.nan),
+    }
+    return batch, bins
+
+
+class BacktestReport:
+    """
+    Распределение меток, изменений цены и смоделированной выручки по всем строкам-skuid-дням.
+    Строки с fallback входят во все распределения с прежней ценой и меткой FALLBACK_MARK.
+    """
+
+    def __init__(self):
+        self.rows: int = 0
+        self.fallback_rows: int = 0
+        self.marks: Counter = Counter()
+        self.price_up: int = 0
+        self.price_down: int = 0
+        self.price_same: int = 0
+        # относительное изменение цены: гистограмма с шагом 1% от -50% до +50%, края - все, что дальше
+        self.price_change_edges: np.ndarray = np.concatenate(([-np.inf], np.linspace(-0.5, 0.5, 101), [np.inf]))
+        self.price_change_histogram: np.ndarray = np.zeros(len(self.price_change_edges) - 1, dtype=np.int64)
+        self.baseline_revenue: float = 0.0
+        self.simulated_revenue: float = 0.0
+        self.revenue_rows: int = 0
+        self.revenue_by_mark: dict[str, list[float]] = {}
+        self.revenue_by_day: dict[datetime.date, list[float]] = {}
+        # день -> [строк, из них с fallback]
+        self.rows_by_day: dict[datetime.date, list[int]] = {}
+
+    def add(self, snapshot: Snapshot, batch: Batch, bins: BinMatrix, decisions: DecisionBatchResult):
+        n = len(batch["valid"])
+        fallback = decisions.fallback
+        self.rows += n
+        self.fallback_rows += int(fallback.sum())
+        mark = np.where(fallback, FALLBACK_MARK, decisions.mark.astype(str))
+        days, inverse = np.unique(snapshot["day"], return_inverse=True)
+        for day, rows, fallback_rows in zip(days.tolist(), np.bincount(inverse, minlength=len(days)).tolist(),
+                                            np.bincount(inverse, fallback, len(days)).astype(int).tolist()):
+            totals = self.rows_by_day.setdefault(day, [0, 0])
+            totals[0] += rows
+            totals[1] += fallback_rows
+
+        marks, counts = np.unique(mark, return_counts=True)
+        self.marks.update(dict(zip(marks.tolist(), counts.tolist())))
+
+        last_price = batch["last_price"]
+        # цена None в объектном пути - "не менять"; строку с fallback бэктест тоже не меняет
+        new_price = np.where(~fallback & decisions.price_set & ~np.isnan(decisions.price), decisions.price,
+                             last_price)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            change = new_price / last_price - 1
+        changed = ~np.isnan(change)
+        self.price_up += int((changed & (change > 0)).sum())
+        self.price_down += int((changed & (change < 0)).sum())
+        self.price_same += int((changed & (change == 0)).sum())
+        self.price_change_histogram += np.histogram(change[changed], self.price_change_edges)[0]
+
+        baseline = last_price * bins.sales_speed_at(last_price)
+        revenue = new_price * bins.sales_speed_at(new_price)
+        counted = ~np.isnan(baseline) & ~np.isnan(revenue)
+        self.revenue_rows += int(counted.sum())
+        self.baseline_revenue += float(baseline[counted].sum())
+        self.simulated_revenue += float(revenue[counted].sum())
+        for key, group, values in (("mark", self.revenue_by_mark, mark),
+                                   ("day", self.revenue_by_day, snapshot["day"])):
+            keys, inverse = np.unique(values[counted], return_inverse=True)
+            base_sums = np.bincount(inverse, baseline[counted], len(keys))
+            sim_sums = np.bincount(inverse, revenue[counted], len(keys))
+            for k, base_sum, sim_sum in zip(keys.tolist(), base_sums, sim_sums):
+                totals = group.setdefault(k, [0.0, 0.0])
+                totals[0] += base_sum
+                totals[1] += sim_sum
+
+    def price_change_quantiles(self, quantiles: Iterable[float] = (0.05, 0.25, 0.5, 0.75, 0.95)) -> dict[float, float]:
+        """Квантили по гистограмме: значение - правая граница бакета, в который попал квантиль."""
+        total = self.price_change_histogram.sum()
+        if not total:
+            return {}
+        cumulative = np.cumsum(self.price_change_histogram) / total
+        return {q: float(self.price_change_edges[np.searchsorted(cumulative, q) + 1]) for q in quantiles}
+
+    def to_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "fallback_rows": self.fallback_rows,
+            "marks": dict(self.marks.most_common()),
+            "price": {"up": self.price_up, "down": self.price_down, "same": self.price_same,
+                      "change_quantiles": self.price_change_quantiles()},
+            "revenue": {"rows": self.revenue_rows, "baseline": self.baseline_revenue,
+                        "simulated": self.simulated_revenue,
+                        "by_mark": {k: {"baseline": v[0], "simulated": v[1]} for k, v in self.revenue_by_mark.items()},
+                        "by_day": {str(k): {"baseline": v[0], "simulated": v[1]}
+                                   for k, v in sorted(self.revenue_by_day.items())}},
+            "rows_by_day": {str(k): {"rows": v[0], "fallback_rows": v[1]} for k, v in sorted(self.rows_by_day.items())},
+        }
+
+    def summary(self, top: int = 15) -> str:
+        simulated = self.rows - self.fallback_rows
+        lines = [f"skuid-дней: {self.rows}, посчитано: {simulated}, fallback (цена без изменений): "
+                 f"{self.fallback_rows} ({self.fallback_rows / max(self.rows, 1):.1%})",
+                 f"цена: выше {self.price_up}, ниже {self.price_down}, без изменений {self.price_same}"]
+        quantiles = self.price_change_quantiles()
+        if quantiles:
+            lines.append("изменение цены: " + ", ".join(f"p{int(q * 100)} {v:+.0%}" for q, v in quantiles.items()))
+        if self.baseline_revenue:
+            lines.append(f"выручка: было {self.baseline_revenue:,.0f}, стало бы {self.simulated_revenue:,.0f} "
+                         f"({self.simulated_revenue / self.baseline_revenue - 1:+.2%}) на {self.revenue_rows} строках")
+        if self.rows_by_day:
+            shares = [fallback_rows / rows for rows, fallback_rows in self.rows_by_day.values()]
+            lines.append(f"доля fallback по дням: от {min(shares):.1%} до {max(shares):.1%}")
+        lines.append("метки:")
+        for mark, count in self.marks.most_common(top):
+            base, sim = self.revenue_by_mark.get(mark, (0.0, 0.0))
+            lines.append(f"    {mark or '-':<8}{count:>12}{count / max(self.rows, 1):>8.1%}"
+                         f"{sim - base:>16,.0f}")
+        return "\n".join(lines)
+
+
+def run_backtest(snapshots: Iterable[Snapshot], engine: Optional[DecisionEngine] = None,
+                 chunk_size: int = BACKTEST_CHUNK_SIZE) -> BacktestReport:
+    """
+    Считает дерево по всем снимкам пачками не больше chunk_size строк. Строки с fallback (продуктовые ветки,
+    невалидные данные) объектным путем не пересчитать, поэтому они идут в отчет с ценой без изменений.
+    Дельта с конкурентом в снимке берется как была в тот день, без переноса изменений между днями.
+    """
+    engine = engine or DecisionEngine()
+    report = BacktestReport()
+    for snapshot in snapshots:
+        for chunk in iter_chunks(snapshot, chunk_size):
+            batch, bins = build_snapshot_batch(chunk)
+            report.add(chunk, batch, bins, engine.evaluate(batch))
+    return report
@@ -0,0 +1,435 @@
+import logging
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from crud.algorithms.algorithm import AsyncAlgorithm, AlgorithmDataForSku
+from crud.algorithms.competitor_cache import CompetitorCache, CompetitorSnapshot
+from crud.algorithms.consistent_read import load_skus, read_snapshot
+from crud.algorithms.decision_tree import DecisionEngine, build_sku_batch
+from crud.algorithms.event_loop import iter_sync, run_sync
+from crud.algorithms.decision_store import DecisionStore
+from crud.algorithms.fingerprint import FingerprintEntry, FingerprintStore
+from crud.algorithms.notifications import HttpNotificationTransport, NotificationDispatcher
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from crud.algorithms.scheduler import RepricingScheduler
+from crud.algorithms.sku_snapshot import load_sku_snapshots
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+from crud.algorithms.timer_slots import allocate_shop_timer_slots
+from database.models import CalculationResult, Product as ProductDb
+
+SKU_CHUNK_SIZE = 500  # sku на одну задачу воркера, продукт целиком всегда попадает в один чанк
+
+logger = logging.getLogger(__name__)
+
+_worker_db: Optional[Session] = None
+_worker_fingerprints: Optional[FingerprintStore] = None
+_worker_notifier: Optional[NotificationDispatcher] = None
+_worker_read_slots: Optional[multiprocessing.Semaphore] = None
+_engines: dict[StrategyConfig, DecisionEngine] = {}
+
+
+def get_engine(strategy: StrategyConfig = None) -> DecisionEngine:
+    strategy = strategy or DEFAULT_STRATEGY
+    engine = _engines.get(strategy)
+    if engine is None:
+        engine = _engines[strategy] = DecisionEngine(strategy=strategy)
+    return engine
+
+
+def _init_worker(session_factory: Callable[[], Session], fingerprint_path: Optional[str] = None,
+                 notification_url: Optional[str] = None, read_slots: Optional[multiprocessing.Semaphore] = None):
+    global _worker_db, _worker_fingerprints, _worker_notifier, _worker_read_slots
+    _worker_db = session_factory()
+    # соединения пула, унаследованные от родителя при fork, принадлежат ему: воркер открывает свои
+    _worker_db.get_bind().dispose(close=False)
+    _worker_read_slots = read_slots
+    if fingerprint_path is not None:
+        _worker_fingerprints = FingerprintStore.load(fingerprint_path)
+    if notification_url is not None:
+        _worker_notifier = NotificationDispatcher(HttpNotificationTransport(notification_url)).start()
+
+
+def product_error_results(shop_id: int, product_id: int, skus: list[ProductDb], prefetch: AlgorithmPrefetch,
+                          db: Optional[Session], error: Exception) -> list[CalculationResult]:
+    """
+    Результаты продукта, расчет которого упал: у каждого skuid error=True и тип ошибки, остальные продукты
+    считаются дальше. Изменения упавшего расчета отбрасываются, чтобы они не попали в БД вместе с чанком:
+    дельты конкурентов (снимки забывают изменение, объекты сессии перечитываются) и поля его skuid.
+    Вызывается из except: в лог пишется трейсбек.
+    """
+    logger.exception("Расчет продукта %s магазина %s упал", product_id, shop_id)
+    error_text = f"{type(error).__name__}: {error}"
+    results = []
+    for sku in skus:
+        for competitor in prefetch.competitors.get(sku.sku_id, []):
+            if isinstance(competitor, CompetitorSnapshot):
+                competitor.discard()
+            elif db is not None:
+                db.expire(competitor)
+        if db is not None:
+            db.expire(sku)
+        shop_product = prefetch.shop_product[sku.sku_id]
+        results.append(CalculationResult(shop=shop_product.shop, product=shop_product.product, error=True,
+                                         path="", text="", error_text=error_text))
+    return results
+
+
+async def run_products_vectorized(shop_id: int, by_product: dict[int, list[ProductDb]], db: Session,
+                                  prefetch: AlgorithmPrefetch, engine: DecisionEngine = None,
+                                  render_trace: bool = True, fingerprints: FingerprintStore = None,
+                                  notifier: NotificationDispatcher = None) -> list[CalculationResult]:
+    """
+    Считает все skuid пачкой через DecisionEngine. Продукты, в которых хоть один skuid ушел в fallback,
+    целиком пересчитываются AsyncAlgorithm, чтобы продуктовые решения остались такими же.
+    С fingerprints неизмененные продукты берутся из прошлого расчета и в пачку не попадают.
+    """
+    engine = engine or get_engine()
+    reused: dict[int, list[CalculationResult]] = {}
+    if fingerprints is not None:
+        for product_id, skus in by_product.items():
+            results = fingerprints.reuse_product(skus, prefetch, strategy=engine.strategy)
+            if results is not None:
+                reused[product_id] = results
+    sku_list = [sku for product_id, skus in by_product.items() if product_id not in reused for sku in skus]
+    if not sku_list:
+        return [result for results in reused.values() for result in results]
+    data_list = [await AlgorithmDataForSku.load(sku, db, prefetch) for sku in sku_list]
+    decisions = engine.evaluate(build_sku_batch(sku_list, data_list))
+
+    fallback_products = {sku.product_id for sku, fallback in zip(sku_list, decisions.fallback) if fallback}
+    results_by_product: dict[int, list[CalculationResult]] = defaultdict(list)
+    for i, (sku, data) in enumerate(zip(sku_list, data_list)):
+        if sku.product_id not in fallback_products:
+            decisions.apply(i, sku, data, notifier)
+            results_by_product[sku.product_id].append(data.result)
+
+    results: list[CalculationResult] = []
+    for product_id, skus in by_product.items():
+        if product_id in reused:
+            results.extend(reused[product_id])
+        elif product_id in fallback_products:
+            # отпечатки продукта уже посчитаны выше, поэтому AsyncAlgorithm запускается без fingerprints
+            algorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list=skus, prefetch=prefetch,
+                                       render_trace=render_trace, notifier=notifier, strategy=engine.strategy)
+            try:
+                product_results = await algorithm.run_for_product()
+            except Exception as e:
+                results.extend(product_error_results(shop_id, product_id, skus, prefetch, db, e))
+                continue
+            if fingerprints is not None:
+                fingerprints.remember_product(skus, product_results, prefetch)
+            results.extend(product_results)
+        else:
+            if fingerprints is not None:
+                fingerprints.remember_product(skus, results_by_product[product_id], prefetch)
+            results.extend(results_by_product[product_id])
+    if prefetch.competitor_cache is not None and db is not None:
+        prefetch.competitor_cache.write_deltas(db)
+    return results
+
+
+async def _iter_chunk_async(shop_id: int, product_ids: list[int], db: Session, *, vectorized: bool = False,
+                            render_trace: bool = True, fingerprints: FingerprintStore = None,
+                            competitor_cache: CompetitorCache = None, notifier: NotificationDispatcher = None,
+                            timer_slots: Optional[frozenset[int]] = None) -> AsyncIterator[CalculationResult]:
+    sku_list = load_skus(product_ids, db)
+    prefetch = await AlgorithmPrefetch.for_sku_list(sku_list, db, competitor_cache=competitor_cache)
+    prefetch.timer_slots = timer_slots
+    async for result in _iter_loaded_chunk(shop_id, product_ids, sku_list, db, prefetch, vectorized=vectorized,
+                                           render_trace=render_trace, fingerprints=fingerprints, notifier=notifier):
+        yield result
+
+
+async def _iter_loaded_chunk(shop_id: int, product_ids: list[int], sku_list: list[ProductDb], db: Optional[Session],
+                             prefetch: AlgorithmPrefetch, *, vectorized: bool = False, render_trace: bool = True,
+                             fingerprints: FingerprintStore = None,
+                             notifier: NotificationDispatcher = None) -> AsyncIterator[CalculationResult]:
+    by_product: dict[int, list[ProductDb]] = {product_id: [] for product_id in product_ids}
+    for sku in sku_list:
+        by_product[sku.product_id].append(sku)
+
+    if vectorized:
+        for result in await run_products_vectorized(shop_id, by_product, db, prefetch, render_trace=render_trace,
+                                                    fingerprints=fingerprints, notifier=notifier):
+            yield result
+        return
+
+    for product_id in product_ids:
+        skus = by_product[product_id]
+        if not skus:
+            # продукт удален после разбиения магазина на чанки
+            continue
+        algorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list=skus, prefetch=prefetch,
+                                   render_trace=render_trace, fingerprints=fingerprints, notifier=notifier)
+        # ошибка одного продукта не должна обрывать чанк, магазин и весь run_for_shops
+        try:
+            results = await algorithm.run_for_product()
+        except Exception as e:
+            results = product_error_results(shop_id, product_id, skus, prefetch, db, e)
+        for result in results:
+            yield result
+
+
+async def _run_chunk_async(shop_id: int, product_ids: list[int], db: Session, *, vectorized: bool = False,
+                           render_trace: bool = True, fingerprints: FingerprintStore = None,
+                           competitor_cache: CompetitorCache = None, notifier: NotificationDispatcher = None,
+                           timer_slots: Optional[frozenset[int]] = None) -> list[CalculationResult]:
+    return [result async for result in _iter_chunk_async(
+        shop_id, product_ids, db, vectorized=vectorized, render_trace=render_trace, fingerprints=fingerprints,
+        competitor_cache=competitor_cache, notifier=notifier, timer_slots=timer_slots)]
+
+
+async def _run_chunk_snapshot_async(shop_id: int, product_ids: list[int], db: Session, *, vectorized: bool = False,
+                                    render_trace: bool = True, fingerprints: FingerprintStore = None,
+                                    notifier: NotificationDispatcher = None,
+                                    read_slots: Optional[multiprocessing.Semaphore] = None,
+                                    timer_slots: Optional[frozenset[int]] = None) -> list[CalculationResult]:
+    """
+    Чанк в три шага: все входные данные читаются одним снимком (read_snapshot) и копируются в SkuSnapshotBatch,
+    расчет идет без БД, измененные дельты конкурентов пишутся короткой транзакцией. Соединение занято
+    только на чтение и запись, а все skuid чанка (и продукта) видят одно состояние БД.
+    Конкуренты читаются в кэш чанка, а не в общий кэш процесса: его записи могли быть загружены до снимка.
+    """
+    with read_snapshot(db, read_slots):
+        loaded = await load_sku_snapshots(product_ids, db)
+    loaded.prefetch.timer_slots = timer_slots
+    results = [result async for result in _iter_loaded_chunk(
+        shop_id, product_ids, loaded.skus, None, loaded.prefetch, vectorized=vectorized, render_trace=render_trace,
+        fingerprints=fingerprints, notifier=notifier)]
+    if loaded.dirty:
+        with db.begin():
+            loaded.write_deltas(db)
+    return results
+
+
+async def iter_shop_results(shop_id: int, db: Session, *, chunk_size: int = SKU_CHUNK_SIZE, vectorized: bool = False,
+                            render_trace: bool = True, fingerprints: FingerprintStore = None,
+                            competitor_cache: CompetitorCache = None, notifier: NotificationDispatcher = None,
+                            snapshot: bool = False, allocate_timer_slots: bool = False,
+                            decisions: DecisionStore = None) -> AsyncIterator[CalculationResult]:
+    """
+    Потоковый расчет магазина в текущем процессе: результаты отдаются по мере готовности продуктов,
+    в памяти одновременно только один чанк. После каждого чанка сессия очищается (expunge_all),
+    как в воркерах run_for_shops, поэтому изменения объектов (метки) нужно сохранять до перехода к следующему чанку.
+    Снимки конкурентов из competitor_cache к сессии не привязаны и переживают очистку.
+    snapshot=True читает каждый чанк одним снимком (_run_chunk_snapshot_async) и коммитит дельты конкурентов
+    после чанка: сессия не должна быть в транзакции, competitor_cache не используется.
+    allocate_timer_slots=True до расчета распределяет свободные акции с таймером магазина между его skuid
+    (allocate_shop_timer_slots), чтобы заявок на акции было не больше, чем их у магазина.
+    С decisions отдаются только результаты, решение которых изменилось с прошлой отдачи; сохранять decisions
+    вызывающий должен сам, после того как обработал все результаты.
+    """
+    if snapshot:
+        with read_snapshot(db):
+            chunks = split_shop_into_chunks(shop_id, db, chunk_size)
+            timer_slots = await allocate_shop_timer_slots(shop_id, db) if allocate_timer_slots else None
+        for product_ids in chunks:
+            for result in await _run_chunk_snapshot_async(shop_id, product_ids, db, vectorized=vectorized,
+                                                          render_trace=render_trace, fingerprints=fingerprints,
+                                                          notifier=notifier, timer_slots=timer_slots):
+                if decisions is None or decisions.changed(result):
+                    yield result
+        return
+
+    timer_slots = await allocate_shop_timer_slots(shop_id, db) if allocate_timer_slots else None
+    for product_ids in split_shop_into_chunks(shop_id, db, chunk_size):
+        try:
+            async for result in _iter_chunk_async(shop_id, product_ids, db, vectorized=vectorized,
+                                                  render_trace=render_trace, fingerprints=fingerprints,
+                                                  competitor_cache=competitor_cache, notifier=notifier,
+                                                  timer_slots=timer_slots):
+                if decisions is None or decisions.changed(result):
+                    yield result
+        finally:
+            db.expunge_all()
+
+
+def iter_shop(shop_id: int, db: Session, *, chunk_size: int = SKU_CHUNK_SIZE, vectorized: bool = False,
+              render_trace: bool = True, fingerprints: FingerprintStore = None,
+              competitor_cache: CompetitorCache = None, notifier: NotificationDispatcher = None,
+              snapshot: bool = False, allocate_timer_slots: bool = False,
+              decisions: DecisionStore = None) -> Iterator[CalculationResult]:
+    return iter_sync(iter_shop_results(shop_id, db, chunk_size=chunk_size, vectorized=vectorized,
+                                       render_trace=render_trace, fingerprints=fingerprints,
+                                       competitor_cache=competitor_cache, notifier=notifier, snapshot=snapshot,
+                                       allocate_timer_slots=allocate_timer_slots, decisions=decisions))
+
+
+def _run_chunk(shop_id: int, product_ids: list[int], timer_slots: Optional[frozenset[int]] = None, *,
+               vectorized: bool = False, render_trace: bool = True, snapshot: bool = False,
+               ) -> tuple[list[CalculationResult], dict[int, Optional[FingerprintEntry]]]:
+    try:
+        if snapshot:
+            results = run_sync(_run_chunk_snapshot_async(
+                shop_id, product_ids, _worker_db, vectorized=vectorized, render_trace=render_trace,
+                fingerprints=_worker_fingerprints, notifier=_worker_notifier, read_slots=_worker_read_slots,
+                timer_slots=timer_slots))
+        else:
+            results = run_sync(_run_chunk_async(
+                shop_id, product_ids, _worker_db, vectorized=vectorized, render_trace=render_trace,
+                fingerprints=_worker_fingerprints, notifier=_worker_notifier, timer_slots=timer_slots))
+            # как в снимке, изменения чанка (дельты конкурентов, метки skuid) фиксирует воркер:
+            # expunge_all ниже выбросил бы их из сессии незаписанными
+            _worker_db.commit()
+        if _worker_notifier is not None:
+            # у воркеров пула нет хука завершения, поэтому уведомления чанка отправляются до возврата результатов
+            _worker_notifier.flush()
+        return results, _worker_fingerprints.pop_updated() if _worker_fingerprints is not None else {}
+    except BaseException:
+        _worker_db.rollback()
+        raise
+    finally:
+        # сессия живет весь срок воркера, но объекты чанка не должны копиться в identity map
+        _worker_db.expunge_all()
+
+
+def split_shop_into_chunks(shop_id: int, db: Session, chunk_size: int = SKU_CHUNK_SIZE) -> list[list[int]]:
+    sku_count = db.query(ProductDb.product_id, func.count(ProductDb.sku_id)).filter(
+        ProductDb.shop_id == shop_id).group_by(ProductDb.product_id).order_by(ProductDb.product_id)
+
+    chunks: list[list[int]] = []
+    chunk: list[int] = []
+    chunk_skus = 0
+    for product_id, count in sku_count:
+        if chunk and chunk_skus + count > chunk_size:
+            chunks.append(chunk)
+            chunk, chunk_skus = [], 0
+        chunk.append(product_id)
+        chunk_skus += count
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_for_shops(shop_ids: list[int], session_factory: Callable[[], Session], *, max_workers: Optional[int] = None,
+                  chunk_size: int = SKU_CHUNK_SIZE, vectorized: bool = False, render_trace: bool = True,
+                  fingerprint_path: Optional[str] = None, notification_url: Optional[str] = None,
+                  snapshot: bool = False, max_connections: Optional[int] = None,
+                  allocate_timer_slots: bool = False,
+                  decision_store_path: Optional[str] = None) -> Iterator[CalculationResult]:
+    """
+    Считает все продукты магазинов в пуле процессов.
+    session_factory должна пиклиться (функция уровня модуля или sessionmaker), каждый воркер открывает свою сессию
+    и коммитит изменения каждого чанка (дельты конкурентов, метки skuid) до возврата его результатов.
+    Результаты отдаются в порядке магазинов и продуктов по мере готовности чанков.
+    vectorized=True считает чанк через DecisionEngine (без path/text в результатах),
+    render_trace=False отключает сборку path/text и для объектного пути.
+    fingerprint_path - файл FingerprintStore: неизмененные продукты не пересчитываются,
+    новые отпечатки сохраняются в файл после того, как отданы все результаты.
+    notification_url - endpoint HttpNotificationTransport: каждый воркер копит уведомления чанка в дайджесты
+    и отправляет их в конце чанка.
+    snapshot=True - каждый чанк читается одним read-only снимком, после чего воркер отпускает соединение
+    на время расчета (_run_chunk_snapshot_async). max_connections ограничивает число воркеров,
+    одновременно держащих соединение на чтение снимка; остальные ждут очереди.
+    allocate_timer_slots=True распределяет акции с таймером каждого магазина до раздачи чанков, и воркеры
+    добавляют в акции только skuid с выделенной акцией.
+    decision_store_path - файл DecisionStore: отдаются только результаты с изменившимся решением,
+    последние решения сохраняются в файл после того, как отданы все результаты.
+    """
+    db = session_factory()
+    try:
+        timer_slots = {shop_id: run_sync(allocate_shop_timer_slots(shop_id, db)) for shop_id in shop_ids} \
+            if allocate_timer_slots else {}
+        tasks = [(shop_id, chunk, timer_slots.get(shop_id))
+                 for shop_id in shop_ids for chunk in split_shop_into_chunks(shop_id, db, chunk_size)]
+    finally:
+        db.close()
+    if not tasks:
+        return
+
+    max_workers = max_workers or os.cpu_count()
+    read_slots = multiprocessing.BoundedSemaphore(max_connections) if snapshot and max_connections else None
+    updated: dict[int, Optional[FingerprintEntry]] = {}
+    decisions = DecisionStore.load(decision_store_path) if decision_store_path is not None else None
+    run_chunk = partial(_run_chunk, vectorized=vectorized, render_trace=render_trace, snapshot=snapshot)
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)), initializer=_init_worker,
+                             initargs=(session_factory, fingerprint_path, notification_url, read_slots)) as executor:
+        for results, chunk_updated in executor.map(run_chunk, *zip(*tasks)):
+            updated.update(chunk_updated)
+            yield from results if decisions is None else decisions.emit(results)
+
+    if fingerprint_path is not None:
+        fingerprints = FingerprintStore.load(fingerprint_path)
+        fingerprints.merge(updated)
+        fingerprints.save(fingerprint_path)
+    if decisions is not None:
+        decisions.save(decision_store_path)
+
+
+def run_for_shop(shop_id: int, session_factory: Callable[[], Session], *, max_workers: Optional[int] = None,
+                 chunk_size: int = SKU_CHUNK_SIZE, vectorized: bool = False,
+                 render_trace: bool = True, fingerprint_path: Optional[str] = None,
+                 notification_url: Optional[str] = None, snapshot: bool = False,
+                 max_connections: Optional[int] = None, allocate_timer_slots: bool = False,
+                 decision_store_path: Optional[str] = None) -> Iterator[CalculationResult]:
+    return run_for_shops([shop_id], session_factory, max_workers=max_workers, chunk_size=chunk_size,
+                         vectorized=vectorized, render_trace=render_trace, fingerprint_path=fingerprint_path,
+                         notification_url=notification_url, snapshot=snapshot, max_connections=max_connections,
+                         allocate_timer_slots=allocate_timer_slots, decision_store_path=decision_store_path)
+
+
+def run_scheduled(scheduler: RepricingScheduler, session_factory: Callable[[], Session], *,
+                  max_workers: Optional[int] = None, chunk_size: int = SKU_CHUNK_SIZE, vectorized: bool = False,
+                  render_trace: bool = True, notification_url: Optional[str] = None, snapshot: bool = False,
+                  max_connections: Optional[int] = None, allocate_timer_slots: bool = False,
+                  decision_store_path: Optional[str] = None) -> Iterator[CalculationResult]:
+    """
+    Считает продукты в порядке выдачи scheduler (после scheduler.refresh), не больше max_workers чанков
+    одновременно. Результаты отдаются по мере готовности чанков, а не в порядке магазинов.
+    Заканчивается, когда очередь пуста, включая продукты, ждущие min_time_between_price_changing;
+    для непрерывной работы вызывающий повторяет refresh и run_scheduled.
+    allocate_timer_slots=True распределяет акции с таймером магазина при первой выдаче его продуктов,
+    распределение действует до конца вызова.
+    decision_store_path - файл DecisionStore, как в run_for_shops; решения сохраняются, когда очередь опустела.
+    """
+    timer_slots: dict[int, frozenset[int]] = {}
+
+    def shop_timer_slots(shop_id: int) -> Optional[frozenset[int]]:
+        if not allocate_timer_slots:
+            return None
+        if shop_id not in timer_slots:
+            db = session_factory()
+            try:
+                timer_slots[shop_id] = run_sync(allocate_shop_timer_slots(shop_id, db))
+            finally:
+                db.close()
+        return timer_slots[shop_id]
+
+    max_workers = max_workers or os.cpu_count()
+    read_slots = multiprocessing.BoundedSemaphore(max_connections) if snapshot and max_connections else None
+    in_flight: dict[Future, list[int]] = {}
+    decisions = DecisionStore.load(decision_store_path) if decision_store_path is not None else None
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(session_factory, None, notification_url, read_slots)) as executor:
+        while True:
+            while len(in_flight) < max_workers:
+                batch = scheduler.next_batch(chunk_size)
+                if batch is None:
+                    break
+                shop_id, product_ids = batch
+                in_flight[executor.submit(_run_chunk, shop_id, product_ids, shop_timer_slots(shop_id),
+                                          vectorized=vectorized, render_trace=render_trace,
+                                          snapshot=snapshot)] = product_ids
+            delay = scheduler.seconds_until_next()
+            if not in_flight:
+                if delay is None:
+                    if decisions is not None:
+                        decisions.save(decision_store_path)
+                    return
+                time.sleep(delay)
+                continue
+            # все воркеры заняты - ждать выдачи бессмысленно, ждем завершения чанка
+            timeout = None if len(in_flight) >= max_workers else delay
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                scheduler.complete(in_flight.pop(future))
+                results, _ = future.result()
+                yield from results if decisions is None else decisions.emit(results)
@@ -0,0 +1,545 @@
+"""
+Бенчмарк алгоритма на синтетических магазинах в in-memory SQLite.
+
+    python alg_ke/benchmark/run.py --shops 2 --products 500 --skus-per-product 3
+
+Для каждого режима печатает перцентили задержки на skuid, пропускную способность и число SQL-запросов,
+а также расхождения решений (цена, метка) с эталонным режимом product.
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import standin  # noqa: E402
+
+standin.install()
+
+import numpy as np  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from crud.algorithms.algorithm import AlgorithmDataForSku, AsyncAlgorithm  # noqa: E402
+from crud.algorithms import backtest  # noqa: E402
+from crud.algorithms.batch import get_engine  # noqa: E402
+from crud.algorithms.competitor_cache import CompetitorCache  # noqa: E402
+from crud.algorithms.consistent_read import read_snapshot  # noqa: E402
+from crud.algorithms.decision_log import DecisionLogWriter, load_decision_inputs, read_decision_log  # noqa: E402
+from crud.algorithms.decision_tree import build_sku_batch  # noqa: E402
+from crud.algorithms.event_loop import run_sync  # noqa: E402
+from crud.algorithms.instrumentation import AlgorithmInstrumentation  # noqa: E402
+from crud.algorithms.marketplace import HttpMarketplaceClient, MarketplaceApplier, load_last_prices  # noqa: E402
+from crud.algorithms.notifications import HttpNotificationTransport, NotificationDispatcher  # noqa: E402
+from crud.algorithms.prefetch import AlgorithmPrefetch  # noqa: E402
+from crud.algorithms.sku_snapshot import load_sku_snapshots  # noqa: E402
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig  # noqa: E402
+from crud.algorithms.sweep import run_sweep, strategy_grid, sweep_summary  # noqa: E402
+from crud.algorithms.timer_slots import allocate_shop_timer_slots  # noqa: E402
+from crud.algorithms.benchmark.synthetic import SyntheticShopConfig, populate  # noqa: E402
+from database.models import Product as ProductDb, Shop  # noqa: E402
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args):
+        self.statements += 1
+
+
+class ModeReport:
+    def __init__(self, name: str, instrumentation: AlgorithmInstrumentation = None):
+        self.name = name
+        self.instrumentation = instrumentation
+        self.latencies: list[float] = []
+        self.total_seconds = 0.0
+        self.statements = 0
+        self.decisions: dict[int, tuple] = {}
+        self.fallback_skus = 0
+        self.notifier: NotificationDispatcher = None
+        self.strategy: StrategyConfig = DEFAULT_STRATEGY
+        self.allocate_timer_slots = False
+        # акции с таймером, выделенные skuid текущего магазина (AlgorithmPrefetch.timer_slots)
+        self.timer_slots = None
+        # (вид, магазин, ответственный, строка) -> сколько раз пришло на endpoint
+        self.notifications: Counter = Counter()
+
+    def row(self) -> str:
+        skus = len(self.decisions)
+        latencies = sorted(self.latencies)
+        if len(latencies) >= 2:
+            p50, p90, p99 = (statistics.quantiles(latencies, n=100, method="inclusive")[i] for i in (49, 89, 98))
+        else:
+            p50 = p90 = p99 = latencies[0] if latencies else 0.0
+        return (f"{self.name:<16}{skus:>8}{p50 * 1e3:>10.3f}{p90 * 1e3:>10.3f}{p99 * 1e3:>10.3f}"
+                f"{skus / self.total_seconds if self.total_seconds else 0:>12.0f}{self.statements:>10}"
+                f"{self.statements / skus if skus else 0:>10.2f}{self.fallback_skus:>10}"
+                f"{sum(decision[0] == 'crash' for decision in self.decisions.values()):>8}")
+
+
+def _decision(result) -> tuple:
+    sku = result.product.sku
+    return sku.price.new, sku.mark, bool(result.error), sku.add_to_timer_discount_for_hours
+
+
+def _products(db: Session, shop_id: int) -> dict[int, list[ProductDb]]:
+    by_product: dict[int, list[ProductDb]] = defaultdict(list)
+    for sku in db.query(ProductDb).filter(ProductDb.shop_id == shop_id).order_by(ProductDb.product_id,
+                                                                                 ProductDb.sku_id):
+        by_product[sku.product_id].append(sku)
+    return by_product
+
+
+async def _run_product_safely(algorithm: AsyncAlgorithm, report: ModeReport, share_elapsed: bool = False):
+    """
+    То же, что run_for_product, но с замером каждого skuid. Решения снимаются после расчета всего продукта
+    (метка 9 меняет цены уже посчитанных skuid). Если алгоритм падает (нет бина выше и т.п.),
+    всем skuid продукта записывается ("crash", тип ошибки) - как и run_for_product, продукт целиком не считается.
+    """
+    algorithm.ran_for_product = True
+    skus = algorithm.sku_list
+    elapsed = []
+    started = time.perf_counter()
+    try:
+        for sku in skus:
+            algorithm.product_db_data_result_list.append(await algorithm.run_for_sku(sku))
+            elapsed.append(time.perf_counter() - started)
+            started = time.perf_counter()
+        decisions = [_decision(result) for result in algorithm.product_db_data_result_list]
+    except Exception as e:
+        elapsed.extend([time.perf_counter() - started] * (len(skus) - len(elapsed)))
+        decisions = [("crash", type(e).__name__)] * len(skus)
+    for sku, decision in zip(skus, decisions):
+        report.decisions[sku.sku_id] = decision
+    if share_elapsed:
+        elapsed = [sum(elapsed) / len(elapsed)] * len(elapsed) if elapsed else []
+    report.latencies.extend(elapsed)
+
+
+async def run_per_sku(shop_id: int, db: Session, report: ModeReport):
+    """Исходная схема: данные skuid загружаются отдельными запросами."""
+    for product_id, skus in _products(db, shop_id).items():
+        await _run_product_safely(AsyncAlgorithm(shop_id, product_id, db, sku_list=skus,
+                                                 instrumentation=report.instrumentation, notifier=report.notifier, strategy=report.strategy),
+                                  report)
+
+
+async def run_per_sku_cached(shop_id: int, db: Session, report: ModeReport):
+    """Как per_sku, но конкуренты магазина заранее загружены в CompetitorCache одним запросом."""
+    # кэш на магазин: run_mode откатывает сессию, а снимки с записанными дельтами пережили бы откат
+    competitor_cache = CompetitorCache()
+    by_product = _products(db, shop_id)
+    competitor_cache.warm_up([sku.sku_id for skus in by_product.values() for sku in skus], db)
+    for product_id, skus in by_product.items():
+        algorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list=skus, instrumentation=report.instrumentation,
+                                   competitor_cache=competitor_cache, notifier=report.notifier, strategy=report.strategy)
+        await _run_product_safely(algorithm, report)
+        algorithm.write_competitor_deltas()
+
+
+async def run_product(shop_id: int, db: Session, report: ModeReport):
+    for product_id, skus in _products(db, shop_id).items():
+        started = time.perf_counter()
+        prefetch = await AlgorithmPrefetch.for_sku_list(skus, db, report.instrumentation)
+        prefetch.timer_slots = report.timer_slots
+        prefetch_elapsed = time.perf_counter() - started
+        await _run_product_safely(AsyncAlgorithm(shop_id, product_id, db, sku_list=skus, prefetch=prefetch,
+                                                 instrumentation=report.instrumentation, notifier=report.notifier, strategy=report.strategy),
+                                  report, share_elapsed=True)
+        report.latencies[-len(skus):] = [latency + prefetch_elapsed / len(skus)
+                                         for latency in report.latencies[-len(skus):]]
+
+
+async def run_two_phase(shop_id: int, db: Session, report: ModeReport):
+    """Продукт целиком: skuid независимо, затем ProductReduce. Падение любого skuid - падение продукта."""
+    for product_id, skus in _products(db, shop_id).items():
+        started = time.perf_counter()
+        prefetch = await AlgorithmPrefetch.for_sku_list(skus, db, report.instrumentation)
+        prefetch.timer_slots = report.timer_slots
+        algorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list=skus, prefetch=prefetch,
+                                   instrumentation=report.instrumentation, two_phase=True,
+                                   notifier=report.notifier, strategy=report.strategy)
+        try:
+            decisions = [_decision(result) for result in await algorithm.run_for_product()]
+        except Exception as e:
+            decisions = [("crash", type(e).__name__)] * len(skus)
+        elapsed = time.perf_counter() - started
+        for sku, decision in zip(skus, decisions):
+            report.decisions[sku.sku_id] = decision
+            report.latencies.append(elapsed / len(skus))
+
+
+async def run_snapshot(shop_id: int, db: Session, report: ModeReport):
+    """
+    Как product, но данные всего магазина читаются одним снимком (read_snapshot) в SkuSnapshotBatch,
+    а расчет идет без сессии на копиях объектов ORM.
+    """
+    if report.instrumentation is not None:
+        # расчет идет без сессии, поэтому запросы снимка замеряются на ней здесь
+        report.instrumentation.attach(db)
+    started = time.perf_counter()
+    with read_snapshot(db):
+        product_ids = [product_id for product_id, in db.query(ProductDb.product_id).filter(
+            ProductDb.shop_id == shop_id).distinct().order_by(ProductDb.product_id)]
+        loaded = await load_sku_snapshots(product_ids, db, report.instrumentation)
+    loaded.prefetch.timer_slots = report.timer_slots
+    sku_list = loaded.skus
+    prefetch_elapsed = time.perf_counter() - started
+    by_product: dict[int, list] = defaultdict(list)
+    for sku in sku_list:
+        by_product[sku.product_id].append(sku)
+    for product_id, skus in by_product.items():
+        await _run_product_safely(AsyncAlgorithm(shop_id, product_id, None, sku_list=skus, prefetch=loaded.prefetch,
+                                                 instrumentation=report.instrumentation, notifier=report.notifier,
+                                                 strategy=report.strategy),
+                                  report, share_elapsed=True)
+    report.latencies[-len(sku_list):] = [latency + prefetch_elapsed / len(sku_list)
+                                         for latency in report.latencies[-len(sku_list):]]
+    # без коммита: run_mode откатывает сессию, чтобы режимы не видели дельты друг друга
+    loaded.write_deltas(db)
+
+
+async def run_vectorized(shop_id: int, db: Session, report: ModeReport):
+    """
+    Повторяет batch.run_products_vectorized, но продукты из fallback считаются через _run_product_safely:
+    на синтетике встречаются skuid, на которых падает и исходный алгоритм.
+    """
+    started = time.perf_counter()
+    by_product = _products(db, shop_id)
+    sku_list = [sku for skus in by_product.values() for sku in skus]
+    prefetch = await AlgorithmPrefetch.for_sku_list(sku_list, db, report.instrumentation)
+    prefetch.timer_slots = report.timer_slots
+    data_list = [await AlgorithmDataForSku.load(sku, db, prefetch) for sku in sku_list]
+    decisions = get_engine(report.strategy).evaluate(build_sku_batch(sku_list, data_list))
+
+    fallback_products = {sku.product_id for sku, fallback in zip(sku_list, decisions.fallback) if fallback}
+    vectorized = 0
+    for i, (sku, data) in enumerate(zip(sku_list, data_list)):
+        if sku.product_id not in fallback_products:
+            decisions.apply(i, sku, data, report.notifier)
+            report.decisions[sku.sku_id] = _decision(data.result)
+            vectorized += 1
+    batch_elapsed = time.perf_counter() - started
+    report.latencies.extend([batch_elapsed / len(sku_list)] * vectorized)
+
+    for product_id in fallback_products:
+        algorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list=by_product[product_id], prefetch=prefetch,
+                                   render_trace=False, instrumentation=report.instrumentation,
+                                   notifier=report.notifier, strategy=report.strategy)
+        await _run_product_safely(algorithm, report, share_elapsed=True)
+    report.fallback_skus += len(sku_list) - vectorized
+
+
+MODES: dict[str, Callable] = {
+    "per_sku": run_per_sku,
+    "per_sku_cached": run_per_sku_cached,
+    "product": run_product,
+    "two_phase": run_two_phase,
+    "snapshot": run_snapshot,
+    "vectorized": run_vectorized,
+}
+
+
+def run_mode(name: str, session_factory, counter: QueryCounter, shop_ids: list[int],
+             instrumentation: AlgorithmInstrumentation = None, notify: bool = False,
+             strategy: StrategyConfig = DEFAULT_STRATEGY, timer_slots: bool = False) -> ModeReport:
+    if notify:
+        # каждый режим шлет уведомления на свой endpoint; первые запросы отклоняются, чтобы сработали повторы
+        with standin.NotificationEndpoint(fail_first=2) as endpoint:
+            with NotificationDispatcher(HttpNotificationTransport(endpoint.url), flush_interval=0.1,
+                                        retry_delay=0.01) as notifier:
+                report = _run_mode(name, session_factory, counter, shop_ids, instrumentation, notifier, strategy,
+                                   timer_slots)
+        for digest in endpoint.received:
+            for line in digest["text"].split("\n"):
+                report.notifications[digest["kind"], digest["shop_id"], digest["recipient"], line] += 1
+        return report
+    return _run_mode(name, session_factory, counter, shop_ids, instrumentation, strategy=strategy,
+                     timer_slots=timer_slots)
+
+
+def _run_mode(name: str, session_factory, counter: QueryCounter, shop_ids: list[int],
+              instrumentation: AlgorithmInstrumentation = None, notifier: NotificationDispatcher = None,
+              strategy: StrategyConfig = DEFAULT_STRATEGY, timer_slots: bool = False) -> ModeReport:
+    report = ModeReport(name, instrumentation)
+    report.notifier = notifier
+    report.strategy = strategy
+    for shop_id in shop_ids:
+        # свежая сессия: алгоритм меняет объекты ORM (метки, last_price, дельту конкурента) без коммита
+        db = session_factory()
+        try:
+            # распределение - шаг перед расчетом магазина, в замеры режима не входит; после него транзакция
+            # откатывается, иначе run_snapshot не сможет открыть снимок
+            report.timer_slots = run_sync(allocate_shop_timer_slots(shop_id, db)) if timer_slots else None
+            db.rollback()
+            statements = counter.statements
+            started = time.perf_counter()
+            run_sync(MODES[name](shop_id, db, report))
+            report.total_seconds += time.perf_counter() - started
+            report.statements += counter.statements - statements
+        finally:
+            if instrumentation is not None:
+                instrumentation.detach()
+            db.rollback()
+            db.close()
+    return report
+
+
+def _product_results(session_factory, shop_ids: list[int],
+                     strategy: StrategyConfig = DEFAULT_STRATEGY) -> tuple[list, dict[int, float]]:
+    """Результаты режима product без упавших продуктов и цены skuid до расчета."""
+    db = session_factory()
+    results = []
+    last_prices: dict[int, float] = {}
+    try:
+        for shop_id in shop_ids:
+            by_product = _products(db, shop_id)
+            sku_list = [sku for skus in by_product.values() for sku in skus]
+            last_prices.update(load_last_prices([sku.sku_id for sku in sku_list], db))
+            prefetch = run_sync(AlgorithmPrefetch.for_sku_list(sku_list, db))
+            for product_id, skus in by_product.items():
+                algorithm = AsyncAlgorithm(shop_id, product_id, db, sku_list=skus, prefetch=prefetch,
+                                           render_trace=False, strategy=strategy)
+                try:
+                    results.extend(run_sync(algorithm.run_for_product()))
+                except Exception:
+                    # такие продукты run_mode уже показал в колонке crash
+                    pass
+    finally:
+        db.rollback()
+        db.close()
+    return results, last_prices
+
+
+def run_apply_check(session_factory, shop_ids: list[int], strategy: StrategyConfig = DEFAULT_STRATEGY) -> int:
+    """
+    Решения режима product применяются MarketplaceApplier на MarketplaceEndpoint, который отклоняет первые
+    запросы и теряет ответы на следующие: каждое действие должно быть применено ровно один раз,
+    а повторный прогон с тем же run_key - не применить ничего нового.
+    """
+    results, last_prices = _product_results(session_factory, shop_ids, strategy)
+    run_key = "benchmark"
+    with standin.MarketplaceEndpoint(fail_first=2, lose_first=2) as endpoint:
+        applier = MarketplaceApplier(HttpMarketplaceClient(endpoint.url), batch_size=50, rate=100.0,
+                                     retry_delay=0.01)
+        started = time.perf_counter()
+        report = run_sync(applier.apply(results, last_prices, run_key))
+        elapsed = time.perf_counter() - started
+        requests = endpoint.requests
+        again = run_sync(applier.apply(results, last_prices, run_key))
+        applied = endpoint.actions()
+    expected = sum(report.actions.values())
+    keys = {action["key"] for action in applied}
+    errors = int(len(applied) != expected or len(keys) != expected or bool(report.failed_batches) or
+                 bool(again.failed_batches) or endpoint.duplicates != again.sent_batches + 2)
+    print(f"\napply: {len(results)} результатов за {elapsed:.2f} с, {report.summary()}\n"
+          f"apply: {requests} запросов, применено действий {len(applied)}, "
+          f"повторный прогон: {again.sent_batches} пачек, все повторы: {endpoint.duplicates - 2 == again.sent_batches}"
+          f"{'' if not errors else ' - РАСХОЖДЕНИЕ'}")
+    return errors
+
+
+def run_decision_log_check(session_factory, shop_ids: list[int], days: int,
+                           strategy: StrategyConfig = DEFAULT_STRATEGY) -> int:
+    """
+    Решения режима product пишутся DecisionLogWriter за days дней подряд; первый день читается обратно
+    и сверяется с результатами, затем все дни агрегируются по метке через read_decision_log.
+    """
+    db = session_factory()
+    try:
+        sku_ids = [sku_id for sku_id, in db.query(ProductDb.sku_id).filter(ProductDb.shop_id.in_(shop_ids))]
+        inputs = load_decision_inputs(sku_ids, db)
+    finally:
+        db.rollback()
+        db.close()
+    results, _ = _product_results(session_factory, shop_ids, strategy)
+    first_day = datetime.datetime(2024, 1, 1, 3)
+
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        for day in range(days):
+            with DecisionLogWriter(root, first_day + datetime.timedelta(days=day), inputs=inputs) as writer:
+                writer.write_all(results)
+        written = time.perf_counter() - started
+
+        log = read_decision_log(root, ["sku_id", "mark", "new_price", "error"], start=first_day.date(),
+                                end=first_day.date())
+        logged = {sku_id: (mark, new_price, error)
+                  for sku_id, mark, new_price, error in zip(log["sku_id"], log["mark"], log["new_price"], log["error"])}
+        expected = {result.product.sku.sku_id: (result.product.sku.mark or "", result.product.sku.price.new,
+                                                bool(result.error)) for result in results}
+        mismatches = [sku_id for sku_id, (mark, new_price, error) in expected.items()
+                      if logged.get(sku_id) is None or logged[sku_id][0] != mark or logged[sku_id][2] != error
+                      or not _same_price(new_price, logged[sku_id][1])]
+
+        started = time.perf_counter()
+        log = read_decision_log(root, ["mark", "old_price", "new_price"])
+        marks, inverse = np.unique(log["mark"], return_inverse=True)
+        with np.errstate(invalid="ignore"):
+            change = log["new_price"] / log["old_price"] - 1
+        changed = ~np.isnan(change)
+        mean_change = np.bincount(inverse[changed], change[changed], len(marks)) / \
+            np.maximum(np.bincount(inverse[changed], minlength=len(marks)), 1)
+        aggregated = time.perf_counter() - started
+
+    top = sorted(zip(np.bincount(inverse, minlength=len(marks)), marks, mean_change), reverse=True)[:3]
+    print(f"\ndecision log: {len(results) * days} строк за {days} дн., запись {written:.2f} с, "
+          f"агрегация по метке {aggregated * 1000:.1f} мс, расхождений первого дня {len(mismatches)}\n"
+          + "".join(f"  метка {mark or '-'}: {count} строк, изменение цены {change * 100:+.2f}%\n"
+                    for count, mark, change in top), end="")
+    return int(bool(mismatches) or len(log["mark"]) != len(results) * days)
+
+
+def _same_price(expected: Optional[float], logged: float) -> bool:
+    return np.isnan(logged) if expected is None else expected == logged
+
+
+def run_backtest_check(session_factory, shop_ids: list[int], days: int, strategy: StrategyConfig = DEFAULT_STRATEGY,
+                       sweep_workers: int = 0) -> int:
+    """
+    Снимок синтетических магазинов через backtest.snapshot_from_data: решения по снимку должны совпасть
+    с build_sku_batch, затем снимок размножается на days дней для замера пропускной способности.
+    sweep_workers - перебор небольшой сетки стратегий по тому же снимку в пуле из стольких процессов.
+    """
+    db = session_factory()
+    try:
+        sku_list = db.query(ProductDb).filter(ProductDb.shop_id.in_(shop_ids)).order_by(ProductDb.sku_id).all()
+        prefetch = run_sync(AlgorithmPrefetch.for_sku_list(sku_list, db))
+        data_list = [run_sync(AlgorithmDataForSku.load(sku, db, prefetch)) for sku in sku_list]
+        engine = get_engine(strategy)
+        expected = engine.evaluate(build_sku_batch(sku_list, data_list))
+        snapshot = backtest.snapshot_from_data(sku_list, data_list)
+        actual = engine.evaluate(backtest.build_snapshot_batch(snapshot)[0])
+    finally:
+        db.rollback()
+        db.close()
+    mismatches = int(np.sum((expected.fallback != actual.fallback) | (expected.mark != actual.mark) |
+                            ~np.isclose(expected.price, actual.price, equal_nan=True)))
+    started = time.perf_counter()
+    report = backtest.run_backtest([backtest.concat_snapshots([snapshot] * days)], engine)
+    elapsed = time.perf_counter() - started
+    print(f"\nbacktest: {report.rows} skuid-дней за {elapsed:.2f} с ({report.rows / elapsed:,.0f} в секунду), "
+          f"{mismatches} расхождений с build_sku_batch\n{report.summary(top=10)}")
+    if sweep_workers:
+        mismatches += run_sweep_check(backtest.concat_snapshots([snapshot] * days), strategy, report, sweep_workers)
+    return int(bool(mismatches))
+
+
+def run_sweep_check(snapshot: backtest.Snapshot, strategy: StrategyConfig, expected: backtest.BacktestReport,
+                    workers: int) -> int:
+    """Перебор сетки вокруг strategy; результат для самой strategy должен совпасть с run_backtest."""
+    strategies = strategy_grid(strategy, position_lead=(6, strategy.position_lead, 10),
+                               last_price_up_fast=(1.015, strategy.last_price_up_fast, 1.03),
+                               competitor_markup=(1.05, strategy.competitor_markup))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot.npz")
+        backtest.save_snapshot(path, snapshot)
+        started = time.perf_counter()
+        results = run_sweep(path, strategies, max_workers=workers)
+        elapsed = time.perf_counter() - started
+    actual = dict(results)[strategy]
+    mismatches = int(actual.to_dict() != expected.to_dict())
+    print(f"\nsweep: {len(results)} стратегий по {expected.rows} skuid-дней за {elapsed:.2f} с "
+          f"({workers} процессов), {mismatches} расхождений с run_backtest\n{sweep_summary(results, top=5)}")
+    return mismatches
+
+
+def _same(left: tuple, right: tuple) -> bool:
+    return all(a == b or (isinstance(a, float) and isinstance(b, float) and abs(a - b) < 1e-9)
+               for a, b in zip(left, right))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shops", type=int, default=1)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--skus-per-product", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--baseline", default="product", choices=list(MODES))
+    parser.add_argument("--instrument", action="store_true",
+                        help="замеры по проверкам, crud и SQL с разбивкой по меткам (замедляет прогон)")
+    parser.add_argument("--query-budget", type=int, default=None, help="допустимое число SQL-запросов на skuid")
+    parser.add_argument("--backtest-days", type=int, default=0,
+                        help="сверить backtest со снимком магазинов и прогнать снимок, размноженный на N дней")
+    parser.add_argument("--notify", action="store_true",
+                        help="отправлять уведомления через NotificationDispatcher на локальный endpoint и сравнивать их")
+    parser.add_argument("--strategy", nargs="+", default=[], metavar="NAME=VALUE",
+                        help="параметры StrategyConfig для всех режимов, например position_lead=6 last_price_up=1.015")
+    parser.add_argument("--timer-slots", action="store_true",
+                        help="распределять акции с таймером магазина до расчета (allocate_shop_timer_slots); "
+                             "режимы per_sku и per_sku_cached грузят данные без AlgorithmPrefetch и пропускаются")
+    parser.add_argument("--apply", action="store_true",
+                        help="применить решения режима product через MarketplaceApplier на локальном endpoint")
+    parser.add_argument("--decision-log", type=int, default=0, metavar="DAYS",
+                        help="записать решения режима product в колоночный журнал за DAYS дней и агрегировать его")
+    parser.add_argument("--sweep-workers", type=int, default=0,
+                        help="вместе с --backtest-days: перебор сетки стратегий в пуле из стольких процессов")
+    args = parser.parse_args(argv)
+    strategy = DEFAULT_STRATEGY.replace(**{name: float(value) if "." in value else int(value)
+                                           for name, value in (item.split("=", 1) for item in args.strategy)})
+
+    session_factory = standin.create_session_factory()
+    counter = QueryCounter(session_factory.kw["bind"])
+    db = session_factory()
+    shop_ids = populate(db, args.shops, SyntheticShopConfig(args.products, args.skus_per_product, args.seed))
+    available_timer_discounts = sum(quantity for quantity, in db.query(Shop.quantity_available_timer_discounts).filter(
+        Shop.id.in_(shop_ids)))
+    db.close()
+    if args.timer_slots:
+        args.modes = [name for name in args.modes if name not in ("per_sku", "per_sku_cached")]
+
+    reports = [run_mode(name, session_factory, counter, shop_ids,
+                        AlgorithmInstrumentation(args.query_budget) if args.instrument else None, args.notify,
+                        strategy, args.timer_slots)
+               for name in args.modes]
+    print(f"{'mode':<16}{'skus':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'sku/s':>12}{'queries':>10}"
+          f"{'q/sku':>10}{'fallback':>10}{'crash':>8}")
+    for report in reports:
+        print(report.row())
+    for report in reports:
+        if report.instrumentation is not None:
+            print(f"\n{report.name}:\n{report.instrumentation.report()}")
+
+    baseline = next((r for r in reports if r.name == args.baseline), None)
+    exit_code = 0
+    if baseline is not None:
+        timer_adds = sum(bool(decision[3]) for decision in baseline.decisions.values() if len(decision) > 3)
+        print(f"акции с таймером: заявок {timer_adds}, свободно у магазинов {available_timer_discounts}")
+        for report in reports:
+            if report is baseline:
+                continue
+            mismatches = [sku_id for sku_id, decision in baseline.decisions.items()
+                          if not _same(decision, report.decisions.get(sku_id, ()))]
+            print(f"{report.name}: {len(mismatches)} расхождений с {baseline.name}")
+            for sku_id in mismatches[:10]:
+                print(f"  {sku_id}: {baseline.decisions[sku_id]} != {report.decisions.get(sku_id)}")
+            exit_code = exit_code or int(bool(mismatches))
+            if args.notify:
+                missing = baseline.notifications - report.notifications
+                extra = report.notifications - baseline.notifications
+                print(f"{report.name}: уведомлений {sum(report.notifications.values())}, "
+                      f"нет {sum(missing.values())}, лишних {sum(extra.values())}")
+                for key in list(missing)[:5] + list(extra)[:5]:
+                    print(f"  {key}: {baseline.notifications[key]} != {report.notifications[key]}")
+                exit_code = exit_code or int(bool(missing or extra))
+    if args.apply:
+        exit_code = run_apply_check(session_factory, shop_ids, strategy) or exit_code
+    if args.decision_log:
+        exit_code = run_decision_log_check(session_factory, shop_ids, args.decision_log, strategy) or exit_code
+    if args.backtest_days:
+        exit_code = run_backtest_check(session_factory, shop_ids, args.backtest_days, strategy,
+                                       args.sweep_workers) or exit_code
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+Подмена database / crud / utils / kazexapi / keadapter на in-memory SQLite для бенчмарков.
+Модели повторяют только те поля, которые читают алгоритмы. install() нужно вызвать до импорта crud.algorithms.
+NotificationEndpoint - локальный HTTP-endpoint для NotificationDispatcher.
+"""
+import datetime
+import json
+import os
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, ForeignKey, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base, relationship, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+Base = declarative_base()
+
+
+class ResponsiblePerson(Base):
+    __tablename__ = "responsible_person"
+    id = Column(Integer, primary_key=True)
+    username = Column(String)
+
+
+class Shop(Base):
+    __tablename__ = "shop"
+    id = Column(Integer, primary_key=True)
+    quantity_available_timer_discounts = Column(Integer, default=0)
+    responsible_person_id = Column(Integer, ForeignKey("responsible_person.id"))
+    responsible_person = relationship(ResponsiblePerson, lazy="joined")
+
+
+class Product(Base):
+    __tablename__ = "product"
+    sku_id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, index=True)
+    shop_id = Column(Integer, ForeignKey("shop.id"), index=True)
+    sku_full_title = Column(String)
+    search_key = Column(String)
+    status_title = Column(String)
+    active = Column(Boolean)
+    stock = Column(Integer)
+    reserved_stock = Column(Integer)
+    last_price = Column(Float)
+    min_price = Column(Float)
+    days_without_sales = Column(Integer)
+    top = Column(Boolean)
+    average_sales_speed = Column(Float)
+    min_sales_speed = Column(Float)
+    search_position = Column(Integer)
+    mark = Column(String, default="")
+    on_calendar_event = Column(Boolean, default=False)
+    on_timer_discount = Column(Boolean, default=False)
+    price_update_datetime = Column(DateTime)
+
+    shop = relationship(Shop)
+    participations_in_calendar_event = relationship("ProductsParticipationInCalendarEvent",
+                                                    order_by="ProductsParticipationInCalendarEvent.priority")
+
+    @property
+    def most_suitable_calendar_event(self) -> Optional["ProductsParticipationInCalendarEvent"]:
+        candidates = [p for p in self.participations_in_calendar_event if not p.is_involved]
+        return candidates[0] if candidates else None
+
+    @property
+    def involved_calendar_event(self) -> Optional["ProductsParticipationInCalendarEvent"]:
+        involved = [p for p in self.participations_in_calendar_event if p.is_involved]
+        return involved[0] if involved else None
+
+
+class ProductsParticipationInCalendarEvent(Base):
+    __tablename__ = "products_participation_in_calendar_event"
+    id = Column(Integer, primary_key=True)
+    sku_id = Column(Integer, ForeignKey("product.sku_id"), index=True)
+    calendar_event_id_in_lk = Column(Integer)
+    priority = Column(Integer)
+    recommended_price = Column(Float)
+    is_involved = Column(Boolean, default=False)
+    search_position = Column(Integer)
+
+
+class Bin(Base):
+    __tablename__ = "bin"
+    id = Column(Integer, primary_key=True)
+    sku_id = Column(Integer, index=True)
+    number = Column(Integer)
+    from_value = Column(Float)
+    to_value = Column(Float)
+    profit = Column(Float)
+    sales_speed = Column(Float)
+
+
+class Competitor(Base):
+    __tablename__ = "competitor"
+    id = Column(Integer, primary_key=True)
+    sku_id = Column(Integer, index=True)
+    price = Column(Float)
+    stock = Column(Integer)
+    average_sales_speed = Column(Float)
+    search_position = Column(Integer)
+    price_change_date = Column(Date)
+    last_delta_between_us_and_cmp = Column(Integer, default=0)
+
+
+class CompetitorSale(Base):
+    __tablename__ = "competitor_sale"
+    id = Column(Integer, primary_key=True)
+
+
+class Delivery(Base):
+    __tablename__ = "delivery"
+    id = Column(Integer, primary_key=True)
+    sku_id = Column(Integer, index=True)
+    date = Column(Date)
+
+
+class TimerDiscount(Base):
+    __tablename__ = "timer_discount"
+    id = Column(Integer, primary_key=True)
+    sku_id = Column(Integer, index=True)
+    discount_id = Column(Integer)
+    date_start = Column(DateTime)
+
+
+class TimerDiscountCondition(Base):
+    __tablename__ = "timer_discount_condition"
+    sku_id = Column(Integer, primary_key=True)
+    max_price = Column(Float)
+
+
+# ---------------------------------------------------------------- не-ORM модели результата
+
+class Price:
+    def __init__(self):
+        self.new = None
+        self.for_calendar_event = None
+
+
+class Sku:
+    def __init__(self, product_db: Product):
+        self.sku_id = product_db.sku_id
+        self.mark = product_db.mark
+        self.price = Price()
+        self.add_to_timer_discount_for_hours = None
+        self.remove_from_timer_discount_id = None
+
+
+class ShopProductProduct:
+    def __init__(self, product_db: Product):
+        self.product_id = product_db.product_id
+        self.sku = Sku(product_db)
+        self.add_calendar_event_id_in_lk = None
+        self.remove_calendar_event_id_in_lk = None
+
+
+class ShopProduct:
+    def __init__(self, product_db: Product, shop: Shop):
+        self.shop = shop.id
+        self.product = ShopProductProduct(product_db)
+
+
+class CalculationResult:
+    def __init__(self, shop, product, error: bool = False, path: str = "", text: str = "", error_text: str = None):
+        self.shop = shop
+        self.product = product
+        self.error = error
+        self.path = path
+        self.text = text
+        self.error_text = error_text
+
+
+class CheckResult:
+    def __init__(self, result: bool, path: str = None, text: str = None, full_text: str = None):
+        self.result = result
+        self.path = path
+        self.text = text
+        self.full_text = full_text
+
+
+# ---------------------------------------------------------------- crud
+
+async def get_competitors_db(sku_id: int, db: Session) -> list[Competitor]:
+    return db.query(Competitor).filter(Competitor.sku_id == sku_id).order_by(Competitor.price).all()
+
+
+async def get_nearest_delivery(sku_id: int, db: Session) -> Optional[Delivery]:
+    return db.query(Delivery).filter(Delivery.sku_id == sku_id, Delivery.date >= datetime.date.today()).order_by(
+        Delivery.date).first()
+
+
+async def get_timer_discount_db(sku_id: int, db: Session) -> Optional[TimerDiscount]:
+    return db.query(TimerDiscount).filter(TimerDiscount.sku_id == sku_id).order_by(
+        TimerDiscount.date_start.desc()).first()
+
+
+async def get_product_timer_discount_conditions_db(sku_ids: list[int], db: Session) -> list:
+    conditions = {c.sku_id: c for c in db.query(TimerDiscountCondition).filter(
+        TimerDiscountCondition.sku_id.in_(sku_ids))}
+    return [conditions.get(sku_id) for sku_id in sku_ids]
+
+
+async def get_shop_db(shop_id: int, db: Session) -> Optional[Shop]:
+    return db.query(Shop).get(shop_id)
+
+
+def convert_product_db(products: list[Product], shop: Shop, db: Session) -> list[ShopProduct]:
+    return [ShopProduct(product_db, shop) for product_db in products]
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = sys.modules.get(name) or types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    """Регистрирует подменные модули; crud.algorithms указывает на каталог с алгоритмами."""
+    algorithms_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    models = dict(Base=Base, ResponsiblePerson=ResponsiblePerson, Shop=Shop, Product=Product,
+                  ProductsParticipationInCalendarEvent=ProductsParticipationInCalendarEvent, Bin=Bin,
+                  Competitor=Competitor, CompetitorSale=CompetitorSale, Delivery=Delivery,
+                  TimerDiscount=TimerDiscount, TimerDiscountCondition=TimerDiscountCondition,
+                  ShopProduct=ShopProduct, CalculationResult=CalculationResult)
+    database = _module("database", **models)
+    database.models = _module("database.models", **models)
+    database.__path__ = []
+
+    crud = _module("crud", get_competitors_db=get_competitors_db, get_nearest_delivery=get_nearest_delivery,
+                   get_shop_db=get_shop_db, convert_product_db=convert_product_db)
+    crud.__path__ = []
+    crud.timer_discount = _module("crud.timer_discount", get_timer_discount_db=get_timer_discount_db,
+                                  get_product_timer_discount_conditions_db=get_product_timer_discount_conditions_db)
+    crud.algorithms = _module("crud.algorithms")
+    crud.algorithms.__path__ = [algorithms_dir]
+    crud.algorithms.models = _module("crud.algorithms.models", CheckResult=CheckResult)
+
+    utils = _module("utils")
+    utils.__path__ = []
+    utils.dt = _module("utils.dt", now=datetime.datetime.now, with_tz=lambda value: value)
+    _module("keadapter")
+    for name in ("kazexapi", "kazexapi.request", "kazexapi.request.discount"):
+        _module(name).__path__ = []
+    _module("kazexapi.request.discount.models", Conditions=type("Conditions", (), {}))
+
+
+def create_session_factory(url: str = "sqlite://") -> sessionmaker:
+    engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+class NotificationEndpoint:
+    """
+    HTTP-сервер на 127.0.0.1, принимающий дайджесты HttpNotificationTransport в received.
+    Первые fail_first запросов получают 503, чтобы проверить повторы.
+    """
+
+    def __init__(self, fail_first: int = 0):
+        self.fail_first = fail_first
+        self.requests = 0
+        self.received: list[dict] = []
+        self.lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with endpoint.lock:
+                    endpoint.requests += 1
+                    failed = endpoint.requests <= endpoint.fail_first
+                    if not failed:
+                        endpoint.received.append(json.loads(body))
+                self.send_response(503 if failed else 204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/notifications"
+
+    def __enter__(self) -> "NotificationEndpoint":
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MarketplaceEndpoint:
+    """
+    HTTP-сервер на 127.0.0.1 вместо API маркетплейса для HttpMarketplaceClient: пачки с уже виденным
+    Idempotency-Key повторно не применяются (duplicates). Первые fail_first запросов получают 503 до применения,
+    следующие lose_first - 503 после применения, как при потерянном ответе.
+    """
+
+    def __init__(self, fail_first: int = 0, lose_first: int = 0):
+        self.fail_first = fail_first
+        self.lose_first = lose_first
+        self.requests = 0
+        self.duplicates = 0
+        self.applied: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                key = self.headers["Idempotency-Key"]
+                with endpoint.lock:
+                    endpoint.requests += 1
+                    status = 200
+                    if endpoint.requests <= endpoint.fail_first:
+                        status = 503
+                    elif key in endpoint.applied:
+                        endpoint.duplicates += 1
+                    else:
+                        endpoint.applied[key] = body
+                        if endpoint.requests <= endpoint.fail_first + endpoint.lose_first:
+                            status = 503
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/apply"
+
+    def actions(self) -> list[dict]:
+        return [dict(action, kind=batch["kind"]) for batch in self.applied.values() for action in batch["actions"]]
+
+    def __enter__(self) -> "MarketplaceEndpoint":
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,138 @@
+"""
+Генератор синтетических магазинов: продукты, skuid, бины, конкуренты, поставки, акции с таймером
+и участие в календарных акциях с распределениями, при которых срабатывают все основные ветки дерева.
+"""
+import datetime
+import random
+
+from sqlalchemy.orm import Session
+
+from database.models import Bin, Competitor, Delivery, Product, ProductsParticipationInCalendarEvent, \
+    ResponsiblePerson, Shop, TimerDiscount, TimerDiscountCondition
+
+BINS_QUANTITY = 20
+
+
+class SyntheticShopConfig:
+    def __init__(self, products: int = 200, skus_per_product: int = 3, seed: int = 42):
+        self.products = products
+        self.skus_per_product = skus_per_product
+        self.seed = seed
+
+        # доли, определяющие распределение по веткам
+        self.blocked = 0.02
+        self.not_on_sale = 0.05
+        self.inactive = 0.05
+        self.empty_stock = 0.10
+        self.empty_reserved_stock = 0.5
+        self.at_min_price = 0.15
+        self.days_without_sales = ((0, 0.6), (2, 0.25), (5, 0.15))
+        self.top = 0.2
+        self.no_search_position = 0.2
+        self.with_competitors = 0.7
+        self.competitor_without_stock = 0.1
+        self.with_delivery = 0.4
+        self.delivery_today = 0.02
+        self.on_timer_discount = 0.1
+        self.calendar_event_candidate = 0.15
+        self.on_calendar_event = 0.05
+
+
+def _choice(rnd: random.Random, weighted: tuple) -> int:
+    value = rnd.random()
+    for item, share in weighted:
+        if value < share:
+            return item
+        value -= share
+    return weighted[-1][0]
+
+
+def populate_shop(db: Session, shop_id: int, config: SyntheticShopConfig) -> list[int]:
+    """Создает магазин и возвращает sku_id его skuid."""
+    rnd = random.Random(config.seed + shop_id)
+    today = datetime.date.today()
+
+    person = ResponsiblePerson(id=shop_id, username=f"manager_{shop_id}")
+    db.add_all([person, Shop(id=shop_id, quantity_available_timer_discounts=rnd.randint(0, 50),
+                             responsible_person_id=person.id)])
+
+    sku_ids = []
+    rows = []
+    for product_index in range(config.products):
+        product_id = shop_id * 1_000_000 + product_index
+        for sku_index in range(config.skus_per_product):
+            sku_id = product_id * 100 + sku_index
+            sku_ids.append(sku_id)
+
+            min_price = float(rnd.randint(100, 5000))
+            step = max(round(min_price * 0.03), 1)
+            bins = [Bin(sku_id=sku_id, number=number, from_value=min_price + (number - 1) * step,
+                        to_value=min_price + number * step - 1,
+                        profit=(number - 1) * step * max(0.0, 1 - 0.04 * number) + rnd.random(),
+                        sales_speed=round(max(0.1, 30 - number * 1.4 + rnd.uniform(-1, 1)), 2))
+                    for number in range(1, BINS_QUANTITY + 1)]
+            rows.extend(bins)
+            current_bin = bins[rnd.randint(0, BINS_QUANTITY - 1)]
+            last_price = min_price if rnd.random() < config.at_min_price else \
+                float(rnd.randint(int(current_bin.from_value), int(current_bin.to_value)))
+
+            status_roll = rnd.random()
+            status = "Заблокирован" if status_roll < config.blocked else \
+                "Снят с продажи" if status_roll < config.blocked + config.not_on_sale else "В продаже"
+            stock = 0 if rnd.random() < config.empty_stock else rnd.randint(1, 500)
+            min_sales_speed = round(rnd.uniform(0.5, 5), 2)
+            # None вместо позиции алгоритм сравнивает с позицией конкурента и падает, поэтому "не найден" это -1
+            search_position = -1 if rnd.random() < config.no_search_position else rnd.randint(1, 100)
+
+            on_timer_discount = rnd.random() < config.on_timer_discount
+            on_calendar_event = rnd.random() < config.on_calendar_event
+            rows.append(Product(
+                sku_id=sku_id, product_id=product_id, shop_id=shop_id,
+                sku_full_title=f"Товар {product_id} / {sku_index}", search_key="ключевик",
+                status_title=status, active=rnd.random() >= config.inactive,
+                stock=stock, reserved_stock=0 if rnd.random() < config.empty_reserved_stock else rnd.randint(1, 100),
+                last_price=last_price, min_price=min_price,
+                days_without_sales=_choice(rnd, config.days_without_sales),
+                top=rnd.random() < config.top,
+                average_sales_speed=round(min_sales_speed * rnd.uniform(0.3, 2.5), 2), min_sales_speed=min_sales_speed,
+                search_position=search_position, mark="",
+                on_calendar_event=on_calendar_event, on_timer_discount=on_timer_discount,
+            ))
+
+            if rnd.random() < config.with_competitors:
+                for _ in range(rnd.randint(1, 3)):
+                    rows.append(Competitor(
+                        sku_id=sku_id, price=float(round(last_price * rnd.uniform(0.8, 1.2))),
+                        stock=0 if rnd.random() < config.competitor_without_stock else rnd.randint(1, 300),
+                        average_sales_speed=round(rnd.uniform(0.1, 10), 2),
+                        search_position=rnd.randint(1, 100),
+                        price_change_date=today - datetime.timedelta(days=rnd.randint(0, 10)),
+                        last_delta_between_us_and_cmp=rnd.randint(-5, 5)))
+            if rnd.random() < config.with_delivery:
+                days = 0 if rnd.random() < config.delivery_today else rnd.randint(1, 30)
+                rows.append(Delivery(sku_id=sku_id, date=today + datetime.timedelta(days=days)))
+            if on_timer_discount:
+                rows.append(TimerDiscount(sku_id=sku_id, discount_id=rnd.randint(1, 10_000),
+                                          date_start=datetime.datetime.now() - datetime.timedelta(
+                                              hours=rnd.randint(1, 47))))
+            # без условия акции с таймером алгоритм падает, поэтому оно есть у каждого skuid
+            rows.append(TimerDiscountCondition(sku_id=sku_id, max_price=float(
+                round(last_price * rnd.uniform(0.85, 1.1)))))
+            if on_calendar_event:
+                rows.append(ProductsParticipationInCalendarEvent(
+                    sku_id=sku_id, calendar_event_id_in_lk=rnd.randint(1, 100), priority=0, is_involved=True,
+                    recommended_price=float(round(last_price * 0.9)), search_position=rnd.randint(1, 300)))
+            if rnd.random() < config.calendar_event_candidate:
+                rows.append(ProductsParticipationInCalendarEvent(
+                    sku_id=sku_id, calendar_event_id_in_lk=rnd.randint(1, 100), priority=rnd.randint(1, 5),
+                    is_involved=False, recommended_price=float(round(last_price * rnd.uniform(0.8, 1.0)))))
+    db.add_all(rows)
+    db.commit()
+    return sku_ids
+
+
+def populate(db: Session, shops: int, config: SyntheticShopConfig) -> list[int]:
+    shop_ids = list(range(1, shops + 1))
+    for shop_id in shop_ids:
+        populate_shop(db, shop_id, config)
+    return shop_ids
@@ -0,0 +1,83 @@
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database import Bin
+
+
+class BinLadder:
+    """
+    Лестница бинов одного skuid (~BINS_QUANTYITY строк), отсортированная по номеру снизу вверх.
+    Заменяет запросы crud.bin: текущий, соседние, по номеру, по цене конкурента, с максимальной прибылью.
+    """
+    __slots__ = ("bins", "numbers", "from_values", "to_values", "sales_speeds", "max_profit_index")
+
+    def __init__(self, bins: list[Bin]):
+        self.bins: list[Bin] = sorted(bins, key=lambda b: b.number)
+        self.numbers: list[int] = [b.number for b in self.bins]
+        self.from_values: list[float] = [b.from_value for b in self.bins]
+        self.to_values: list[float] = [b.to_value for b in self.bins]
+        self.sales_speeds: list[Optional[float]] = [b.sales_speed for b in self.bins]
+        self.max_profit_index: Optional[int] = max(range(len(self.bins)), key=lambda i: self.bins[i].profit) \
+            if self.bins else None
+
+    @classmethod
+    def load(cls, sku_id: int, db: Session) -> "BinLadder":
+        return cls(db.query(Bin).filter(Bin.sku_id == sku_id).all())
+
+    def __len__(self):
+        return len(self.bins)
+
+    def _get(self, index: int) -> Optional[Bin]:
+        return self.bins[index] if 0 <= index < len(self.bins) else None
+
+    def current_index(self, price: float) -> Optional[int]:
+        index = bisect_right(self.from_values, price) - 1
+        if index >= 0 and price <= self.to_values[index]:
+            return index
+        return None
+
+    def current(self, price: float) -> Optional[Bin]:
+        index = self.current_index(price)
+        return None if index is None else self.bins[index]
+
+    def by_number(self, number: int) -> Optional[Bin]:
+        index = bisect_left(self.numbers, number)
+        if index < len(self.numbers) and self.numbers[index] == number:
+            return self.bins[index]
+        return None
+
+    def max_profit(self) -> Optional[Bin]:
+        return None if self.max_profit_index is None else self.bins[self.max_profit_index]
+
+    def lower(self, price: float, min_price: float = None) -> Optional[Bin]:
+        index = self.current_index(price)
+        new_bin = None if index is None else self._get(index - 1)
+        return self._above_min_price(new_bin, min_price)
+
+    def upper(self, price: float) -> Optional[Bin]:
+        index = self.current_index(price)
+        return None if index is None else self._get(index + 1)
+
+    def lower_by_competitor(self, competitor_price: float, min_price: float = None) -> Optional[Bin]:
+        # ближайший бин, целиком лежащий ниже цены конкурента
+        new_bin = self._get(bisect_left(self.to_values, competitor_price) - 1)
+        return self._above_min_price(new_bin, min_price)
+
+    def upper_by_competitor(self, competitor_price: float) -> Optional[Bin]:
+        # ближайший бин, целиком лежащий выше цены конкурента
+        return self._get(bisect_right(self.from_values, competitor_price))
+
+    def optimal(self, sales_quantity_per_day: float) -> Optional[Bin]:
+        # бин с ожидаемой скоростью продаж, ближайшей к нужной; бины без скорости не участвуют
+        candidates = [b for b in self.bins if b.sales_speed is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: abs(b.sales_speed - sales_quantity_per_day))
+
+    @staticmethod
+    def _above_min_price(new_bin: Optional[Bin], min_price: Optional[float]) -> Optional[Bin]:
+        if new_bin is not None and min_price is not None and new_bin.to_value <= min_price:
+            return None
+        return new_bin
@@ -0,0 +1,58 @@
+"""
+Участия skuid в календарных акциях, разобранные один раз на запуск: ветки календарных акций Algorithm,
+SalesAccelerationAlgorithm и колонки DecisionEngine читают готовые поля вместо свойств модели
+(most_suitable_calendar_event, involved_calendar_event), которые каждый раз перебирают
+participations_in_calendar_event.
+"""
+from typing import Iterable, Optional
+
+from database.models import Product as ProductDb
+
+
+class CalendarEventEntry:
+    __slots__ = ("involved", "involved_search_position", "most_suitable", "recommended_price")
+
+    def __init__(self, involved, involved_search_position: Optional[int], most_suitable,
+                 recommended_price: Optional[float]):
+        # акция, в которой skuid участвует (из нее продукт вынимается при повторной вставке)
+        self.involved = involved
+        # позиция в выдаче акции - первого участия с is_involved is True, как в проверке топ-100
+        self.involved_search_position = involved_search_position
+        # акция, в которую skuid можно добавить, и ее рекомендованная цена
+        self.most_suitable = most_suitable
+        self.recommended_price = recommended_price
+
+    @classmethod
+    def of(cls, product_db: ProductDb) -> "CalendarEventEntry":
+        involved = [p for p in product_db.participations_in_calendar_event if p.is_involved is True]
+        most_suitable = product_db.most_suitable_calendar_event
+        return cls(product_db.involved_calendar_event, involved[0].search_position if involved else None,
+                   most_suitable, most_suitable.recommended_price if most_suitable else None)
+
+    @property
+    def in_top100(self) -> bool:
+        position = self.involved_search_position
+        return bool(position and position <= 100)
+
+
+class CalendarEventIndex:
+    """sku_id -> CalendarEventEntry для skuid запуска."""
+    __slots__ = ("entries",)
+
+    def __init__(self, entries: dict[int, CalendarEventEntry] = None):
+        self.entries = entries or {}
+
+    @classmethod
+    def build(cls, sku_list: Iterable[ProductDb]) -> "CalendarEventIndex":
+        """Участия должны быть уже загружены (load_skus, SkuSnapshot), иначе каждый skuid - отдельный запрос."""
+        return cls({sku.sku_id: CalendarEventEntry.of(sku) for sku in sku_list})
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, product_db: ProductDb) -> CalendarEventEntry:
+        entry = self.entries.get(product_db.sku_id)
+        if entry is None:
+            # skuid не из этого запуска: разбирается на месте и запоминается
+            entry = self.entries[product_db.sku_id] = CalendarEventEntry.of(product_db)
+        return entry
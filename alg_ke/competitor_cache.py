@@ -0,0 +1,193 @@
+import datetime
+import time
+import weakref
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Iterable, Optional
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+
+from crud.algorithms.crud_batch import competitors_query
+from database.models import Competitor
+
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_SKUS = 200_000
+IN_CLAUSE_CHUNK_SIZE = 5000
+
+
+def competitor_identity(competitor: Competitor) -> Hashable:
+    return competitor.id
+
+
+_competitors = Competitor.__table__
+_ADD_DELTA = update(_competitors).where(_competitors.c.id == bindparam("competitor_id")).values(
+    last_delta_between_us_and_cmp=func.coalesce(_competitors.c.last_delta_between_us_and_cmp, 0) + bindparam("change"))
+
+
+def write_competitor_deltas(db: Session, dirty: set["CompetitorSnapshot"]) -> int:
+    """
+    Пишет изменения дельт с конкурентом одним executemany в транзакцию сессии. Пишется приращение
+    к значению в БД, а не значение снимка: снимок мог быть загружен до того, как другой воркер или запуск
+    записал свое изменение, и абсолютное значение затерло бы его.
+    """
+    changes = []
+    for snapshot in dirty:
+        change = snapshot.pending_change()
+        if change:
+            changes.append({"competitor_id": snapshot.id, "change": change})
+        snapshot.mark_written()
+    dirty.clear()
+    if changes:
+        db.connection().execute(_ADD_DELTA, changes)
+    return len(changes)
+
+
+class CompetitorSnapshot:
+    """
+    Копия полей Competitor, которые читает алгоритм. Не привязана к сессии, поэтому живет дольше чанка и магазина.
+    Дельта с конкурентом - единственное поле, которое алгоритм меняет: изменение запоминается в кэше
+    и пишется в БД CompetitorCache.write_deltas приращением к загруженному значению (_loaded_delta).
+    """
+    __slots__ = ("id", "sku_id", "price", "stock", "average_sales_speed", "search_position", "price_change_date",
+                 "_last_delta_between_us_and_cmp", "_loaded_delta", "_dirty", "__weakref__")
+
+    def __init__(self, competitor: Competitor, dirty: set):
+        self._dirty = dirty
+        self.refresh(competitor)
+
+    def refresh(self, competitor: Competitor):
+        self.id: int = competitor.id
+        self.sku_id: int = competitor.sku_id
+        self.price: float = competitor.price
+        self.stock: int = competitor.stock
+        self.average_sales_speed: float = competitor.average_sales_speed
+        self.search_position: int = competitor.search_position
+        self.price_change_date: datetime.date = competitor.price_change_date
+        # незаписанная дельта новее, чем в БД
+        if self not in self._dirty:
+            self._last_delta_between_us_and_cmp: int = competitor.last_delta_between_us_and_cmp
+            self._loaded_delta: int = competitor.last_delta_between_us_and_cmp
+
+    def pending_change(self) -> int:
+        return (self._last_delta_between_us_and_cmp or 0) - (self._loaded_delta or 0)
+
+    def mark_written(self):
+        self._loaded_delta = self._last_delta_between_us_and_cmp
+
+    def discard(self):
+        """Забывает незаписанное изменение дельты (расчет продукта упал)."""
+        self._last_delta_between_us_and_cmp = self._loaded_delta
+        self._dirty.discard(self)
+
+    @property
+    def last_delta_between_us_and_cmp(self) -> int:
+        return self._last_delta_between_us_and_cmp
+
+    @last_delta_between_us_and_cmp.setter
+    def last_delta_between_us_and_cmp(self, value: int):
+        self._last_delta_between_us_and_cmp = value
+        self._dirty.add(self)
+
+
+class CompetitorCache:
+    """
+    Общий для процесса кэш конкурентов: снимки по идентичности конкурента (competitor_identity)
+    и списки конкурентов skuid (лучший первым, как в get_competitors_db) с TTL и LRU-вытеснением по числу skuid.
+    Один конкурент, загруженный для нескольких skuid или повторно после истечения TTL, остается одним
+    объектом: перезагрузка обновляет его на месте. Снимок живет, пока на него ссылается хоть один skuid.
+    write_deltas сбрасывает skuid с записанными дельтами: следующий расчет перечитает их из БД, так что в кэше
+    не остается ни значения, затертого другим воркером, ни приращения из откаченной транзакции.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS, max_skus: int = DEFAULT_MAX_SKUS,
+                 identity: Callable[[Competitor], Hashable] = competitor_identity,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_skus = max_skus
+        self.identity = identity
+        self.clock = clock
+        self.skus: OrderedDict[int, tuple[float, list[CompetitorSnapshot]]] = OrderedDict()
+        self.snapshots: weakref.WeakValueDictionary[Hashable, CompetitorSnapshot] = weakref.WeakValueDictionary()
+        self.dirty: set[CompetitorSnapshot] = set()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, sku_id: int) -> Optional[list[CompetitorSnapshot]]:
+        entry = self.skus.get(sku_id)
+        if entry is None or entry[0] <= self.clock():
+            self.misses += 1
+            return None
+        self.skus.move_to_end(sku_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, sku_id: int, competitors: Iterable[Competitor]) -> list[CompetitorSnapshot]:
+        snapshots = []
+        for competitor in competitors:
+            key = self.identity(competitor)
+            snapshot = self.snapshots.get(key)
+            if snapshot is None:
+                snapshot = self.snapshots[key] = CompetitorSnapshot(competitor, self.dirty)
+            else:
+                snapshot.refresh(competitor)
+            snapshots.append(snapshot)
+        self.skus[sku_id] = self.clock() + self.ttl, snapshots
+        self.skus.move_to_end(sku_id)
+        while len(self.skus) > self.max_skus:
+            self.skus.popitem(last=False)
+            self.evictions += 1
+        return snapshots
+
+    async def aget(self, sku_id: int, loader: Callable[[], Awaitable[list[Competitor]]]) -> list[CompetitorSnapshot]:
+        snapshots = self.get(sku_id)
+        if snapshots is None:
+            snapshots = self.put(sku_id, await loader())
+        return snapshots
+
+    def warm_up(self, sku_ids: list[int], db: Session) -> dict[int, list[CompetitorSnapshot]]:
+        """Конкуренты всех sku_ids: из кэша, а отсутствующие и устаревшие - одним запросом на чанк."""
+        result: dict[int, list[CompetitorSnapshot]] = {}
+        missing: list[int] = []
+        for sku_id in sku_ids:
+            snapshots = self.get(sku_id)
+            if snapshots is None:
+                missing.append(sku_id)
+            else:
+                result[sku_id] = snapshots
+
+        for i in range(0, len(missing), IN_CLAUSE_CHUNK_SIZE):
+            chunk = missing[i:i + IN_CLAUSE_CHUNK_SIZE]
+            loaded: dict[int, list[Competitor]] = {sku_id: [] for sku_id in chunk}
+            for competitor in competitors_query(chunk, db):
+                loaded[competitor.sku_id].append(competitor)
+            for sku_id, competitors in loaded.items():
+                result[sku_id] = self.put(sku_id, competitors)
+        return result
+
+    def invalidate(self, sku_ids: Iterable[int] = None):
+        if sku_ids is None:
+            self.skus.clear()
+            return
+        for sku_id in sku_ids:
+            self.skus.pop(sku_id, None)
+
+    def write_deltas(self, db: Session) -> int:
+        sku_ids = {snapshot.sku_id for snapshot in self.dirty}
+        written = write_competitor_deltas(db, self.dirty)
+        self.invalidate(sku_ids)
+        return written
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "skus": len(self.skus)}
+
+
+_cache: Optional[CompetitorCache] = None
+
+
+def get_competitor_cache(ttl: float = DEFAULT_TTL_SECONDS, max_skus: int = DEFAULT_MAX_SKUS) -> CompetitorCache:
+    """Кэш процесса; ttl и max_skus применяются только при первом вызове."""
+    global _cache
+    if _cache is None:
+        _cache = CompetitorCache(ttl, max_skus)
+    return _cache
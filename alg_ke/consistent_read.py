@@ -0,0 +1,46 @@
+import contextlib
+import multiprocessing
+from typing import Iterator, Optional
+
+from sqlalchemy.engine import Dialect
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from database.models import Shop, Product as ProductDb
+
+
+def snapshot_execution_options(dialect: Dialect) -> dict:
+    """Опции соединения для чтения одним снимком: все запросы транзакции видят одно состояние БД."""
+    if dialect.name == "postgresql":
+        return {"isolation_level": "REPEATABLE READ", "postgresql_readonly": True}
+    if dialect.name in ("mysql", "mariadb"):
+        return {"isolation_level": "REPEATABLE READ"}
+    # SQLite: транзакция и так видит один снимок, REPEATABLE READ диалект не поддерживает
+    return {"isolation_level": "SERIALIZABLE"}
+
+
+@contextlib.contextmanager
+def read_snapshot(db: Session, read_slots: Optional[multiprocessing.Semaphore] = None) -> Iterator[Session]:
+    """
+    Все чтения внутри блока - одна read-only транзакция с согласованным снимком. На выходе транзакция
+    откатывается, соединение возвращается в пул, а загруженные объекты отсоединяются от сессии:
+    их загруженные атрибуты остаются доступны, а ленивая загрузка после блока - ошибка (DetachedInstanceError),
+    поэтому все, что понадобится расчету, нужно загрузить внутри.
+    read_slots ограничивает число одновременных снимков воркеров, то есть занятых ими соединений.
+    """
+    if db.in_transaction():
+        raise RuntimeError("read_snapshot должен открывать транзакцию сессии, а она уже начата")
+    with read_slots if read_slots is not None else contextlib.nullcontext():
+        db.connection(execution_options=snapshot_execution_options(db.get_bind().dialect))
+        try:
+            yield db
+        finally:
+            db.expunge_all()
+            db.rollback()
+
+
+def load_skus(product_ids: list[int], db: Session) -> list[ProductDb]:
+    """skuid продуктов вместе со связями, которые читает расчет: магазин, ответственный и участия в акциях."""
+    return db.query(ProductDb).filter(ProductDb.product_id.in_(product_ids)).options(
+        joinedload(ProductDb.shop).joinedload(Shop.responsible_person),
+        selectinload(ProductDb.participations_in_calendar_event),
+    ).order_by(ProductDb.product_id, ProductDb.sku_id).all()
@@ -0,0 +1,101 @@
+"""
+Пакетные версии запросов crud для набора sku_id.
+
+Порядок и фильтры crud-функций на один skuid собраны здесь, в одном месте: prefetch, competitor_cache и
+timer_slots берут их отсюда, а не повторяют каждый у себя. Запросы повторяют crud, а не вызывают его, и держатся
+на допущениях о нем:
+- get_competitors_db отдает конкурентов по возрастанию цены, лучший (первый) - самый дешевый;
+- get_nearest_delivery - первая по дате поставка не раньше сегодняшнего дня;
+- get_timer_discount_db - акция с самой поздней date_start;
+- get_product_timer_discount_conditions_db отдает по условию (или None) на каждый sku_id в порядке запроса.
+check_against_crud сверяет пакетные запросы с crud-функциями на одни и те же skuid: при изменении crud
+или на реальной БД его отчет должен быть пустым.
+"""
+import datetime
+from collections import defaultdict
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from crud import get_competitors_db, get_nearest_delivery
+from crud.timer_discount import get_product_timer_discount_conditions_db, get_timer_discount_db
+from database import TimerDiscount
+from database.models import Competitor, Delivery
+
+
+def competitors_query(sku_ids: list[int], db: Session) -> Iterator[Competitor]:
+    """Конкуренты skuid по порядку get_competitors_db: у каждого skuid первым идет лучший (самый дешевый)."""
+    return db.query(Competitor).filter(Competitor.sku_id.in_(sku_ids)).order_by(Competitor.sku_id, Competitor.price)
+
+
+def nearest_deliveries(sku_ids: list[int], db: Session) -> dict[int, Delivery]:
+    """sku_id -> get_nearest_delivery: ближайшая поставка не раньше сегодняшнего дня."""
+    result: dict[int, Delivery] = {}
+    for delivery in db.query(Delivery).filter(Delivery.sku_id.in_(sku_ids),
+                                              Delivery.date >= datetime.date.today()).order_by(
+            Delivery.sku_id, Delivery.date):
+        result.setdefault(delivery.sku_id, delivery)
+    return result
+
+
+def last_timer_discounts(sku_ids: list[int], db: Session) -> dict[int, TimerDiscount]:
+    """sku_id -> get_timer_discount_db: акция с таймером с самой поздней датой начала."""
+    result: dict[int, TimerDiscount] = {}
+    for timer_discount in db.query(TimerDiscount).filter(TimerDiscount.sku_id.in_(sku_ids)).order_by(
+            TimerDiscount.sku_id, TimerDiscount.date_start.desc()):
+        result.setdefault(timer_discount.sku_id, timer_discount)
+    return result
+
+
+def _aligned(sku_ids: list[int], conditions: list) -> bool:
+    # у Conditions может не быть sku_id; если он есть, условие должно относиться к skuid на своей позиции
+    return len(conditions) == len(sku_ids) and all(
+        getattr(condition, "sku_id", None) in (None, sku_id) for sku_id, condition in zip(sku_ids, conditions))
+
+
+async def timer_discount_conditions(sku_ids: list[int], db: Session) -> dict[int, object]:
+    """
+    sku_id -> условие акции с таймером из get_product_timer_discount_conditions_db, без skuid без условия.
+    Ключ - запрошенный sku_id, а не поле условия. Пакетный ответ принимается, только если в нем по записи
+    на каждый skuid (_aligned); иначе условия загружаются по одному skuid, как в AlgorithmDataForSku.load_from_db:
+    [sku_id] -> [условие] - единственный контракт crud, на который опирается расчет.
+    """
+    conditions = await get_product_timer_discount_conditions_db(sku_ids, db)
+    if not _aligned(sku_ids, conditions):
+        conditions = [((await get_product_timer_discount_conditions_db([sku_id], db)) or [None])[0]
+                      for sku_id in sku_ids]
+    return {sku_id: condition for sku_id, condition in zip(sku_ids, conditions) if condition is not None}
+
+
+def _id(value) -> Optional[int]:
+    return None if value is None else value.id
+
+
+def _max_price(condition) -> Optional[float]:
+    return None if condition is None else condition.max_price
+
+
+async def check_against_crud(sku_ids: Iterable[int], db: Session) -> list[str]:
+    """Расхождения пакетных запросов с crud-функциями на один skuid для sku_ids; пустой список - расхождений нет."""
+    sku_ids = list(sku_ids)
+    competitors: dict[int, list[int]] = defaultdict(list)
+    for competitor in competitors_query(sku_ids, db):
+        competitors[competitor.sku_id].append(competitor.id)
+    deliveries = nearest_deliveries(sku_ids, db)
+    timer_discounts = last_timer_discounts(sku_ids, db)
+    conditions = await timer_discount_conditions(sku_ids, db)
+
+    mismatches = []
+    for sku_id in sku_ids:
+        condition = ((await get_product_timer_discount_conditions_db([sku_id], db)) or [None])[0]
+        checks = (
+            ("competitors", competitors.get(sku_id, []), [c.id for c in await get_competitors_db(sku_id, db)]),
+            ("nearest_delivery", _id(deliveries.get(sku_id)), _id(await get_nearest_delivery(sku_id, db))),
+            ("timer_discount", _id(timer_discounts.get(sku_id)), _id(await get_timer_discount_db(sku_id, db))),
+            # условия могут быть новыми объектами на каждый вызов: сравнивается то, что читает расчет
+            ("timer_discount_condition", _max_price(conditions.get(sku_id)), _max_price(condition)),
+        )
+        for name, actual, expected in checks:
+            if actual != expected:
+                mismatches.append(f"sku_id {sku_id}, {name}: {actual!r} вместо {expected!r}")
+    return mismatches
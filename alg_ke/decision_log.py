@@ -0,0 +1,222 @@
+"""
+Колоночный журнал решений для аналитики.
+
+DecisionLogWriter дописывает результаты запусков в каталог root, разбитый на партиции по магазину и дате расчета:
+root/shop=<id>/date=<YYYY-MM-DD>/part-<...>/<колонка>.npy. Каждая колонка - отдельный .npy, который читается
+через mmap без разбора текста. Строковые колонки (mark, path) хранятся кодами int32 со словарем части
+в <колонка>.json. Часть сначала пишется во временный каталог и переименовывается целиком, поэтому читатель
+не видит недописанных частей, а запуски в разных процессах не мешают друг другу.
+
+read_decision_log и iter_decision_log_parts отбирают партиции по именам каталогов и загружают только нужные
+колонки: помесячная агрегация по марке или ветке читает несколько массивов, а не строки path/text.
+"""
+import datetime
+import json
+import os
+from collections import defaultdict
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from crud.algorithms.bin_ladder import BinLadder
+from crud.algorithms.marketplace import load_last_prices
+from crud.algorithms.prefetch import AlgorithmPrefetch, chunked
+from database.models import CalculationResult, Competitor
+
+DEFAULT_FLUSH_SIZE = 100_000
+
+# колонка -> dtype; у строковых колонок на диске коды int32, в памяти - строки
+DECISION_COLUMNS = {
+    "timestamp": "datetime64[s]",
+    "shop_id": np.int64,
+    "product_id": np.int64,
+    "sku_id": np.int64,
+    "mark": str,
+    "path": str,
+    "old_price": float,
+    "new_price": float,
+    "calendar_event_price": float,
+    "competitor_price": float,
+    # номера бинов старой и новой цены, NaN - цена вне лестницы
+    "old_bin": float,
+    "new_bin": float,
+    "timer_discount_hours": float,
+    "error": bool,
+}
+STRING_COLUMNS = ("mark", "path")
+
+
+class DecisionInputs:
+    """Входные данные skuid, которых нет в CalculationResult: цена до расчета, лучший конкурент, лестница бинов."""
+    __slots__ = ("old_price", "competitor_price", "ladder")
+
+    def __init__(self, old_price: Optional[float], competitor_price: Optional[float], ladder: Optional[BinLadder]):
+        self.old_price = old_price
+        self.competitor_price = competitor_price
+        self.ladder = ladder
+
+    def bin_number(self, price: Optional[float]) -> float:
+        # по спискам лестницы, без объектов Bin: они могут быть уже отвязаны от сессии
+        index = self.ladder.current_index(price) if self.ladder is not None and price is not None else None
+        return np.nan if index is None else float(self.ladder.numbers[index])
+
+
+def load_decision_inputs(sku_ids: list[int], db: Session) -> dict[int, DecisionInputs]:
+    """Читать до расчета, как load_last_prices: расчет меняет last_price объектов сессии."""
+    last_prices = load_last_prices(sku_ids, db)
+    competitor_prices: dict[int, float] = {}
+    prefetch = AlgorithmPrefetch()
+    for chunk in chunked(sku_ids):
+        # лучший конкурент - самый дешевый, как в get_competitors_db
+        competitor_prices.update(db.query(Competitor.sku_id, func.min(Competitor.price)).filter(
+            Competitor.sku_id.in_(chunk)).group_by(Competitor.sku_id))
+        prefetch.load_bins(chunk, db)
+    return {sku_id: DecisionInputs(last_prices.get(sku_id), competitor_prices.get(sku_id),
+                                   prefetch.bin_ladders.get(sku_id))
+            for sku_id in sku_ids}
+
+
+def _nan(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+_NO_INPUTS = DecisionInputs(None, None, None)
+
+
+def decision_log_row(result: CalculationResult, timestamp: np.datetime64, inputs: DecisionInputs = None) -> tuple:
+    """Значения DECISION_COLUMNS одного результата в порядке колонок."""
+    product = result.product
+    sku = product.sku
+    inputs = inputs or _NO_INPUTS
+    return (timestamp, getattr(result.shop, "id", result.shop), product.product_id, sku.sku_id, sku.mark or "",
+            result.path or "", _nan(inputs.old_price), _nan(sku.price.new), _nan(sku.price.for_calendar_event),
+            _nan(inputs.competitor_price), inputs.bin_number(inputs.old_price), inputs.bin_number(sku.price.new),
+            _nan(sku.add_to_timer_discount_for_hours), bool(result.error))
+
+
+def _partition(root: str, shop_id: int, day: datetime.date) -> str:
+    return os.path.join(root, f"shop={shop_id}", f"date={day.isoformat()}")
+
+
+def write_part(directory: str, columns: dict[str, np.ndarray], name: str):
+    """Пишет колонки в новую часть directory/name атомарно; строковые колонки кодируются словарем."""
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    os.makedirs(tmp_path)
+    for column, values in columns.items():
+        if column in STRING_COLUMNS:
+            strings, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+            with open(os.path.join(tmp_path, f"{column}.json"), "w", encoding="utf-8") as f:
+                json.dump(strings.tolist(), f, ensure_ascii=False)
+            values = codes.astype(np.int32)
+        np.save(os.path.join(tmp_path, f"{column}.npy"), np.asarray(values))
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+class DecisionLogWriter:
+    """
+    Копит строки журнала по партициям и пишет часть каждой партиции, когда строк набирается flush_size,
+    и при выходе из with. timestamp - время запуска, одно для всех его строк; по его дате выбирается партиция.
+    inputs (load_decision_inputs) заполняет old_price, competitor_price и бины, без него в них NaN.
+    """
+
+    def __init__(self, root: str, timestamp: datetime.datetime = None, flush_size: int = DEFAULT_FLUSH_SIZE,
+                 inputs: dict[int, DecisionInputs] = None):
+        self.root = root
+        self.timestamp = timestamp or datetime.datetime.now()
+        self.flush_size = flush_size
+        self.inputs = inputs or {}
+        self._timestamp = np.datetime64(self.timestamp, "s")
+        self.rows: dict[int, list[tuple]] = defaultdict(list)
+        self.pending: int = 0
+        self.written: int = 0
+        self.parts: int = 0
+
+    def __enter__(self) -> "DecisionLogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, result: CalculationResult):
+        row = decision_log_row(result, self._timestamp, self.inputs.get(result.product.sku.sku_id))
+        self.rows[row[1]].append(row)
+        self.pending += 1
+        if self.pending >= self.flush_size:
+            self.flush()
+
+    def write_all(self, results: Iterable[CalculationResult]) -> int:
+        for result in results:
+            self.add(result)
+        self.flush()
+        return self.written
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows, self.rows, self.pending = self.rows, defaultdict(list), 0
+        for shop_id, shop_rows in rows.items():
+            columns = {column: np.array(values, dtype=object if column in STRING_COLUMNS else dtype)
+                       for (column, dtype), values in zip(DECISION_COLUMNS.items(), zip(*shop_rows))}
+            # время, процесс и случайный суффикс: части параллельных запусков не совпадают по имени
+            name = f"part-{self.timestamp:%H%M%S}-{os.getpid()}-{os.urandom(4).hex()}-{self.parts:05d}"
+            write_part(_partition(self.root, shop_id, self.timestamp.date()), columns, name)
+            self.written += len(shop_rows)
+            self.parts += 1
+
+
+def _partitions(root: str, shop_ids: Optional[Iterable[int]], start: Optional[datetime.date],
+                end: Optional[datetime.date]) -> Iterator[str]:
+    shops = None if shop_ids is None else {str(shop_id) for shop_id in shop_ids}
+    if not os.path.isdir(root):
+        return
+    for shop_dir in sorted(os.listdir(root)):
+        if not shop_dir.startswith("shop=") or (shops is not None and shop_dir[5:] not in shops):
+            continue
+        for date_dir in sorted(os.listdir(os.path.join(root, shop_dir))):
+            if not date_dir.startswith("date="):
+                continue
+            day = datetime.date.fromisoformat(date_dir[5:])
+            if (start is None or day >= start) and (end is None or day <= end):
+                yield os.path.join(root, shop_dir, date_dir)
+
+
+def _read_column(part: str, column: str, mmap: bool) -> np.ndarray:
+    values = np.load(os.path.join(part, f"{column}.npy"), mmap_mode="r" if mmap else None)
+    if column in STRING_COLUMNS:
+        with open(os.path.join(part, f"{column}.json"), encoding="utf-8") as f:
+            strings = np.array(json.load(f), dtype=str)
+        return strings[values] if len(strings) else np.array([], dtype=str)
+    return values
+
+
+def iter_decision_log_parts(root: str, columns: Iterable[str] = None, shop_ids: Iterable[int] = None,
+                            start: datetime.date = None, end: datetime.date = None,
+                            mmap: bool = True) -> Iterator[dict[str, np.ndarray]]:
+    """Колонки columns (по умолчанию все) каждой части партиций в [start, end] магазинов shop_ids."""
+    columns = list(columns or DECISION_COLUMNS)
+    unknown = set(columns) - set(DECISION_COLUMNS)
+    if unknown:
+        raise ValueError(f"Нет колонок журнала решений: {', '.join(sorted(unknown))}")
+    for partition in _partitions(root, shop_ids, start, end):
+        for name in sorted(os.listdir(partition)):
+            if name.startswith("part-"):
+                part = os.path.join(partition, name)
+                yield {column: _read_column(part, column, mmap) for column in columns}
+
+
+def read_decision_log(root: str, columns: Iterable[str] = None, shop_ids: Iterable[int] = None,
+                      start: datetime.date = None, end: datetime.date = None,
+                      mmap: bool = True) -> dict[str, np.ndarray]:
+    """Части iter_decision_log_parts, склеенные по колонкам; у единственной части массивы остаются mmap."""
+    columns = list(columns or DECISION_COLUMNS)
+    parts = list(iter_decision_log_parts(root, columns, shop_ids, start, end, mmap))
+    if len(parts) == 1:
+        return parts[0]
+    if not parts:
+        return {column: np.array([], dtype=str if DECISION_COLUMNS[column] is str else DECISION_COLUMNS[column])
+                for column in columns}
+    return {column: np.concatenate([part[column] for part in parts]) for column in columns}
@@ -0,0 +1,74 @@
+"""
+Отдача только изменившихся решений.
+
+Большинство skuid от запуска к запуску получают то же решение, что и в прошлый раз: ту же цену, ту же цену для
+календарной акции, те же действия с акциями и ту же метку. DecisionStore хранит последнее отданное решение
+каждого skuid между запусками, и emit пропускает результаты, решение которых не изменилось, - потребители
+(применение на маркетплейсе, уведомления, выгрузки) получают только дельту.
+"""
+import os
+import pickle
+from typing import Iterable, Iterator, Optional
+
+from database.models import CalculationResult
+
+Decision = tuple
+
+
+def decision_of(result: CalculationResult) -> Decision:
+    """То, что из результата доходит до потребителей: цены, действия с акциями и метка."""
+    product = result.product
+    sku = product.sku
+    return (sku.price.new, sku.price.for_calendar_event, sku.add_to_timer_discount_for_hours,
+            sku.remove_from_timer_discount_id, product.add_calendar_event_id_in_lk,
+            product.remove_calendar_event_id_in_lk, sku.mark)
+
+
+class DecisionStore:
+    """
+    sku_id -> последнее отданное решение (decision_of). Результаты с ошибкой отдаются всегда и забывают решение
+    skuid, чтобы после исправления оно ушло потребителям снова.
+    Сохраненное решение считается доставленным, поэтому save вызывается после того, как потребитель принял
+    все отданные результаты: при сбое до save следующий запуск отдаст их повторно.
+    """
+
+    def __init__(self, entries: dict[int, Decision] = None):
+        self.entries: dict[int, Decision] = entries or {}
+        self.emitted: int = 0
+        self.suppressed: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> "DecisionStore":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            return cls(pickle.load(f))
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def changed(self, result: CalculationResult) -> bool:
+        """Запоминает решение результата; True - его нужно отдать."""
+        sku_id = result.product.sku.sku_id
+        if result.error:
+            self.entries.pop(sku_id, None)
+        else:
+            decision = decision_of(result)
+            if self.entries.get(sku_id) == decision:
+                self.suppressed += 1
+                return False
+            self.entries[sku_id] = decision
+        self.emitted += 1
+        return True
+
+    def emit(self, results: Iterable[CalculationResult]) -> Iterator[CalculationResult]:
+        return (result for result in results if self.changed(result))
+
+    def last(self, sku_id: int) -> Optional[Decision]:
+        return self.entries.get(sku_id)
+
+    def stats(self) -> dict[str, int]:
+        return {"skus": len(self.entries), "emitted": self.emitted, "suppressed": self.suppressed}
@@ -0,0 +1,589 @@
+"""
+Декларативное описание дерева решений Algorithm.run, SalesAccelerationAlgorithm и ProfitIncreaseAlgorithm
+и движок, который считает его сразу для колоночной пачки skuid масками NumPy.
+
+Ветки, зависящие от других skuid продукта (вставка всего продукта в распродажу, метка 9), и строки,
+на которых объектный путь упал бы (нет нужного бина, поставка сегодня и т.п.), помечаются fallback -
+такие продукты пересчитываются обычным AsyncAlgorithm.
+"""
+
+import datetime
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from crud.algorithms.delivery_solver import days_until_delivery, ladder_matrix, solve_delivery_prices
+from crud.algorithms.notifications import LOG, MESSAGE, TASK, NotificationDispatcher, responsible_person_username
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+from database.models import Product as ProductDb
+
+Batch = dict[str, np.ndarray]
+State = dict[str, np.ndarray]
+Rows = np.ndarray
+
+TIMER_ADD = 1
+TIMER_REMOVE = -1
+
+
+class Branch:
+    __slots__ = ("predicate", "if_true", "if_false")
+
+    def __init__(self, predicate: str, if_true: "Node", if_false: "Node"):
+        self.predicate = predicate
+        self.if_true = if_true
+        self.if_false = if_false
+
+
+class Leaf:
+    __slots__ = ("actions", "then")
+
+    def __init__(self, *actions: tuple, then: "Node" = None):
+        self.actions = actions
+        self.then = then
+
+
+Node = Optional[Union[Branch, Leaf]]
+
+
+def set_mark(value: str) -> tuple:
+    return "set_mark", value
+
+
+def update_mark(value: str) -> tuple:
+    return "update_mark", value
+
+
+def set_price(price: str) -> tuple:
+    return "price", price
+
+
+def set_candidate(price: str) -> tuple:
+    return "candidate", price
+
+
+def change_delta(step: int) -> tuple:
+    return "delta", step
+
+
+def timer(action: int) -> tuple:
+    return "timer", action
+
+
+def notify(code: str) -> tuple:
+    return "notify", code
+
+
+PRICE_NONE = ("price_none", None)
+FALLBACK = ("fallback", None)
+
+
+# ---------------------------------------------------------------- предикаты: (функция, обязательные колонки)
+
+def _col(name: str) -> Callable[[Batch, State, Rows], np.ndarray]:
+    return lambda b, s, r: b[name][r]
+
+
+PREDICATES: dict[str, tuple[Callable[[Batch, State, Rows], np.ndarray], tuple[str, ...]]] = {
+    "is_valid": (_col("valid"), ()),
+    "is_status_blocked": (lambda b, s, r: b["status_title"][r] == "Заблокирован", ()),
+    "is_status_on_sale": (lambda b, s, r: b["status_title"][r] == "В продаже", ()),
+    "is_active": (_col("active"), ()),
+    "is_stock_empty": (lambda b, s, r: b["stock"][r] == 0, ()),
+    "is_reserved_stock_empty": (lambda b, s, r: b["reserved_stock"][r] == 0, ()),
+    "can_be_added_to_any_calendar_event": (_col("can_be_added_to_calendar_event"), ()),
+    "is_bin_number_15": (lambda b, s, r: b["current_bin_number"][r] == 15, ("current_bin_number",)),
+    "is_current_price__greater_than__min_price": (lambda b, s, r: b["last_price"][r] >= b["min_price"][r], ()),
+    "is_days_without_sales__smaller_than__one": (lambda b, s, r: b["days_without_sales"][r] < 1, ()),
+    "is_avg_sales_speed__greater_than__min_sales_speed": (
+        lambda b, s, r: b["average_sales_speed"][r] > b["min_sales_speed"][r], ()),
+    "is_min_price_border_reached": (lambda b, s, r: b["min_price"][r] == b["last_price"][r], ()),
+    "is_days_without_sales__greater_than__three": (lambda b, s, r: b["days_without_sales"][r] > 3, ()),
+    "is_top": (_col("top"), ()),
+    "is_in_top100_search_results": (_col("in_top100_search_results"), ()),
+    "has_best_competitor_link_and_stock": (
+        lambda b, s, r: b["has_competitor"][r] & b["competitor_has_stock"][r], ()),
+    "is_best_competitor_sales_speed__greater_than__our_sales_speed": (
+        lambda b, s, r: b["average_sales_speed"][r] < b["competitor_sales_speed"][r], ("competitor_sales_speed",)),
+    "is_best_competitor_price__greater__then_our_price": (
+        lambda b, s, r: b["competitor_price"][r] > b["last_price"][r], ("competitor_price",)),
+    "has_candidate_bin": (lambda b, s, r: ~np.isnan(s["candidate"][r]), ()),
+    "our_position_is_higher_then_competitor": (
+        lambda b, s, r: b["search_position"][r] < b["competitor_search_position"][r],
+        ("search_position", "competitor_search_position")),
+    "is_our_sales_speed__greater_than__competitor_sales_speed": (
+        lambda b, s, r: b["average_sales_speed"][r] > b["competitor_sales_speed"][r], ("competitor_sales_speed",)),
+    "has_info_about_deliveries": (_col("has_delivery"), ()),
+    "is_sku_in_calendar_event": (_col("on_calendar_event"), ()),
+    "is_in_top100search_results_of_calendar_event": (_col("in_calendar_event_top100"), ()),
+    "is_sku_in_timer_discount": (_col("on_timer_discount"), ()),
+    "has_free_timer_discounts": (_col("has_free_timer_discounts"), ()),
+    "has_timer_discount_slot": (_col("timer_slot"), ()),
+    "is_max_price_timer_discount__greater_then__new_price": (
+        lambda b, s, r: b["timer_max_price"][r] > s["price"][r], ("timer_max_price",)),
+    "is_max_price_timer_discount__greater_then__min_price": (
+        lambda b, s, r: b["timer_max_price"][r] > b["min_price"][r], ("timer_max_price",)),
+}
+
+
+def strategy_predicates(strategy: StrategyConfig) -> dict[str, tuple[Callable[[Batch, State, Rows], np.ndarray],
+                                                                     tuple[str, ...]]]:
+    """Предикаты, зависящие от порогов стратегии."""
+    return {
+        "more_then_eight_positions": (
+            lambda b, s, r: b["competitor_search_position"][r] - b["search_position"][r] > strategy.position_lead,
+            ("search_position", "competitor_search_position")),
+        "date_change_price_competitor_more_then_three_days": (
+            lambda b, s, r: b["competitor_price_age_days"][r] > strategy.competitor_price_age_days,
+            ("competitor_price_age_days",)),
+        # NaN - начало акции неизвестно, как и в объектном пути это "ждем окончания акции"
+        "is_sku_in_timer_discount_more_then_23_hours": (
+            lambda b, s, r: b["on_timer_discount"][r] &
+            (b["timer_discount_age_hours"][r] >= strategy.timer_discount_hours), ()),
+        "our_price_greater_then_competitor_more_then_ten_perc": (
+            lambda b, s, r: b["last_price"][r] / b["competitor_price"][r] >= strategy.competitor_overprice_ratio,
+            ("competitor_price",)),
+    }
+
+
+PREDICATES.update(strategy_predicates(DEFAULT_STRATEGY))
+
+# ---------------------------------------------------------------- цены: NaN означает "бина нет"
+
+PRICES: dict[str, Callable[[Batch, State, Rows], np.ndarray]] = {
+    "bin_15": lambda b, s, r: b["bin_15_price"][r],
+    "lower_bin": lambda b, s, r: b["lower_bin_price"][r],
+    "lower_bin_by_competitor": lambda b, s, r: b["lower_bin_by_competitor_price"][r],
+    "upper_bin": lambda b, s, r: b["upper_bin_price"][r],
+    "upper_bin_by_competitor": lambda b, s, r: b["upper_bin_by_competitor_price"][r],
+    "max_profit_bin": lambda b, s, r: b["max_profit_price"][r],
+    "delivery_bin": lambda b, s, r: b["delivery_bin_price"][r],
+    "candidate": lambda b, s, r: s["candidate"][r],
+    "min_price": lambda b, s, r: b["min_price"][r],
+    "timer_max_price": lambda b, s, r: b["timer_max_price"][r],
+    "competitor_price": lambda b, s, r: b["competitor_price"][r],
+    "competitor_price_floor": lambda b, s, r: np.floor(b["competitor_price"][r]),
+    "competitor_price_minus_1": lambda b, s, r: np.floor(b["competitor_price"][r] - 1),
+    "competitor_price_with_delta": lambda b, s, r: np.ceil(
+        b["competitor_price"][r] * ((100 + s["competitor_last_delta"][r]) / 100)),
+}
+
+
+def strategy_prices(strategy: StrategyConfig) -> dict[str, Callable[[Batch, State, Rows], np.ndarray]]:
+    """Цены, зависящие от шагов стратегии."""
+    return {
+        "last_price_plus_2_perc": lambda b, s, r: np.ceil(b["last_price"][r] * strategy.last_price_up_fast),
+        "last_price_plus_1_perc": lambda b, s, r: np.ceil(b["last_price"][r] * strategy.last_price_up),
+        "last_price_minus_1_perc": lambda b, s, r: np.floor(b["last_price"][r] * strategy.last_price_down),
+        "last_price_minus_2_perc": lambda b, s, r: np.floor(b["last_price"][r] * strategy.last_price_down_fast),
+        "competitor_price_plus_9_perc": lambda b, s, r: np.floor(b["competitor_price"][r] *
+                                                                 strategy.competitor_markup),
+    }
+
+
+PRICES.update(strategy_prices(DEFAULT_STRATEGY))
+
+# ---------------------------------------------------------------- уведомления: те же тексты, что send_message /
+# add_to_tasks / add_to_logs в объектном пути; (product_db, ответственный) -> ((вид, текст), ...)
+
+NOTIFICATIONS: dict[str, Callable[[ProductDb, str], tuple[tuple[str, str], ...]]] = {
+    "sku_blocked": lambda p, u: (
+        (MESSAGE, f"{p.sku_full_title} заблокирован {u}"),
+        (TASK, f"разобраться в блокировке товара {u}")),
+    "no_sales": lambda p, u: (
+        (MESSAGE, f"{p.sku_full_title} не продается уже {p.days_without_sales} дней,  ключевик '{p.search_key}', "
+                  f"позиция {p.search_position} {u}\n"),
+        (LOG, ""),
+        (TASK, "Прокачать/Найти причину отсутствия продаж для skuid")),
+    "top_no_sales": lambda p, u: (
+        (MESSAGE, f"ТОП товар {p.sku_full_title} не продается уже {p.days_without_sales} дней {u}\n"),
+        (LOG, ""),
+        (TASK, f"Найти причину отсутствия продаж для {p.sku_full_title}")),
+    "top_not_selling": lambda p, u: (
+        (MESSAGE, f"ТОП товар {p.sku_full_title} не продаётся {u}\n"),
+        (LOG, "")),
+    "selling_faster": lambda p, u: (
+        (MESSAGE, "Продаем быстрее, ставим цену на бин ниже."),),
+    "calendar_event_top100": lambda p, u: (
+        (MESSAGE, f"Сегодня ничего не делаем со всеми {p.sku_id} этого {p.product_id}"),),
+}
+
+# ---------------------------------------------------------------- дерево
+
+def _then(node: Node, then: Node) -> Node:
+    """Подвешивает then ко всем листьям поддерева."""
+    if node is None:
+        return then
+    if isinstance(node, Branch):
+        return Branch(node.predicate, _then(node.if_true, then), _then(node.if_false, then))
+    if any(kind == "fallback" for kind, _ in node.actions):
+        return node
+    return Leaf(*node.actions, then=_then(node.then, then))
+
+
+CALENDAR_EVENTS_AND_TIMER_DISCOUNTS = Branch(
+    "is_sku_in_calendar_event",
+    Branch("is_in_top100search_results_of_calendar_event",
+           Leaf(notify("calendar_event_top100"), update_mark("1")),
+           Leaf(FALLBACK)),
+    Branch("is_sku_in_timer_discount",
+           Branch("is_sku_in_timer_discount_more_then_23_hours",
+                  Leaf(timer(TIMER_REMOVE), update_mark("3B")),
+                  Leaf(update_mark("3A"), PRICE_NONE)),
+           Branch("can_be_added_to_any_calendar_event",
+                  Leaf(FALLBACK),
+                  Branch("has_free_timer_discounts",
+                         Branch("is_max_price_timer_discount__greater_then__new_price",
+                                Branch("is_top",
+                                       Branch("has_timer_discount_slot",
+                                              Leaf(timer(TIMER_ADD), update_mark("4A")),
+                                              Leaf(update_mark("7"))),
+                                       Leaf(update_mark("4B"))),
+                                Branch("is_max_price_timer_discount__greater_then__min_price",
+                                       Branch("is_top",
+                                              Branch("has_timer_discount_slot",
+                                                     Leaf(set_price("timer_max_price"), timer(TIMER_ADD),
+                                                          update_mark("6A")),
+                                                     Leaf(update_mark("7"))),
+                                              Leaf(update_mark("6B"))),
+                                       Leaf(update_mark("5")))),
+                         Leaf(update_mark("7"))))))
+
+SALES_ACCELERATION = _then(Branch(
+    "has_best_competitor_link_and_stock",
+    Branch("is_best_competitor_sales_speed__greater_than__our_sales_speed",
+           Branch("is_best_competitor_price__greater__then_our_price",
+                  Leaf(set_candidate("lower_bin"), set_mark("2С")),
+                  Leaf(set_candidate("lower_bin_by_competitor"), set_mark("2D"))),
+           Leaf(notify("selling_faster"), set_candidate("lower_bin"), set_mark("2B"))),
+    Leaf(set_candidate("lower_bin"), set_mark("2A")),
+), Branch(
+    "has_candidate_bin",
+    Leaf(set_price("candidate")),
+    Leaf(set_price("min_price"), set_mark("2MIN")),
+))
+SALES_ACCELERATION = _then(SALES_ACCELERATION, CALENDAR_EVENTS_AND_TIMER_DISCOUNTS)
+
+PROFIT_INCREASE = _then(Branch(
+    "has_best_competitor_link_and_stock",
+    Branch("our_position_is_higher_then_competitor",
+           Branch("more_then_eight_positions",
+                  Branch("is_our_sales_speed__greater_than__competitor_sales_speed",
+                         Branch("date_change_price_competitor_more_then_three_days",
+                                Leaf(set_price("last_price_plus_2_perc"), update_mark("3B")),
+                                Leaf(set_price("upper_bin_by_competitor"), update_mark("3C"))),
+                         Branch("date_change_price_competitor_more_then_three_days",
+                                Branch("is_best_competitor_price__greater__then_our_price",
+                                       Leaf(set_price("competitor_price_minus_1"), update_mark("3D")),
+                                       Branch("our_price_greater_then_competitor_more_then_ten_perc",
+                                              Leaf(set_price("competitor_price_plus_9_perc"), update_mark("3E")),
+                                              Leaf(set_price("last_price_minus_1_perc"), update_mark("3F")))),
+                                Leaf(set_price("competitor_price"), update_mark("3G")))),
+                  Branch("is_our_sales_speed__greater_than__competitor_sales_speed",
+                         Branch("date_change_price_competitor_more_then_three_days",
+                                Leaf(set_price("last_price_plus_1_perc"), update_mark("3H")),
+                                Leaf(set_price("competitor_price_floor"), update_mark("3I"))),
+                         Branch("date_change_price_competitor_more_then_three_days",
+                                Leaf(set_price("last_price_minus_2_perc"), update_mark("3J")),
+                                Leaf(set_price("competitor_price_minus_1"), update_mark("3K"))))),
+           Branch("is_our_sales_speed__greater_than__competitor_sales_speed",
+                  Leaf(change_delta(1), set_price("competitor_price_with_delta"), update_mark("3L")),
+                  Leaf(change_delta(-1), set_price("competitor_price_with_delta"), update_mark("3N")))),
+    Branch("has_info_about_deliveries",
+           # minimization_overlap_oos_date_and_delivery_date
+           Leaf(set_price("delivery_bin"), update_mark("3A1")),
+           Leaf(set_mark("3A2"), set_price("upper_bin"))),
+), CALENDAR_EVENTS_AND_TIMER_DISCOUNTS)
+
+ALGORITHM = Branch(
+    "is_valid",
+    Branch("is_status_blocked",
+           Leaf(notify("sku_blocked"), set_mark("1.1"), PRICE_NONE),
+           Branch("is_active",
+                  Branch("is_stock_empty",
+                         Branch("is_reserved_stock_empty",
+                                Branch("can_be_added_to_any_calendar_event",
+                                       Leaf(FALLBACK),
+                                       Branch("is_bin_number_15",
+                                              Leaf(),
+                                              Leaf(set_price("bin_15"), set_mark("1.3")))),
+                                Leaf(set_mark("1.4"))),
+                         Branch("is_status_on_sale",
+                                Branch("is_current_price__greater_than__min_price",
+                                       Branch("is_days_without_sales__smaller_than__one",
+                                              Branch("is_avg_sales_speed__greater_than__min_sales_speed",
+                                                     PROFIT_INCREASE,
+                                                     SALES_ACCELERATION),
+                                              Branch("is_min_price_border_reached",
+                                                     Branch("is_days_without_sales__greater_than__three",
+                                                            Leaf(notify("no_sales"), set_mark("1.9")),
+                                                            Branch("is_top",
+                                                                   Branch("is_in_top100_search_results",
+                                                                          Leaf(notify("top_no_sales"),
+                                                                               set_mark("1.11"), PRICE_NONE),
+                                                                          Leaf(PRICE_NONE)),
+                                                                   Leaf(PRICE_NONE))),
+                                                     Branch("is_top",
+                                                            Leaf(notify("top_not_selling"),
+                                                                 then=SALES_ACCELERATION),
+                                                            SALES_ACCELERATION))),
+                                       Leaf()),
+                                Leaf())),
+                  Leaf(set_mark("1.2"), PRICE_NONE))),
+    # ошибки валидации оформляет объектный путь
+    Leaf(FALLBACK),
+)
+
+
+# ---------------------------------------------------------------- компиляция и вычисление
+
+class CompiledBranch:
+    __slots__ = ("name", "func", "requires", "if_true", "if_false")
+
+
+class CompiledLeaf:
+    __slots__ = ("actions", "then")
+
+
+class DecisionBatchResult:
+    def __init__(self, state: State):
+        self.price: np.ndarray = state["price"]
+        self.price_set: np.ndarray = state["price_set"]
+        self.mark: np.ndarray = state["mark"]
+        self.result_mark: np.ndarray = state["result_mark"]
+        self.mark_touched: np.ndarray = state["mark_touched"]
+        self.timer_action: np.ndarray = state["timer_action"]
+        self.competitor_last_delta: np.ndarray = state["competitor_last_delta"]
+        self.delta_changed: np.ndarray = state["delta_changed"]
+        self.fallback: np.ndarray = state["fallback"]
+        self.notifications: np.ndarray = state["notifications"]
+
+    def apply(self, i: int, product_db: ProductDb, product_db_data, notifier: NotificationDispatcher = None):
+        """
+        Переносит решение строки i в product_db и CalculationResult так же, как это делает объектный путь,
+        и отдает notifier уведомления, которые объектный путь отправил бы на этой ветке.
+        """
+        sku = product_db_data.result.product.sku
+        if self.price_set[i]:
+            sku.price.new = None if np.isnan(self.price[i]) else float(self.price[i])
+        product_db.mark = self.mark[i]
+        if self.mark_touched[i]:
+            sku.mark = self.result_mark[i]
+        if self.timer_action[i] == TIMER_ADD:
+            sku.add_to_timer_discount_for_hours = 48
+        elif self.timer_action[i] == TIMER_REMOVE:
+            sku.remove_from_timer_discount_id = product_db_data.timer_discount.discount_id
+        if self.delta_changed[i]:
+            product_db_data.competitors[0].last_delta_between_us_and_cmp = int(self.competitor_last_delta[i])
+        if notifier is not None and self.notifications[i]:
+            username = responsible_person_username(product_db.shop)
+            for code in self.notifications[i]:
+                for kind, text in NOTIFICATIONS[code](product_db, username):
+                    notifier.enqueue(kind, product_db.shop_id, username, text)
+
+
+class DecisionEngine:
+    def __init__(self, tree: Node = ALGORITHM, predicates=None, prices=None, notifications=None,
+                 strategy: StrategyConfig = None):
+        self.strategy = strategy or DEFAULT_STRATEGY
+        self.predicates = predicates or PREDICATES
+        self.prices = prices or PRICES
+        if strategy is not None:
+            self.predicates = {**self.predicates, **strategy_predicates(strategy)}
+            self.prices = {**self.prices, **strategy_prices(strategy)}
+        self.notifications = notifications or NOTIFICATIONS
+        self.root = self.compile(tree)
+
+    def compile(self, node: Node):
+        if node is None:
+            return None
+        if isinstance(node, Branch):
+            if node.predicate not in self.predicates:
+                raise KeyError(f"Неизвестный предикат '{node.predicate}'")
+            compiled = CompiledBranch()
+            compiled.name = node.predicate
+            compiled.func, compiled.requires = self.predicates[node.predicate]
+            compiled.if_true = self.compile(node.if_true)
+            compiled.if_false = self.compile(node.if_false)
+            return compiled
+        compiled = CompiledLeaf()
+        actions = []
+        for kind, arg in node.actions:
+            if kind in ("price", "candidate"):
+                if arg not in self.prices:
+                    raise KeyError(f"Неизвестная цена '{arg}'")
+                arg = self.prices[arg]
+            elif kind == "notify" and arg not in self.notifications:
+                raise KeyError(f"Неизвестное уведомление '{arg}'")
+            actions.append((kind, arg))
+        compiled.actions = tuple(actions)
+        compiled.then = self.compile(node.then)
+        return compiled
+
+    def evaluate(self, batch: Batch) -> DecisionBatchResult:
+        n = len(batch["valid"])
+        state: State = {
+            "price": np.full(n, np.nan),
+            "price_set": np.zeros(n, dtype=bool),
+            "candidate": np.full(n, np.nan),
+            "mark": np.full(n, "", dtype=object),
+            "result_mark": batch["result_mark"].copy(),
+            "mark_touched": np.zeros(n, dtype=bool),
+            "timer_action": np.zeros(n, dtype=np.int8),
+            "competitor_last_delta": batch["competitor_last_delta"].copy(),
+            "delta_changed": np.zeros(n, dtype=bool),
+            "fallback": np.zeros(n, dtype=bool),
+            "notifications": np.full(n, None, dtype=object),
+        }
+        self._evaluate(self.root, batch, state, np.arange(n))
+        return DecisionBatchResult(state)
+
+    def _evaluate(self, node, batch: Batch, state: State, rows: Rows):
+        while node is not None and len(rows):
+            if isinstance(node, CompiledBranch):
+                if node.requires:
+                    missing = np.zeros(len(rows), dtype=bool)
+                    for column in node.requires:
+                        missing |= np.isnan(batch[column][rows])
+                    state["fallback"][rows[missing]] = True
+                    rows = rows[~missing]
+                mask = np.asarray(node.func(batch, state, rows), dtype=bool)
+                self._evaluate(node.if_true, batch, state, rows[mask])
+                node, rows = node.if_false, rows[~mask]
+                continue
+            rows = self._apply_actions(node.actions, batch, state, rows)
+            node = node.then
+
+    @staticmethod
+    def _apply_actions(actions: tuple, batch: Batch, state: State, rows: Rows) -> Rows:
+        for kind, arg in actions:
+            if kind == "fallback":
+                state["fallback"][rows] = True
+                return rows[:0]
+            if kind == "price":
+                values = arg(batch, state, rows)
+                missing = np.isnan(values)
+                state["fallback"][rows[missing]] = True
+                rows, values = rows[~missing], values[~missing]
+                state["price"][rows] = values
+                state["price_set"][rows] = True
+            elif kind == "price_none":
+                state["price"][rows] = np.nan
+                state["price_set"][rows] = True
+            elif kind == "candidate":
+                state["candidate"][rows] = arg(batch, state, rows)
+            elif kind == "set_mark":
+                state["mark"][rows] = arg
+                state["result_mark"][rows] = arg
+                state["mark_touched"][rows] = True
+            elif kind == "update_mark":
+                state["mark"][rows] = state["mark"][rows] + arg
+                state["result_mark"][rows] = state["result_mark"][rows] + arg
+                state["mark_touched"][rows] = True
+            elif kind == "timer":
+                state["timer_action"][rows] = arg
+            elif kind == "delta":
+                state["competitor_last_delta"][rows] += arg
+                state["delta_changed"][rows] = True
+            elif kind == "notify":
+                for row in rows:
+                    state["notifications"][row] = (state["notifications"][row] or ()) + (arg,)
+        return rows
+
+
+# ---------------------------------------------------------------- колоночная пачка из загруженных данных
+
+VALIDATED_FIELDS = ("stock", "min_price", "last_price", "days_without_sales", "top", "average_sales_speed",
+                    "min_sales_speed")
+
+
+def _float(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _bin_price(bin_db) -> float:
+    return np.nan if bin_db is None else float(bin_db.to_value)
+
+
+def timer_discount_age_hours(timer_discount, now: datetime.datetime) -> float:
+    """Сколько часов skuid в акции с таймером; NaN - нет записи об акции или ее начала."""
+    if timer_discount is None or timer_discount.date_start is None:
+        return np.nan
+    return (now - timer_discount.date_start).total_seconds() / 3600
+
+
+def build_sku_batch(sku_list: list[ProductDb], data_list: list) -> Batch:
+    """Колонки для DecisionEngine из skuid и их AlgorithmDataForSku (после заглушки цены выше бинов)."""
+    now = datetime.datetime.now()
+    today = now.date()
+    rows: dict[str, list] = {}
+
+    def put(name: str, value):
+        rows.setdefault(name, []).append(value)
+
+    for product_db, data in zip(sku_list, data_list):
+        ladder = data.bin_ladder
+        competitor = data.competitors[0] if data.competitors else None
+        last_price, min_price = product_db.last_price, product_db.min_price
+        valid = all(getattr(product_db, field) is not None for field in VALIDATED_FIELDS) and \
+            last_price >= min_price
+
+        put("valid", valid)
+        put("status_title", product_db.status_title)
+        put("active", bool(product_db.active))
+        put("top", bool(product_db.top))
+        for field in ("stock", "reserved_stock", "last_price", "min_price", "days_without_sales",
+                      "average_sales_speed", "min_sales_speed", "search_position"):
+            put(field, _float(getattr(product_db, field)))
+        put("in_top100_search_results", product_db.search_position is not None and product_db.search_position != -1)
+        put("result_mark", data.result.product.sku.mark or "")
+
+        current_bin = data.current_bin
+        put("current_bin_number", _float(current_bin.number if current_bin else None))
+        put("bin_15_price", _bin_price(ladder.by_number(15)))
+        put("max_profit_price", _bin_price(data.max_profit_bin))
+        put("lower_bin_price", _bin_price(ladder.lower(last_price, min_price)) if valid else np.nan)
+        put("upper_bin_price", _bin_price(ladder.upper(last_price)) if valid else np.nan)
+
+        put("has_competitor", competitor is not None)
+        put("competitor_has_stock", bool(competitor.stock) if competitor else False)
+        put("competitor_price", _float(competitor.price if competitor else None))
+        put("competitor_sales_speed", _float(competitor.average_sales_speed if competitor else None))
+        put("competitor_search_position", _float(competitor.search_position if competitor else None))
+        put("competitor_price_age_days", _float((today - competitor.price_change_date).days
+                                                if competitor and competitor.price_change_date else None))
+        put("competitor_last_delta", _float(competitor.last_delta_between_us_and_cmp if competitor else None))
+        put("lower_bin_by_competitor_price", _bin_price(ladder.lower_by_competitor(competitor.price, min_price))
+            if competitor and valid else np.nan)
+        put("upper_bin_by_competitor_price", _bin_price(ladder.upper_by_competitor(competitor.price))
+            if competitor else np.nan)
+
+        delivery = data.nearest_delivery
+        put("has_delivery", delivery is not None)
+        put("delivery_days", float(days_until_delivery(delivery.date, today)) if delivery else np.nan)
+
+        put("on_calendar_event", bool(product_db.on_calendar_event))
+        put("on_timer_discount", bool(product_db.on_timer_discount))
+        calendar_event = data.calendar_event_entry(product_db)
+        put("can_be_added_to_calendar_event", bool(calendar_event.most_suitable))
+        put("in_calendar_event_top100", calendar_event.in_top100)
+        put("has_free_timer_discounts", product_db.shop.quantity_available_timer_discounts > 0)
+        put("timer_slot", data.timer_slot is not False)
+        condition = data.timer_discount_condition
+        put("timer_max_price", _float(condition.max_price if condition else None))
+        put("timer_discount_id", _float(data.timer_discount.discount_id if data.timer_discount else None))
+        put("timer_discount_age_hours", timer_discount_age_hours(data.timer_discount, now))
+
+    batch: Batch = {}
+    for name, values in rows.items():
+        if name in ("status_title", "result_mark"):
+            batch[name] = np.array(values, dtype=object)
+        elif isinstance(values[0], (bool, np.bool_)):
+            batch[name] = np.array(values, dtype=bool)
+        else:
+            batch[name] = np.array(values, dtype=float)
+    ladders = [data.bin_ladder for data in data_list]
+    batch["delivery_bin_price"] = solve_delivery_prices(batch["stock"], batch["delivery_days"],
+                                                        ladder_matrix(ladders, "to_values"),
+                                                        ladder_matrix(ladders, "sales_speeds"),
+                                                        batch["max_profit_price"])
+    return batch
@@ -0,0 +1,48 @@
+"""
+Выбор бина, при котором остаток skuid распродается ровно к ближайшей поставке.
+
+Нужная скорость продаж - остаток, деленный на число дней до поставки; выбирается бин, ожидаемая скорость продаж
+которого ближе всего к ней (при равенстве - бин с меньшим номером, как BinLadder.optimal). Если поставка сегодня
+или уже прошла, остаток растягивать не до чего, и выбирается бин максимальной прибыли; так же, если
+ни у одного бина нет скорости продаж.
+"""
+import datetime
+from typing import Optional, Sequence
+
+import numpy as np
+
+from crud.algorithms.bin_ladder import BinLadder
+
+
+def days_until_delivery(delivery_date: datetime.date, today: datetime.date) -> int:
+    return (delivery_date - today).days
+
+
+def ladder_matrix(ladders: Sequence[Optional[BinLadder]], attribute: str) -> np.ndarray:
+    """Значения attribute ("to_values", "sales_speeds") лестниц матрицей (skuid, бины) с NaN-хвостом."""
+    width = max((len(ladder) for ladder in ladders if ladder is not None), default=0)
+    matrix = np.full((len(ladders), width), np.nan)
+    for i, ladder in enumerate(ladders):
+        if ladder is not None and len(ladder):
+            matrix[i, :len(ladder)] = [np.nan if value is None else value for value in getattr(ladder, attribute)]
+    return matrix
+
+
+def solve_delivery_prices(stock: np.ndarray, days_until: np.ndarray, to_values: np.ndarray,
+                          sales_speeds: np.ndarray, max_profit_price: np.ndarray) -> np.ndarray:
+    """
+    Цена (to_value выбранного бина) для каждого skuid за один проход по матрицам бинов (skuid, бины).
+    days_until - NaN, если поставки нет: для таких строк результат не определен и не используется.
+    """
+    n = len(stock)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        target = np.where(days_until > 0, stock / days_until, np.nan)
+        distance = np.abs(sales_speeds - target[:, None])
+    distance = np.where(np.isnan(distance), np.inf, distance)
+    prices = max_profit_price.astype(float, copy=True)
+    if distance.shape[1] == 0:
+        return prices
+    best = np.argmin(distance, axis=1)
+    found = np.isfinite(distance[np.arange(n), best])
+    prices[found] = to_values[np.arange(n)[found], best[found]]
+    return prices
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator
+
+_local = threading.local()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Долгоживущий event loop текущего потока, создается один раз вместо asyncio.run на каждый вызов."""
+    loop = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _local.loop = loop
+    return loop
+
+
+def run_sync(coro: Coroutine) -> Any:
+    return get_event_loop().run_until_complete(coro)
+
+
+def iter_sync(iterator: AsyncIterator) -> Iterator:
+    """Синхронный генератор поверх асинхронного, каждый шаг выполняется на event loop потока."""
+    loop = get_event_loop()
+    while True:
+        try:
+            yield loop.run_until_complete(iterator.__anext__())
+        except StopAsyncIteration:
+            return
@@ -0,0 +1,148 @@
+import copy
+import datetime
+import hashlib
+import os
+import pickle
+from typing import Optional
+
+from database.models import CalculationResult, Competitor, Product as ProductDb
+from crud.algorithms.delivery_solver import days_until_delivery
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+
+# менять при любом изменении дерева решений: старые отпечатки перестанут совпадать
+FINGERPRINT_VERSION = 5
+
+
+def _competitor_key(competitor: Competitor, today: datetime.date, strategy: StrategyConfig) -> tuple:
+    age = (today - competitor.price_change_date).days if competitor.price_change_date else None
+    return (competitor.price, competitor.stock, competitor.average_sales_speed, competitor.search_position,
+            # дерево смотрит только на пороги возраста цены, поэтому старые цены не меняют отпечаток каждый день
+            # проверки "цена конкурента менялась более 2/3 дней назад"
+            min(age, max(strategy.competitor_price_age_days, strategy.competitor_price_age_days_short) + 1)
+            if age is not None else None,
+            competitor.last_delta_between_us_and_cmp)
+
+
+def sku_fingerprint(product_db: ProductDb, prefetch: AlgorithmPrefetch, now: datetime.datetime,
+                    strategy: StrategyConfig = DEFAULT_STRATEGY) -> bytes:
+    """
+    Отпечаток всех входных данных дерева решений для skuid, включая зависящие от времени:
+    возраст цены конкурента, дни до поставки и признак "в акции с таймером не меньше 23 часов".
+    Пороги стратегии тоже входят в отпечаток: расчет с другой стратегией не переиспользует результаты.
+    Входная метка тоже: update_mark дописывает к ней, а невалидный skuid оставляет ее как есть.
+    """
+    today = now.date()
+    sku_id = product_db.sku_id
+    shop = product_db.shop
+    delivery = prefetch.nearest_delivery.get(sku_id)
+    timer_discount = prefetch.timer_discount.get(sku_id)
+    condition = prefetch.timer_discount_condition.get(sku_id)
+    ladder = prefetch.bin_ladders.get(sku_id)
+    key = (
+        FINGERPRINT_VERSION, strategy.key(),
+        product_db.status_title, product_db.active, product_db.top, product_db.stock, product_db.reserved_stock,
+        product_db.last_price, product_db.min_price, product_db.days_without_sales, product_db.average_sales_speed,
+        product_db.min_sales_speed, product_db.search_position, product_db.on_calendar_event,
+        product_db.on_timer_discount, product_db.sku_full_title, product_db.search_key, product_db.mark,
+        shop.quantity_available_timer_discounts,
+        shop.responsible_person.username if shop.responsible_person else None,
+        tuple((p.calendar_event_id_in_lk, p.priority, p.recommended_price, p.is_involved, p.search_position)
+              for p in product_db.participations_in_calendar_event),
+        tuple((b.number, b.from_value, b.to_value, b.profit, b.sales_speed) for b in ladder.bins) if ladder else (),
+        tuple(_competitor_key(c, today, strategy) for c in prefetch.competitors.get(sku_id, ())),
+        days_until_delivery(delivery.date, today) if delivery else None,
+        (timer_discount.discount_id,
+         now - timer_discount.date_start >= datetime.timedelta(hours=strategy.timer_discount_hours)
+         if timer_discount.date_start else None) if timer_discount else None,
+        condition.max_price if condition else None,
+        sku_id in prefetch.timer_slots if prefetch.timer_slots is not None else None,
+    )
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+
+class FingerprintEntry:
+    __slots__ = ("fingerprint", "result")
+
+    def __init__(self, fingerprint: bytes, result: CalculationResult):
+        self.fingerprint = fingerprint
+        self.result = result
+
+
+class FingerprintStore:
+    """
+    Отпечатки входных данных и результаты прошлого расчета по skuid, сохраняемые между запусками.
+    Решения внутри продукта зависят друг от друга (цена на весь продукт, "последний skuid продукта"),
+    поэтому результат переиспользуется только если не изменился ни один skuid продукта.
+    Результаты, в которых алгоритм сдвинул дельту с конкурентом, не запоминаются: такой расчет не идемпотентен.
+    """
+
+    def __init__(self, entries: dict[int, FingerprintEntry] = None):
+        self.entries: dict[int, FingerprintEntry] = entries or {}
+        # изменения с последнего pop_updated, None - запись удалена; так воркеры передают их в основной процесс
+        self.updated: dict[int, Optional[FingerprintEntry]] = {}
+        self.pending: dict[int, tuple[bytes, Optional[int]]] = {}
+        self.reused_skus: int = 0
+        self.evaluated_skus: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> "FingerprintStore":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            return cls(pickle.load(f))
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def reuse_product(self, sku_list: list[ProductDb], prefetch: AlgorithmPrefetch,
+                      now: datetime.datetime = None,
+                      strategy: StrategyConfig = DEFAULT_STRATEGY) -> Optional[list[CalculationResult]]:
+        """Результаты прошлого расчета, если ни один skuid продукта не изменился, иначе None."""
+        now = now or datetime.datetime.now()
+        fingerprints = [sku_fingerprint(sku, prefetch, now, strategy) for sku in sku_list]
+        entries = [self.entries.get(sku.sku_id) for sku in sku_list]
+        if sku_list and all(entry is not None and entry.fingerprint == fingerprint
+                            for entry, fingerprint in zip(entries, fingerprints)):
+            self.reused_skus += len(sku_list)
+            results = [copy.deepcopy(entry.result) for entry in entries]
+            for sku, result in zip(sku_list, results):
+                sku.mark = result.product.sku.mark
+            return results
+
+        self.evaluated_skus += len(sku_list)
+        for sku, fingerprint in zip(sku_list, fingerprints):
+            competitors = prefetch.competitors.get(sku.sku_id)
+            self.pending[sku.sku_id] = fingerprint, \
+                competitors[0].last_delta_between_us_and_cmp if competitors else None
+        return None
+
+    def remember_product(self, sku_list: list[ProductDb], results: list[CalculationResult],
+                         prefetch: AlgorithmPrefetch):
+        pending = [self.pending.pop(sku.sku_id, None) for sku in sku_list]
+        if any(p is None for p in pending):
+            return
+        for sku, (_, delta) in zip(sku_list, pending):
+            competitors = prefetch.competitors.get(sku.sku_id)
+            if competitors and competitors[0].last_delta_between_us_and_cmp != delta:
+                for stale in sku_list:
+                    self.entries.pop(stale.sku_id, None)
+                    self.updated[stale.sku_id] = None
+                return
+        for sku, (fingerprint, _), result in zip(sku_list, pending, results):
+            entry = FingerprintEntry(fingerprint, copy.deepcopy(result))
+            self.entries[sku.sku_id] = self.updated[sku.sku_id] = entry
+
+    def pop_updated(self) -> dict[int, Optional[FingerprintEntry]]:
+        updated, self.updated = self.updated, {}
+        return updated
+
+    def merge(self, updated: dict[int, Optional[FingerprintEntry]]):
+        for sku_id, entry in updated.items():
+            if entry is None:
+                self.entries.pop(sku_id, None)
+            else:
+                self.entries[sku_id] = entry
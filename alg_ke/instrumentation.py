@@ -0,0 +1,142 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Awaitable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+OUTSIDE_SKU = "вне skuid"  # prefetch и прочие запросы, сделанные не во время расчета конкретного skuid
+NO_MARK = "без метки"
+
+
+class Timing:
+    __slots__ = ("calls", "seconds")
+
+    def __init__(self):
+        self.calls: int = 0
+        self.seconds: float = 0.0
+
+    def add(self, seconds: float, calls: int = 1):
+        self.calls += calls
+        self.seconds += seconds
+
+
+class MarkStats:
+    """Суммарные замеры по всем skuid, получившим одну метку."""
+
+    def __init__(self):
+        self.skus: int = 0
+        self.statements: int = 0
+        self.rows: int = 0
+        self.checks: dict[str, Timing] = defaultdict(Timing)
+        self.crud: dict[str, Timing] = defaultdict(Timing)
+
+
+class AlgorithmInstrumentation:
+    """
+    Необязательные замеры алгоритма: время каждой проверки с add_to_path и каждого вызова crud,
+    число SQL-запросов и загруженных ORM-строк на skuid (через события SQLAlchemy).
+    Замеры skuid копятся отдельно и в finish_sku попадают в статистику его итоговой метки.
+    query_budget - допустимое число запросов на skuid, при превышении пишется warning.
+    """
+
+    def __init__(self, query_budget: Optional[int] = None):
+        self.query_budget = query_budget
+        self.marks: dict[str, MarkStats] = defaultdict(MarkStats)
+        self.over_budget: list[tuple[int, int]] = []
+        self.sku_id: Optional[int] = None
+        self.sku = MarkStats()
+        self.attached: list[tuple] = []
+
+    def attach(self, db: Session):
+        """Подписывается на запросы движка сессии и загрузку ORM-объектов. Повторный attach той же сессии - no-op."""
+        engine = db.get_bind()
+        for target, name, listener in ((db, "loaded_as_persistent", self.on_row),
+                                       (engine, "before_cursor_execute", self.on_statement)):
+            if not any(t is target and n == name for t, n, _ in self.attached):
+                event.listen(target, name, listener)
+                self.attached.append((target, name, listener))
+
+    def detach(self):
+        for target, name, listener in self.attached:
+            event.remove(target, name, listener)
+        self.attached.clear()
+
+    def on_statement(self, *args):
+        self.current.statements += 1
+
+    def on_row(self, *args):
+        self.current.rows += 1
+
+    @property
+    def current(self) -> MarkStats:
+        return self.sku if self.sku_id is not None else self.marks[OUTSIDE_SKU]
+
+    def start_sku(self, sku_id: int):
+        self.sku_id = sku_id
+        self.sku = MarkStats()
+
+    def finish_sku(self, mark: Optional[str]):
+        stats, sku_id = self.sku, self.sku_id
+        self.sku_id = None
+        total = self.marks[mark or NO_MARK]
+        total.skus += 1
+        total.statements += stats.statements
+        total.rows += stats.rows
+        for source, target in ((stats.checks, total.checks), (stats.crud, total.crud)):
+            for name, timing in source.items():
+                target[name].add(timing.seconds, timing.calls)
+
+        if self.query_budget is not None and stats.statements > self.query_budget:
+            self.over_budget.append((sku_id, stats.statements))
+            logger.warning("skuid %s: %s SQL-запросов при бюджете %s", sku_id, stats.statements, self.query_budget)
+
+    @contextmanager
+    def check(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current.checks[name].add(time.perf_counter() - started)
+
+    @contextmanager
+    def crud_call(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current.crud[name].add(time.perf_counter() - started)
+
+    async def acrud_call(self, name: str, awaitable: Awaitable):
+        with self.crud_call(name):
+            return await awaitable
+
+    def to_dict(self) -> dict:
+        return {
+            mark: {
+                "skus": stats.skus,
+                "statements": stats.statements,
+                "rows": stats.rows,
+                "checks": {name: {"calls": t.calls, "seconds": t.seconds} for name, t in stats.checks.items()},
+                "crud": {name: {"calls": t.calls, "seconds": t.seconds} for name, t in stats.crud.items()},
+            }
+            for mark, stats in self.marks.items()
+        }
+
+    def report(self, top: int = 10) -> str:
+        lines = []
+        for mark, stats in sorted(self.marks.items(), key=lambda item: -item[1].skus):
+            skus = stats.skus or 1
+            lines.append(f"[{mark}] skuid: {stats.skus}, SQL: {stats.statements} ({stats.statements / skus:.2f} на skuid), "
+                         f"строк: {stats.rows} ({stats.rows / skus:.2f} на skuid)")
+            for title, timings in (("проверки", stats.checks), ("crud", stats.crud)):
+                for name, t in sorted(timings.items(), key=lambda item: -item[1].seconds)[:top]:
+                    lines.append(f"    {title:<9} {name:<70} {t.calls:>8} {t.seconds * 1e3:>10.3f} мс "
+                                 f"{t.seconds / t.calls * 1e6:>9.1f} мкс/вызов")
+        if self.query_budget is not None:
+            lines.append(f"Превышен бюджет {self.query_budget} SQL-запросов на skuid: {len(self.over_budget)} skuid")
+        return "\n".join(lines)
@@ -0,0 +1,273 @@
+"""
+Применение решений CalculationResult на маркетплейсе пачками.
+
+Каждый результат разбирается на действия (цена, добавление/удаление из акции с таймером, вставка/удаление
+продукта из календарной акции), действия группируются по (магазин, вид) в пачки до batch_size и отправляются
+клиентом маркетплейса: не больше max_concurrency запросов одновременно, не чаще rate запросов в секунду
+на магазин, с повторами. У каждого действия и пачки есть ключ идемпотентности: повтор пачки после
+потерянного ответа не применяет ее второй раз. Виды отправляются по очереди (APPLY_ORDER): сначала удаления,
+затем цены, затем добавления, чтобы повторная вставка продукта в акцию шла после его удаления.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from crud.algorithms.prefetch import chunked
+from database.models import CalculationResult, Product as ProductDb
+
+logger = logging.getLogger(__name__)
+
+PRICE = "price"
+TIMER_DISCOUNT_ADD = "timer_discount_add"
+TIMER_DISCOUNT_REMOVE = "timer_discount_remove"
+CALENDAR_EVENT_ADD = "calendar_event_add"
+CALENDAR_EVENT_REMOVE = "calendar_event_remove"
+
+APPLY_ORDER = (TIMER_DISCOUNT_REMOVE, CALENDAR_EVENT_REMOVE, PRICE, CALENDAR_EVENT_ADD, TIMER_DISCOUNT_ADD)
+
+
+class MarketplaceAction:
+    """Одно изменение на маркетплейсе: для skuid или, у календарных акций, для продукта целиком."""
+    __slots__ = ("kind", "shop_id", "target_id", "payload", "key")
+
+    def __init__(self, kind: str, shop_id: int, target_id: int, payload: dict, run_key: str):
+        self.kind = kind
+        self.shop_id = shop_id
+        # sku_id, у календарных акций - product_id
+        self.target_id = target_id
+        self.payload = payload
+        self.key = _key(run_key, kind, shop_id, target_id, payload)
+
+    def to_dict(self) -> dict:
+        return {"id": self.target_id, "key": self.key, **self.payload}
+
+
+class ActionBatch:
+    __slots__ = ("kind", "shop_id", "actions", "key")
+
+    def __init__(self, kind: str, shop_id: int, actions: list[MarketplaceAction]):
+        self.kind = kind
+        self.shop_id = shop_id
+        self.actions = actions
+        self.key = _key(kind, shop_id, *(action.key for action in actions))
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "shop_id": self.shop_id, "key": self.key,
+                "actions": [action.to_dict() for action in self.actions]}
+
+
+def _key(*parts) -> str:
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+Client = Callable[[ActionBatch], Awaitable[None]]
+
+
+class MarketplaceRejected(Exception):
+    """Маркетплейс отклонил пачку окончательно: повтор не поможет."""
+
+
+def load_last_prices(sku_ids: list[int], db: Session) -> dict[int, float]:
+    """Текущие цены skuid из БД. Читать до расчета: он меняет last_price объектов сессии (заглушка цены выше бинов)."""
+    prices: dict[int, float] = {}
+    for chunk in chunked(sku_ids):
+        prices.update(db.query(ProductDb.sku_id, ProductDb.last_price).filter(ProductDb.sku_id.in_(chunk)))
+    return prices
+
+
+def result_actions(result: CalculationResult, last_price: Optional[float], run_key: str) -> list[MarketplaceAction]:
+    """
+    Действия одного результата. Цена, равная last_price, - не действие. Календарные действия продуктовые
+    и повторяются во всех результатах продукта: их склеивает collect_actions.
+    """
+    if result.error:
+        return []
+    shop_id = getattr(result.shop, "id", result.shop)
+    product = result.product
+    sku = product.sku
+    actions = []
+    if sku.remove_from_timer_discount_id is not None:
+        actions.append(MarketplaceAction(TIMER_DISCOUNT_REMOVE, shop_id, sku.sku_id,
+                                         {"discount_id": sku.remove_from_timer_discount_id}, run_key))
+    if sku.price.new is not None and sku.price.new != last_price:
+        actions.append(MarketplaceAction(PRICE, shop_id, sku.sku_id, {"price": sku.price.new}, run_key))
+    if sku.add_to_timer_discount_for_hours is not None:
+        actions.append(MarketplaceAction(TIMER_DISCOUNT_ADD, shop_id, sku.sku_id,
+                                         {"hours": sku.add_to_timer_discount_for_hours, "price": sku.price.new},
+                                         run_key))
+    if product.remove_calendar_event_id_in_lk is not None:
+        actions.append(MarketplaceAction(CALENDAR_EVENT_REMOVE, shop_id, product.product_id,
+                                         {"calendar_event_id": product.remove_calendar_event_id_in_lk}, run_key))
+    if product.add_calendar_event_id_in_lk is not None:
+        actions.append(MarketplaceAction(CALENDAR_EVENT_ADD, shop_id, product.product_id,
+                                         {"calendar_event_id": product.add_calendar_event_id_in_lk,
+                                          "prices": {sku.sku_id: sku.price.for_calendar_event}}, run_key))
+    return actions
+
+
+def collect_actions(results: Iterable[CalculationResult], last_prices: dict[int, float],
+                    run_key: str) -> tuple[list[MarketplaceAction], int]:
+    """Действия всех результатов и число пропущенных цен без изменений; календарные склеены по продукту."""
+    actions: list[MarketplaceAction] = []
+    # (магазин, продукт, акция) -> цены skuid для вставки; (магазин, продукт) -> удаление
+    calendar_adds: dict[tuple[int, int, int], dict[int, Optional[float]]] = {}
+    calendar_removes: dict[tuple[int, int], MarketplaceAction] = {}
+    noops = 0
+    for result in results:
+        sku = result.product.sku
+        last_price = last_prices.get(sku.sku_id)
+        if not result.error and sku.price.new is not None and sku.price.new == last_price:
+            noops += 1
+        for action in result_actions(result, last_price, run_key):
+            if action.kind == CALENDAR_EVENT_ADD:
+                calendar_adds.setdefault((action.shop_id, action.target_id, action.payload["calendar_event_id"]),
+                                         {}).update(action.payload["prices"])
+            elif action.kind == CALENDAR_EVENT_REMOVE:
+                calendar_removes.setdefault((action.shop_id, action.target_id), action)
+            else:
+                actions.append(action)
+    actions.extend(calendar_removes.values())
+    for (shop_id, product_id, calendar_event_id), prices in calendar_adds.items():
+        actions.append(MarketplaceAction(CALENDAR_EVENT_ADD, shop_id, product_id,
+                                         {"calendar_event_id": calendar_event_id, "prices": prices}, run_key))
+    return actions, noops
+
+
+def group_batches(actions: Iterable[MarketplaceAction], batch_size: int) -> dict[str, list[ActionBatch]]:
+    """вид -> пачки; в пачке действия одного магазина в порядке появления."""
+    grouped: dict[tuple[str, int], list[MarketplaceAction]] = defaultdict(list)
+    for action in actions:
+        grouped[action.kind, action.shop_id].append(action)
+    batches: dict[str, list[ActionBatch]] = defaultdict(list)
+    for (kind, shop_id), kind_actions in grouped.items():
+        for start in range(0, len(kind_actions), batch_size):
+            batches[kind].append(ActionBatch(kind, shop_id, kind_actions[start:start + batch_size]))
+    return batches
+
+
+class RateLimiter:
+    """Не больше rate запросов в секунду с запасом burst (token bucket) для event loop."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.clock = clock
+        self.tokens: float = self.burst
+        self.tokens_at = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.tokens_at) * self.rate)
+                self.tokens_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ApplyReport:
+    def __init__(self):
+        self.actions: defaultdict[str, int] = defaultdict(int)
+        self.skipped_noops = 0
+        self.sent_batches = 0
+        self.failed_batches = 0
+        self.retried = 0
+        self.failed_actions: list[MarketplaceAction] = []
+
+    def summary(self) -> str:
+        kinds = ", ".join(f"{kind} {self.actions[kind]}" for kind in APPLY_ORDER if self.actions[kind])
+        return (f"действий: {sum(self.actions.values())} ({kinds or 'нет'}), цен без изменений: {self.skipped_noops}, "
+                f"пачек: {self.sent_batches}, не отправлено: {self.failed_batches}, повторов: {self.retried}")
+
+
+class MarketplaceApplier:
+    """
+    Отправляет действия клиенту маркетплейса. client - корутина от ActionBatch (HttpMarketplaceClient
+    или обертка над keadapter); исключение - повтор с экспоненциальной паузой, MarketplaceRejected - без повтора.
+    Пачка, не отправленная после всех повторов, пишется в лог и попадает в ApplyReport.failed_actions.
+    """
+
+    def __init__(self, client: Client, batch_size: int = 100, max_concurrency: int = 4, rate: float = 5.0,
+                 retries: int = 3, retry_delay: float = 1.0):
+        self.client = client
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    async def apply(self, results: Iterable[CalculationResult], last_prices: dict[int, float],
+                    run_key: str) -> ApplyReport:
+        """
+        last_prices - текущие цены (load_last_prices); run_key отличает запуски друг от друга (например, дата
+        расчета): в пределах запуска ключи действий совпадают, и повторная отправка не дублирует изменения.
+        """
+        report = ApplyReport()
+        actions, report.skipped_noops = collect_actions(results, last_prices, run_key)
+        for action in actions:
+            report.actions[action.kind] += 1
+        batches = group_batches(actions, self.batch_size)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiters: dict[int, RateLimiter] = {}
+        for kind in APPLY_ORDER:
+            await asyncio.gather(*(self._send(batch, semaphore, limiters, report) for batch in batches.get(kind, ())))
+        return report
+
+    async def _send(self, batch: ActionBatch, semaphore: asyncio.Semaphore, limiters: dict[int, RateLimiter],
+                    report: ApplyReport):
+        limiter = limiters.get(batch.shop_id)
+        if limiter is None:
+            limiter = limiters[batch.shop_id] = RateLimiter(self.rate)
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                await limiter.acquire()
+                try:
+                    await self.client(batch)
+                    report.sent_batches += 1
+                    return
+                except Exception as e:
+                    if attempt == self.retries or isinstance(e, MarketplaceRejected):
+                        report.failed_batches += 1
+                        report.failed_actions.extend(batch.actions)
+                        logger.exception("Не удалось применить пачку %s магазина %s (%s действий)",
+                                         batch.kind, batch.shop_id, len(batch.actions))
+                        return
+                    report.retried += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+
+class HttpMarketplaceClient:
+    """
+    POST пачки в JSON на url с заголовком Idempotency-Key. 4xx, кроме 408 и 429, - MarketplaceRejected,
+    остальные ошибки повторяются.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0, headers: dict[str, str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    async def __call__(self, batch: ActionBatch):
+        await asyncio.get_running_loop().run_in_executor(None, self.post, batch)
+
+    def post(self, batch: ActionBatch):
+        request = urllib.request.Request(self.url, data=json.dumps(batch.to_dict(), ensure_ascii=False).encode(),
+                                         headers={**self.headers, "Idempotency-Key": batch.key}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                raise MarketplaceRejected(f"{e.code} {e.reason}") from e
+            raise
@@ -0,0 +1,46 @@
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+
+class AlgorithmMemo:
+    """
+    Кэш входных данных на время расчета одного skuid.
+    Каждое значение загружается не более одного раза; записи, зависящие от изменяемого состояния
+    (текущий бин - от last_price), сбрасываются явным invalidate при его изменении.
+    """
+
+    def __init__(self):
+        self.values: dict[Hashable, Any] = {}
+        self.dependents: dict[str, set[Hashable]] = defaultdict(set)
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def seed(self, key: Hashable, value: Any, depends_on: Iterable[str] = ()):
+        self.values[key] = value
+        for state in depends_on:
+            self.dependents[state].add(key)
+
+    def get(self, key: Hashable, loader: Callable[[], Any], depends_on: Iterable[str] = ()) -> Any:
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        value = loader()
+        self.seed(key, value, depends_on)
+        return value
+
+    async def aget(self, key: Hashable, loader: Callable[[], Awaitable[Any]], depends_on: Iterable[str] = ()) -> Any:
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        value = await loader()
+        self.seed(key, value, depends_on)
+        return value
+
+    def invalidate(self, state: str):
+        for key in self.dependents.pop(state, ()):
+            self.values.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
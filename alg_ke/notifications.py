@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import urllib.request
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from database.models import Shop
+
+logger = logging.getLogger(__name__)
+
+MESSAGE = "message"  # send_message: чат
+TASK = "task"  # add_to_tasks
+LOG = "log"  # add_to_logs
+
+NO_RESPONSIBLE_PERSON = "НЕ УКАЗАН ОТВЕТСТВЕННЫЙ"
+
+
+def responsible_person_username(shop: Shop) -> str:
+    return shop.responsible_person.username if shop.responsible_person else NO_RESPONSIBLE_PERSON
+
+
+class Notification:
+    __slots__ = ("kind", "shop_id", "recipient", "text")
+
+    def __init__(self, kind: str, shop_id: int, recipient: str, text: str):
+        self.kind = kind
+        self.shop_id = shop_id
+        self.recipient = recipient
+        self.text = text
+
+
+class Digest:
+    """Все уведомления одного вида для одного ответственного в одном магазине, собранные за один сброс."""
+    __slots__ = ("kind", "shop_id", "recipient", "texts")
+
+    def __init__(self, kind: str, shop_id: int, recipient: str):
+        self.kind = kind
+        self.shop_id = shop_id
+        self.recipient = recipient
+        self.texts: list[str] = []
+
+    @property
+    def text(self) -> str:
+        return "\n".join(text.rstrip("\n") for text in self.texts)
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "shop_id": self.shop_id, "recipient": self.recipient, "text": self.text,
+                "count": len(self.texts)}
+
+
+Transport = Callable[[Digest], Awaitable[None]]
+
+
+class HttpNotificationTransport:
+    """POST дайджеста в JSON на url; ответ не 2xx или ошибка сети - исключение, dispatcher повторит отправку."""
+
+    def __init__(self, url: str, timeout: float = 10.0, headers: dict[str, str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    async def __call__(self, digest: Digest):
+        await asyncio.get_running_loop().run_in_executor(None, self.post, digest.to_dict())
+
+    def post(self, payload: dict):
+        request = urllib.request.Request(self.url, data=json.dumps(payload, ensure_ascii=False).encode(),
+                                         headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class NotificationDispatcher:
+    """
+    Неблокирующая отправка send_message / add_to_tasks / add_to_logs. enqueue только кладет уведомление
+    в потокобезопасную очередь; фоновый поток раз в flush_interval секунд забирает очередь, склеивает
+    уведомления по (вид, магазин, ответственный) в дайджесты не длиннее max_digest_size строк и отправляет их
+    transport, не более max_concurrency одновременно, с retries повторами и экспоненциальной паузой.
+    Дайджест, не отправленный после всех повторов, пишется в лог и учитывается в failed_digests.
+    """
+
+    def __init__(self, transport: Transport, flush_interval: float = 5.0, max_digest_size: int = 50,
+                 max_concurrency: int = 4, retries: int = 3, retry_delay: float = 1.0):
+        self.transport = transport
+        self.flush_interval = flush_interval
+        self.max_digest_size = max_digest_size
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue: queue.SimpleQueue[Notification] = queue.SimpleQueue()
+        self.enqueued: int = 0
+        self.sent_digests: int = 0
+        self.failed_digests: int = 0
+        self.retried: int = 0
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+        self._flushed = threading.Condition()
+        self._flush_requests: int = 0
+        self._flushes_done: int = 0
+
+    def __enter__(self) -> "NotificationDispatcher":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def enqueue(self, kind: str, shop_id: int, recipient: str, text: str):
+        # пустые записи ("add_to_logs('')" в дереве) ничего не сообщают
+        if not text:
+            return
+        self.enqueued += 1
+        self.queue.put(Notification(kind, shop_id, recipient, text))
+
+    def start(self) -> "NotificationDispatcher":
+        if self._thread is None:
+            started = threading.Event()
+            self._thread = threading.Thread(target=self._thread_main, args=(started,),
+                                            name="notification-dispatcher", daemon=True)
+            self._thread.start()
+            started.wait()
+        return self
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Отправляет все, что уже в очереди, и ждет окончания отправки. False - не дождались за timeout."""
+        if self._thread is None:
+            self.start()
+        with self._flushed:
+            self._flush_requests += 1
+            request = self._flush_requests
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+            return self._flushed.wait_for(lambda: self._flushes_done >= request, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        if self._thread is None:
+            return
+        self._closing = True
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _thread_main(self, started: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._run(started))
+        finally:
+            self._loop.close()
+
+    async def _run(self, started: threading.Event):
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started.set()
+        while True:
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            with self._flushed:
+                flush_requests = self._flush_requests
+            digests = self.drain()
+            if digests:
+                await asyncio.gather(*(self._send(digest, semaphore) for digest in digests))
+            with self._flushed:
+                self._flushes_done = flush_requests
+                self._flushed.notify_all()
+            if self._closing and self.queue.empty():
+                return
+
+    def drain(self) -> list[Digest]:
+        digests: OrderedDict[tuple, list[Digest]] = OrderedDict()
+        while True:
+            try:
+                notification = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            key = notification.kind, notification.shop_id, notification.recipient
+            chunks = digests.setdefault(key, [])
+            if not chunks or len(chunks[-1].texts) >= self.max_digest_size:
+                chunks.append(Digest(*key))
+            chunks[-1].texts.append(notification.text)
+        return [digest for chunks in digests.values() for digest in chunks]
+
+    async def _send(self, digest: Digest, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    await self.transport(digest)
+                    self.sent_digests += 1
+                    return
+                except Exception:
+                    if attempt == self.retries:
+                        self.failed_digests += 1
+                        logger.exception("Не удалось отправить дайджест %s для %s (магазин %s, %s записей)",
+                                         digest.kind, digest.recipient, digest.shop_id, len(digest.texts))
+                        return
+                    self.retried += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    def stats(self) -> dict[str, int]:
+        return {"enqueued": self.enqueued, "sent_digests": self.sent_digests, "failed_digests": self.failed_digests,
+                "retried": self.retried}
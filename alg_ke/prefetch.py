@@ -0,0 +1,121 @@
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, selectinload
+
+from crud import convert_product_db
+from crud.algorithms.bin_ladder import BinLadder
+from crud.algorithms.calendar_index import CalendarEventIndex
+from crud.algorithms.competitor_cache import CompetitorCache
+from crud.algorithms.crud_batch import (competitors_query, last_timer_discounts, nearest_deliveries,
+                                        timer_discount_conditions)
+from crud.algorithms.instrumentation import AlgorithmInstrumentation
+from database import Bin, TimerDiscount
+from database.models import Competitor, Delivery, ShopProduct, Shop, Product as ProductDb
+
+IN_CLAUSE_CHUNK_SIZE = 5000
+
+
+def chunked(values: list, size: int = IN_CLAUSE_CHUNK_SIZE) -> Iterable[list]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class AlgorithmPrefetch:
+    """
+    Все данные, которые нужны AlgorithmDataForSku, загруженные пачкой для продукта или магазина.
+    Каждый набор - один запрос на чанк sku_id вместо запроса на каждый skuid.
+    """
+
+    def __init__(self, competitor_cache: Optional[CompetitorCache] = None):
+        # с competitor_cache конкуренты берутся из кэша процесса, а в БД идут только отсутствующие в нем skuid
+        self.competitor_cache = competitor_cache
+        self.competitors: dict[int, list[Competitor]] = defaultdict(list)
+        self.bin_ladders: dict[int, BinLadder] = {}
+        self.nearest_delivery: dict[int, Delivery] = {}
+        self.shop_product: dict[int, ShopProduct] = {}
+        self.timer_discount: dict[int, TimerDiscount] = {}
+        self.timer_discount_condition: dict[int, object] = {}
+        # sku_id, которым allocate_shop_timer_slots выделила акции с таймером; None - без распределения
+        self.timer_slots: Optional[frozenset[int]] = None
+        self.calendar_events = CalendarEventIndex()
+
+    @classmethod
+    async def for_product(cls, product_id: int, db: Session) -> "AlgorithmPrefetch":
+        sku_list = db.query(ProductDb).filter(ProductDb.product_id == product_id).all()
+        return await cls.for_sku_list(sku_list, db)
+
+    @classmethod
+    async def for_shop(cls, shop_id: int, db: Session) -> "AlgorithmPrefetch":
+        sku_list = db.query(ProductDb).filter(ProductDb.shop_id == shop_id).all()
+        return await cls.for_sku_list(sku_list, db)
+
+    @classmethod
+    async def for_sku_list(cls, sku_list: list[ProductDb], db: Session,
+                           instrumentation: Optional[AlgorithmInstrumentation] = None,
+                           competitor_cache: Optional[CompetitorCache] = None) -> "AlgorithmPrefetch":
+        prefetch = cls(competitor_cache)
+        sku_ids = [sku.sku_id for sku in sku_list]
+        if instrumentation is None:
+            for chunk in chunked(sku_ids):
+                prefetch.load_competitors(chunk, db)
+                prefetch.load_bins(chunk, db)
+                prefetch.load_nearest_deliveries(chunk, db)
+                prefetch.load_timer_discounts(chunk, db)
+                await prefetch.load_timer_discount_conditions(chunk, db)
+            prefetch.load_shop_products(sku_list, db)
+            prefetch.load_calendar_events(sku_list, db)
+            return prefetch
+
+        for chunk in chunked(sku_ids):
+            for loader in (prefetch.load_competitors, prefetch.load_bins, prefetch.load_nearest_deliveries,
+                           prefetch.load_timer_discounts):
+                with instrumentation.crud_call(f"AlgorithmPrefetch.{loader.__name__}"):
+                    loader(chunk, db)
+            await instrumentation.acrud_call("AlgorithmPrefetch.load_timer_discount_conditions",
+                                             prefetch.load_timer_discount_conditions(chunk, db))
+        with instrumentation.crud_call("AlgorithmPrefetch.load_shop_products"):
+            prefetch.load_shop_products(sku_list, db)
+        with instrumentation.crud_call("AlgorithmPrefetch.load_calendar_events"):
+            prefetch.load_calendar_events(sku_list, db)
+        return prefetch
+
+    def load_competitors(self, sku_ids: list[int], db: Session):
+        if self.competitor_cache is not None:
+            self.competitors.update(self.competitor_cache.warm_up(sku_ids, db))
+            return
+        for competitor in competitors_query(sku_ids, db):
+            self.competitors[competitor.sku_id].append(competitor)
+
+    def load_bins(self, sku_ids: list[int], db: Session):
+        bins: dict[int, list[Bin]] = defaultdict(list)
+        for bin_db in db.query(Bin).filter(Bin.sku_id.in_(sku_ids)):
+            bins[bin_db.sku_id].append(bin_db)
+        for sku_id in sku_ids:
+            self.bin_ladders[sku_id] = BinLadder(bins.get(sku_id, []))
+
+    def load_nearest_deliveries(self, sku_ids: list[int], db: Session):
+        self.nearest_delivery.update(nearest_deliveries(sku_ids, db))
+
+    def load_timer_discounts(self, sku_ids: list[int], db: Session):
+        self.timer_discount.update(last_timer_discounts(sku_ids, db))
+
+    async def load_timer_discount_conditions(self, sku_ids: list[int], db: Session):
+        self.timer_discount_condition.update(await timer_discount_conditions(sku_ids, db))
+
+    def load_shop_products(self, sku_list: list[ProductDb], db: Session):
+        by_shop: dict[Shop, list[ProductDb]] = defaultdict(list)
+        for sku in sku_list:
+            by_shop[sku.shop].append(sku)
+        for shop, skus in by_shop.items():
+            shop_products: list[ShopProduct] = convert_product_db(skus, shop, db)
+            self.shop_product.update(zip((sku.sku_id for sku in skus), shop_products))
+
+    def load_calendar_events(self, sku_list: list[ProductDb], db: Session):
+        unloaded = [sku.sku_id for sku in sku_list if "participations_in_calendar_event" in inspect(sku).unloaded]
+        for chunk in chunked(unloaded):
+            # skuid уже в сессии: запрос только догружает их участия, остальные поля не перечитываются
+            db.query(ProductDb).filter(ProductDb.sku_id.in_(chunk)).options(
+                selectinload(ProductDb.participations_in_calendar_event)).all()
+        self.calendar_events = CalendarEventIndex.build(sku_list)
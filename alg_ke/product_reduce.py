@@ -0,0 +1,73 @@
+from typing import Callable, Optional
+
+from database.models import Product as ProductDb
+
+# продуктовые проверки, которые в двухфазном режиме откладываются до reduce
+CALENDAR_PRICE_FOR_EVERY_SKU = "calendar_price_for_every_sku"  # is_price_for_calendar_event_calculated_for_every_sku_in_product
+PRICE_FOR_EVERY_SKU = "price_for_every_sku"  # is_price_calculated_for_every_sku_in_product
+
+_UNSET = object()
+
+
+class DeferredProductCheck:
+    __slots__ = ("kind", "on_true", "on_false")
+
+    def __init__(self, kind: str, on_true: Callable[[], None], on_false: Callable[[], None]):
+        self.kind = kind
+        self.on_true = on_true
+        self.on_false = on_false
+
+
+class SkuPhaseResult:
+    __slots__ = ("product_db", "product_db_data", "deferred", "price_for_product")
+
+    def __init__(self, product_db: ProductDb, product_db_data):
+        self.product_db = product_db
+        self.product_db_data = product_db_data
+        self.deferred: Optional[DeferredProductCheck] = None
+        self.price_for_product = _UNSET
+
+
+class ProductReduce:
+    """
+    Вторая фаза двухфазного расчета продукта. На первой фазе skuid считаются независимо: продуктовые проверки
+    и set_new_price_for_product (метка 9) только записываются. reduce за один проход применяет их с той же
+    семантикой, что и последовательный расчет:
+    - "цена для акции подсчитана для всех skuid" для skuid k истинна, если она есть у всех skuid до него;
+    - "цена подсчитана для всех skuid" истинна только для последнего skuid продукта;
+    - set_new_price_for_product в skuid k меняет цену skuid до него, последний такой вызов побеждает.
+    Все такие проверки и вызовы стоят в конце веток, поэтому их откладывание не меняет ни путь, ни остальные решения.
+    """
+
+    def __init__(self):
+        self.skus: list[SkuPhaseResult] = []
+
+    def add_sku(self, product_db: ProductDb, product_db_data):
+        self.skus.append(SkuPhaseResult(product_db, product_db_data))
+
+    def defer(self, kind: str, on_true: Callable[[], None], on_false: Callable[[], None]):
+        self.skus[-1].deferred = DeferredProductCheck(kind, on_true, on_false)
+
+    def set_price_for_product(self, value: Optional[float]):
+        self.skus[-1].price_for_product = value
+
+    def apply(self, algorithm):
+        calendar_prices_so_far = True
+        last = len(self.skus) - 1
+        for i, sku in enumerate(self.skus):
+            if sku.deferred is not None:
+                algorithm.restore_sku(sku.product_db, sku.product_db_data)
+                calculated = calendar_prices_so_far if sku.deferred.kind == CALENDAR_PRICE_FOR_EVERY_SKU else i == last
+                if algorithm.run_product_check(sku.deferred.kind, calculated):
+                    sku.deferred.on_true()
+                else:
+                    sku.deferred.on_false()
+            calendar_prices_so_far = calendar_prices_so_far and \
+                bool(sku.product_db_data.result.product.sku.price.for_calendar_event)
+
+        price = _UNSET
+        for sku in reversed(self.skus):
+            if price is not _UNSET:
+                sku.product_db_data.result.product.sku.price.new = price
+            elif sku.price_for_product is not _UNSET:
+                price = sku.price_for_product
@@ -1,7 +1,5 @@
-from sqlalchemy.util import asyncio
 from database.models import Competitor, CompetitorSale
 from crud.algorithms.models import CheckResult
-from crud.bin import get_lower_bin, get_upper_bin, get_upper_bin_by_competitor
 from datetime import datetime
 import math
 
@@ -15,14 +13,11 @@ class ProfitIncreaseAlgorithm:
 
     def add_to_path(func):
         def wrapper(self, *args, **kwargs):
-            result: CheckResult = func(self, *args, **kwargs)
-            if result.path is not None:
-                self.main_algo.result.path += result.path
-            if result.text is not None:
-                self.main_algo.result.text += result.text
-            if result.full_text is not None:
-                self.main_algo.result.text = result.full_text
-            return result.result
+            instrumentation = self.main_algo.instrumentation
+            if instrumentation is None:
+                return self.main_algo.product_db_data.trace.apply(func(self, *args, **kwargs))
+            with instrumentation.check(func.__qualname__):
+                return self.main_algo.product_db_data.trace.apply(func(self, *args, **kwargs))
 
         return wrapper
 
@@ -37,29 +32,32 @@ class ProfitIncreaseAlgorithm:
 
     @add_to_path
     def more_then_eight_positions(self):
-        if self.competitor_db.search_position - self.main_algo.product_db.search_position > 8: # ??? > или >= ?
-            return CheckResult(full_text="Наша позиция выше конкурента на более чем 8 позиций",
+        position_lead = self.main_algo.strategy.position_lead
+        if self.competitor_db.search_position - self.main_algo.product_db.search_position > position_lead: # ??? > или >= ?
+            return CheckResult(full_text=f"Наша позиция выше конкурента на более чем {position_lead} позиций",
                                result=True)
         else:
-            return CheckResult(full_text="Наша позиция выше конкурента на менее или равно 8 позициям",
+            return CheckResult(full_text=f"Наша позиция выше конкурента на менее или равно {position_lead} позициям",
                                result=False) 
 
     @add_to_path
     def date_change_price_competitor_more_then_three_days(self):
-        if (datetime.now().date() - self.competitor_db.price_change_date).days > 3:
-            return CheckResult(full_text="С даты изменения цены у конкурента прошло 3 и более дня",
+        days = self.main_algo.strategy.competitor_price_age_days
+        if (datetime.now().date() - self.competitor_db.price_change_date).days > days:
+            return CheckResult(full_text=f"С даты изменения цены у конкурента прошло {days} и более дня",
                                result=True)
         else:
-            return CheckResult(full_text="С даты изменения цены у конкурента НЕ прошло 3 и более дня",
+            return CheckResult(full_text=f"С даты изменения цены у конкурента НЕ прошло {days} и более дня",
                                result=False)
 
     @add_to_path
     def date_change_price_competitor_more_then_two_days(self):
-        if (datetime.now().date() - self.competitor_db.price_change_date).days > 2:
-            return CheckResult(full_text="С даты изменения цены у конкурента прошло 2 и более дня",
+        days = self.main_algo.strategy.competitor_price_age_days_short
+        if (datetime.now().date() - self.competitor_db.price_change_date).days > days:
+            return CheckResult(full_text=f"С даты изменения цены у конкурента прошло {days} и более дня",
                                result=True)
         else:
-            return CheckResult(full_text="С даты изменения цены у конкурента НЕ прошло 2 и более дня",
+            return CheckResult(full_text=f"С даты изменения цены у конкурента НЕ прошло {days} и более дня",
                                result=False)
 
     @add_to_path
@@ -80,74 +78,78 @@ class ProfitIncreaseAlgorithm:
 
     @add_to_path
     def our_price_greater_then_competitor_more_then_ten_perc(self):
-        if (self.main_algo.product_db.last_price / self.main_algo.product_db_data.competitors[0].price) >= 1.1:
-            return CheckResult(path="Наша цена > цены конкурента на более чем 10%",
+        strategy = self.main_algo.strategy
+        overprice = strategy.percent("competitor_overprice_ratio")
+        if (self.main_algo.product_db.last_price / self.main_algo.product_db_data.competitors[0].price) >= \
+                strategy.competitor_overprice_ratio:
+            return CheckResult(path=f"Наша цена > цены конкурента на более чем {overprice}",
                                result=True)
         else:
-            return CheckResult(path="Наша цена <= цены конкурента на более чем 10%",
+            return CheckResult(path=f"Наша цена <= цены конкурента на более чем {overprice}",
                                result=False)
 
-    def run(self):
+    async def run(self):
+        strategy = self.main_algo.strategy
         if self.main_algo.has_best_competitor_link_and_stock():
             self.competitor_db = self.main_algo.product_db_data.competitors[0]
             if self.our_position_is_higher_then_competitor():
                 if self.more_then_eight_positions():
                     if self.is_our_sales_speed__greater_than__competitor_sales_speed():
                         if self.date_change_price_competitor_more_then_three_days():
-                            self.main_algo.set_new_price(math.ceil(self.main_algo.product_db.last_price * 1.02)) # по алго вроде как нужно 2% Поднимать, поднял просто бин выше текущего
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена =  действующая цена, увеличенная на 2% с округлением вверх\n'
-                                                                           '2. Начало метки "3B."\n')
+                            self.main_algo.set_new_price(math.ceil(self.main_algo.product_db.last_price * strategy.last_price_up_fast)) # по алго вроде как нужно 2% Поднимать, поднял просто бин выше текущего
+                            self.main_algo.add_text(f'1. Целевая цена =  действующая цена, увеличенная на {strategy.percent("last_price_up_fast")} с округлением вверх\n'
+                                                    '2. Начало метки "3B."\n')
                             self.main_algo.update_mark("3B")
                         else:
-                            new_bin = get_upper_bin_by_competitor(self.main_algo.product_db.sku_id, self.competitor_db, self.main_algo.db)
+                            new_bin = self.main_algo.product_db_data.bin_ladder.upper_by_competitor(self.competitor_db.price)
                             self.main_algo.set_new_price(new_bin.to_value)
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена = цена на бин выше, чем у конкурента\n'
-                                                                           '2. Начало метки "3C."\n')
+                            self.main_algo.add_text('1. Целевая цена = цена на бин выше, чем у конкурента\n'
+                                                    '2. Начало метки "3C."\n')
                             self.main_algo.update_mark("3C")
                     else:
                         if self.date_change_price_competitor_more_then_three_days():
                             if self.is_best_competitor_price__greater__then_our_price():
                                 self.main_algo.set_new_price(math.floor(self.competitor_db.price-1))
-                                self.main_algo.product_db_data.result.text += ('Конкурент ниже в выдаче с более высокой ценой подобную \
+                                self.main_algo.add_text('Конкурент ниже в выдаче с более высокой ценой подобную \
                                                                                 позицию продает чаще, чем мы. Отметить управляющего магазина.')
                                 self.main_algo.update_mark("3D")
                             else:
                                 if self.our_price_greater_then_competitor_more_then_ten_perc():
-                                    '''Целевая цена =  выше лучшего конкурента на 9%, округленную вниз. Метка ветки: "3E."'''
-                                    self.main_algo.set_new_price(math.floor(self.competitor_db.price * 1.09))
+                                    '''Целевая цена =  выше лучшего конкурента на competitor_markup, округленную вниз. Метка ветки: "3E."'''
+                                    self.main_algo.set_new_price(math.floor(self.competitor_db.price * strategy.competitor_markup))
                                     self.main_algo.update_mark("3E")
                                 else:
-                                    self.main_algo.set_new_price(math.floor(self.main_algo.product_db.last_price * 0.99))
-                                    self.main_algo.product_db_data.result.text += ('1. Нашу действующую цену уменьшаем на 1%\n'
-                                                                                   '2. Начало метки "3F."\n')
+                                    self.main_algo.set_new_price(math.floor(self.main_algo.product_db.last_price * strategy.last_price_down))
+                                    self.main_algo.add_text(f'1. Нашу действующую цену уменьшаем на {strategy.percent("last_price_down")}\n'
+                                                            '2. Начало метки "3F."\n')
                                     self.main_algo.update_mark("3F")
                         else:
                             self.main_algo.set_new_price(self.competitor_db.price)
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена = цена конкурента\n'
-                                                                           '2. Начало метки "3G."\n')
+                            self.main_algo.add_text('1. Целевая цена = цена конкурента\n'
+                                                    '2. Начало метки "3G."\n')
                             self.main_algo.update_mark("3G")
                 else:
                     if self.is_our_sales_speed__greater_than__competitor_sales_speed():
                         if self.date_change_price_competitor_more_then_three_days():
-                            self.main_algo.set_new_price(math.ceil(self.main_algo.product_db.last_price * 1.01))
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена = ОКРУГЛВВЕРХ(действующая цена + 1%)\n'
-                                                                           '2. Начало метки "3H."\n')
+                            self.main_algo.set_new_price(math.ceil(self.main_algo.product_db.last_price * strategy.last_price_up))
+                            self.main_algo.add_text(f'1. Целевая цена = ОКРУГЛВВЕРХ(действующая цена + {strategy.percent("last_price_up")})\n'
+                                                    '2. Начало метки "3H."\n')
                             self.main_algo.update_mark("3H")
                         else:
                             self.main_algo.set_new_price(math.floor(self.competitor_db.price))
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена = цена конкурента\n'
-                                                                           '2. Начало метки "3I."\n')
+                            self.main_algo.add_text('1. Целевая цена = цена конкурента\n'
+                                                    '2. Начало метки "3I."\n')
                             self.main_algo.update_mark("3I")
                     else:
                         if self.date_change_price_competitor_more_then_three_days():
-                            self.main_algo.set_new_price(math.floor(self.main_algo.product_db.last_price * 0.98))
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена = ОКРУГЛВНИЗ(действующая цена - 2%)\n'
-                                                                           '2. Начало метки "3J."\n')
+                            self.main_algo.set_new_price(math.floor(self.main_algo.product_db.last_price * strategy.last_price_down_fast))
+                            self.main_algo.add_text(f'1. Целевая цена = ОКРУГЛВНИЗ(действующая цена - {strategy.percent("last_price_down_fast")})\n'
+                                                    '2. Начало метки "3J."\n')
                             self.main_algo.update_mark("3J")
                         else:
                             self.main_algo.set_new_price(math.floor(self.competitor_db.price-1))
-                            self.main_algo.product_db_data.result.text += ('1. Целевая цена = ОКРУГЛВНИЗ(цена конкурента - 1 руб)\n'
-                                                                           '2. Начало метки "3K."\n')
+                            self.main_algo.add_text('1. Целевая цена = ОКРУГЛВНИЗ(цена конкурента - 1 руб)\n'
+                                                    '2. Начало метки "3K."\n')
                             self.main_algo.update_mark("3K")
             else:
                 if self.is_our_sales_speed__greater_than__competitor_sales_speed():
@@ -155,32 +157,32 @@ class ProfitIncreaseAlgorithm:
                     percent = (100 + self.competitor_db.last_delta_between_us_and_cmp)/100
                     new_price = math.ceil(self.competitor_db.price * percent)
                     self.main_algo.set_new_price(new_price)
-                    self.main_algo.product_db_data.result.text += (f'1. Целевая цена = ОКРУГЛВВЕРХ(цена конкурента*(100 + дельта)%) ({self.competitor_db.price} * {percent})\n'
-                                                                   '2. Начало метки "3L."\n')
+                    self.main_algo.add_text(f'1. Целевая цена = ОКРУГЛВВЕРХ(цена конкурента*(100 + дельта)%) ({self.competitor_db.price} * {percent})\n'
+                                            '2. Начало метки "3L."\n', intern=False)
                     self.main_algo.update_mark("3L")            
                 else:
                     self.competitor_db.last_delta_between_us_and_cmp = self.competitor_db.last_delta_between_us_and_cmp - 1
                     percent = (100 + self.competitor_db.last_delta_between_us_and_cmp) / 100
                     new_price = math.ceil(self.competitor_db.price * percent)
                     self.main_algo.set_new_price(new_price)
-                    self.main_algo.product_db_data.result.text += (f'1. Целевая цена = ОКРУГЛВНИЗ(цена конкурента*(100 + дельта)%) ({self.competitor_db.price} * {percent})\n'
-                                                                   '2. Начало метки "3N."\n')
+                    self.main_algo.add_text(f'1. Целевая цена = ОКРУГЛВНИЗ(цена конкурента*(100 + дельта)%) ({self.competitor_db.price} * {percent})\n'
+                                            '2. Начало метки "3N."\n', intern=False)
                     self.main_algo.update_mark("3N")
         else:
-            if self.main_algo.has_info_about_deliveries():
+            if await self.main_algo.has_info_about_deliveries():
                 self.main_algo.minimization_overlap_oos_date_and_delivery_date() # set_new_price уже применяется внутри
-                self.main_algo.product_db_data.result.text += ('1. Выбираем бин, который приведет к минимизации срока ухода в OOS\n'
-                                                               '2. Начало метки "3A2."\n')
+                self.main_algo.add_text('1. Выбираем бин, который приведет к минимизации срока ухода в OOS\n'
+                                        '2. Начало метки "3A2."\n')
                 self.main_algo.update_mark("3A1")
             else:
-                new_bin = asyncio.run(get_upper_bin(self.main_algo.product_db, self.main_algo.db))
-                self.main_algo.product_db_data.result.text += ('1. Выбираем бин ниже текущего\n'
-                                                               '2. Начало метки "3A2."\n')
+                new_bin = self.main_algo.product_db_data.bin_ladder.upper(self.main_algo.product_db.last_price)
+                self.main_algo.add_text('1. Выбираем бин ниже текущего\n'
+                                        '2. Начало метки "3A2."\n')
                 self.main_algo.set_mark("3A2")
                 self.main_algo.set_new_price(new_bin.to_value)
 
         if self.main_algo.product_db_data.result.product.sku.price.new > self.main_algo.product_db.min_price:
             self.main_algo.set_new_price(self.main_algo.product_db_data.result.product.sku.price.new)
-            self.main_algo.product_db_data.result.text += ('Сохраняем бин, как планируемая цена к изменению.\n')
+            self.main_algo.add_text('Сохраняем бин, как планируемая цена к изменению.\n')
 
-        self.sales_acceleration_algorithm.work_with_calendar_events_and_timer_discounts()
+        await self.sales_acceleration_algorithm.work_with_calendar_events_and_timer_discounts()
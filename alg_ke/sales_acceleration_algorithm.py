@@ -2,16 +2,13 @@ import datetime
 from typing import Union, Optional
 
 from kazexapi.request.discount.models import Conditions
-from sqlalchemy.util import asyncio
 
 from crud.algorithms.models import CheckResult
-from crud.bin import get_lower_bin, get_lower_bin_by_competitor
+from crud.algorithms.product_reduce import CALENDAR_PRICE_FOR_EVERY_SKU, PRICE_FOR_EVERY_SKU
+from crud.algorithms.strategy import MIN_TIME_BETWEEN_PRICE_CHANGING
 from database import Bin
 from utils import dt
 
-MIN_TIME_BETWEEN_PRICE_CHANGING = 60 * 60  # час
-
-
 class SalesAccelerationAlgorithm:
     def __init__(self, main_algo):
         super().__init__()
@@ -22,14 +19,11 @@ class SalesAccelerationAlgorithm:
 
     def add_to_path(func):
         def wrapper(self, *args, **kwargs):
-            result: CheckResult = func(self, *args, **kwargs)
-            if result.path is not None:
-                self.main_algo.product_db_data.result.path += result.path
-            if result.text is not None:
-                self.main_algo.product_db_data.result.text += result.text
-            if result.full_text is not None:
-                self.main_algo.product_db_data.result.text = result.full_text
-            return result.result
+            instrumentation = self.main_algo.instrumentation
+            if instrumentation is None:
+                return self.main_algo.product_db_data.trace.apply(func(self, *args, **kwargs))
+            with instrumentation.check(func.__qualname__):
+                return self.main_algo.product_db_data.trace.apply(func(self, *args, **kwargs))
 
         return wrapper
 
@@ -53,17 +47,14 @@ class SalesAccelerationAlgorithm:
 
     @add_to_path
     def is_in_top100search_results_of_calendar_event(self):
-        involved_calendar_events = [p for p in self.main_algo.product_db.participations_in_calendar_event if p.is_involved is True]
-        if involved_calendar_events:
-            position = involved_calendar_events[0].search_position
-            if position and position <= 100:  # TODO: сделать запрос и добавить поле в продукт
-                return CheckResult(path="skuid находится в топ 100 выдачи распродажи/подборки,",
-                                   result=True)
+        if self.main_algo.calendar_event().in_top100:  # TODO: сделать запрос и добавить поле в продукт
+            return CheckResult(path="skuid находится в топ 100 выдачи распродажи/подборки,",
+                               result=True)
         return CheckResult(path="skuid НЕ находится в топ 100 выдачи распродажи/подборки,",
                            result=False)
 
     @add_to_path
-    def is_price_calculated_for_every_sku_in_product(self):
+    def is_price_calculated_for_every_sku_in_product(self, calculated: Optional[bool] = None):
         # for product in self.main_algo.sku_list:
         #     if product.sku_id != self.main_algo.product_db.sku_id and \
         #             (dt.now() - dt.with_tz(product.price_update_datetime)).days >= MIN_TIME_BETWEEN_PRICE_CHANGING:
@@ -71,7 +62,10 @@ class SalesAccelerationAlgorithm:
         #                            result=False)
         # return CheckResult(path="Для всех skuid одного prodid подсчитана цена,",
         #                    result=True)
-        if self.main_algo.sku_list[-1].sku_id == self.main_algo.product_db.sku_id and self.main_algo.ran_for_product:
+        if calculated is None:
+            calculated = self.main_algo.sku_list[-1].sku_id == self.main_algo.product_db.sku_id and \
+                         self.main_algo.ran_for_product
+        if calculated:
             return CheckResult(path="Для всех skuid одного prodid подсчитана цена,", result=True)
         else:
             return CheckResult(path="НЕ для всех skuid одного prodid подсчитана цена,", result=False)
@@ -85,9 +79,23 @@ class SalesAccelerationAlgorithm:
             return CheckResult(path=f"Все акции с таймером заняты,",
                                result=False)
 
+    @add_to_path
+    def has_timer_discount_slot(self):
+        if self.main_algo.product_db_data.timer_slot:
+            return CheckResult(path=f"skuid выделена акция с таймером,", result=True)
+        else:
+            return CheckResult(path=f"Акции с таймером выделены другим skuid,", result=False)
+
+    def may_take_timer_discount(self) -> bool:
+        # без распределения (timer_slot is None) skuid берет свободную акцию, как и раньше
+        return self.main_algo.product_db_data.timer_slot is None or self.has_timer_discount_slot()
+
+    def timer_discount_slot_taken(self):
+        self.main_algo.add_text('Акции с таймером магазина выделены другим skuid\n')
+        self.main_algo.update_mark("7")
+
     @add_to_path
     def is_max_price_timer_discount__greater_then__new_price(self):
-        print(self.main_algo.product_db_data.result.product.sku.price.new, flush=True)
         if self.main_algo.product_db_data.timer_discount_condition.max_price > self.main_algo.product_db_data.result.product.sku.price.new:
             return CheckResult(path=f"Максимальная цена акции > планируемая цена,",
                                result=True)
@@ -106,7 +114,7 @@ class SalesAccelerationAlgorithm:
 
     @add_to_path
     def is_max_price_calendar_event__greater_then__new_price(self):
-        rp = self.main_algo.product_db.most_suitable_calendar_event.recommended_price
+        rp = self.main_algo.calendar_event().recommended_price
         if rp > self.main_algo.product_db_data.result.product.sku.price.new:
             return CheckResult(path=f"Максимальная цена акции > планируемая цена,",
                                result=True)
@@ -116,7 +124,7 @@ class SalesAccelerationAlgorithm:
 
     @add_to_path
     def is_max_price_calendar_event__greater_then__min_price(self):
-        rp = self.main_algo.product_db.most_suitable_calendar_event.recommended_price
+        rp = self.main_algo.calendar_event().recommended_price
         if rp > self.main_algo.product_db.min_price:
             return CheckResult(path=f"Максимальная цена акции > минимальная цена,",
                                result=True)
@@ -127,83 +135,97 @@ class SalesAccelerationAlgorithm:
 
     @add_to_path
     def is_sku_in_timer_discount_more_then_23_hours(self):
-        if (self.main_algo.product_db.on_timer_discount) and ((datetime.datetime.now() - self.main_algo.product_db_data.timer_discount.date_start).hours >= 23):
-            return CheckResult(path="sku в скидке по таймеру более 23х часов,", result=True)
+        hours = self.main_algo.strategy.timer_discount_hours
+        timer_discount = self.main_algo.product_db_data.timer_discount
+        # без записи об акции или ее начала срок неизвестен - ждем окончания акции
+        if self.main_algo.product_db.on_timer_discount and timer_discount is not None and \
+                timer_discount.date_start is not None and \
+                datetime.datetime.now() - timer_discount.date_start >= datetime.timedelta(hours=hours):
+            return CheckResult(path=f"sku в скидке по таймеру более {hours}х часов,", result=True)
         else:
             # self.product_db_data.result.product.sku.price.new = self.product_db.min_price
-            return CheckResult(path="sku в скидке по таймеру менее 23х часов,", result=False)
+            return CheckResult(path=f"sku в скидке по таймеру менее {hours}х часов,", result=False)
+
+    def get_lower_bin(self) -> Optional[Bin]:
+        return self.main_algo.product_db_data.bin_ladder.lower(self.main_algo.product_db.last_price,
+                                                               self.main_algo.product_db.min_price)
 
-    def run(self):
+    def get_lower_bin_by_competitor(self) -> Optional[Bin]:
+        return self.main_algo.product_db_data.bin_ladder.lower_by_competitor(
+            self.main_algo.product_db_data.competitors[0].price, self.main_algo.product_db.min_price)
+
+    async def run(self):
         if self.main_algo.has_best_competitor_link_and_stock():
             if self.main_algo.is_best_competitor_sales_speed__greater_than__our_sales_speed():
                 if self.is_best_competitor_price__greater__then_our_price():
-                    new_bin = asyncio.run(get_lower_bin(self.main_algo.product_db, self.main_algo.db))
-                    self.main_algo.product_db_data.result.text += ('1. Выбираем бин ниже текущего\n'
-                                                                   '2. Начало метки "2C."\n')
+                    new_bin = self.get_lower_bin()
+                    self.main_algo.add_text('1. Выбираем бин ниже текущего\n'
+                                            '2. Начало метки "2C."\n')
                     self.main_algo.set_mark("2С")
                 else:
-                    new_bin = asyncio.run(
-                        get_lower_bin_by_competitor(self.main_algo.product_db.sku_id, self.main_algo.competitors[0],
-                                                    self.main_algo.db))
-                    self.main_algo.product_db_data.result.text += ('1. Выбираем бин ниже текущего\n'
-                                                                   '2. Начало метки "2D."\n')
+                    new_bin = self.get_lower_bin_by_competitor()
+                    self.main_algo.add_text('1. Выбираем бин ниже текущего\n'
+                                            '2. Начало метки "2D."\n')
                     self.main_algo.set_mark("2D")
             else:
                 self.main_algo.send_message('Продаем быстрее, ставим цену на бин ниже.')
                 """
                 Оповещаем в чат о том, что продаем быстрее и собираемся понизить цену. Логика в том, что возможно план высокий по продажам, либо конкурент не тот
                 """
-                self.main_algo.product_db_data.result.text += ('Оповещаем в чат о том, что продаем быстрее и собираемся понизить цену\n'
-                                                               '1. Выбираем бин ниже текущего\n'
-                                                               '2. Начало метки "2B."\n')
-                new_bin = asyncio.run(get_lower_bin(self.main_algo.product_db, self.main_algo.db))
+                self.main_algo.add_text('Оповещаем в чат о том, что продаем быстрее и собираемся понизить цену\n'
+                                        '1. Выбираем бин ниже текущего\n'
+                                        '2. Начало метки "2B."\n')
+                new_bin = self.get_lower_bin()
                 self.main_algo.set_mark("2B")
         else:
-            new_bin = asyncio.run(get_lower_bin(self.main_algo.product_db, self.main_algo.db))
-            self.main_algo.product_db_data.result.text += ('1. Выбираем бин ниже текущего\n'
-                                                           '2. Начало метки "2A."\n')
+            new_bin = self.get_lower_bin()
+            self.main_algo.add_text('1. Выбираем бин ниже текущего\n'
+                                    '2. Начало метки "2A."\n')
             self.main_algo.set_mark("2A")
 
         if self.is_new_bin__greater_then__min_price(new_bin):
             self.main_algo.set_new_price(new_bin.to_value)
         else:
             self.main_algo.set_new_price(self.main_algo.product_db.min_price)
-            self.main_algo.product_db_data.result.text += ('1. Сохраняем min цену для как планируемую к изменению для skuid\n'
-                                                           '2. Начало метки "2MIN."\n')
+            self.main_algo.add_text('1. Сохраняем min цену для как планируемую к изменению для skuid\n'
+                                    '2. Начало метки "2MIN."\n')
             self.main_algo.set_mark("2MIN")
 
-        self.work_with_calendar_events_and_timer_discounts()
+        await self.work_with_calendar_events_and_timer_discounts()
 
-    def work_with_calendar_events_and_timer_discounts(self):
+    async def work_with_calendar_events_and_timer_discounts(self):
         if self.main_algo.is_sku_in_calendar_event():
             if self.is_in_top100search_results_of_calendar_event():
                 self.main_algo.send_message(f'Сегодня ничего не делаем со всеми {self.main_algo.product_db.sku_id} этого {self.main_algo.product_db.product_id}')
                 """Оповещаем в чат и ничего не делаем со всем skuid одного prodid в этот день"""
-                self.main_algo.product_db_data.result.text += ('1. Оповещаем в чат и ничего не делаем со всем skuid одного prodid в этот день\n'
-                                                               '2. Конец метки 1\n')
+                self.main_algo.add_text('1. Оповещаем в чат и ничего не делаем со всем skuid одного prodid в этот день\n'
+                                        '2. Конец метки 1\n')
                 self.main_algo.update_mark("1")
             else:
-                if self.is_price_calculated_for_every_sku_in_product():
+                def reinsert_product_into_calendar_event():
                     self.main_algo.remove_product_from_calendar_event()
                     self.main_algo.add_product_to_calendar_event()
                     """убираем из распродажи и вставляем заново prodid"""
-                    self.main_algo.product_db_data.result.text += ('Убираем из распродажи и вставляем заново prodid\n')
+                    self.main_algo.add_text('Убираем из распродажи и вставляем заново prodid\n')
                     self.main_algo.update_mark("2")
-                else:
+
+                def go_to_next_sku():
                     """Переходим к подсчетам для следующего skuid, относящего к одному prodid"""
                     self.main_algo.set_new_price(None)
-                    self.main_algo.product_db_data.result.text += ('Переходим к подсчетам для следующего skuid, относящего к одному prodid\n')
+                    self.main_algo.add_text('Переходим к подсчетам для следующего skuid, относящего к одному prodid\n')
+
+                self.main_algo.product_check(PRICE_FOR_EVERY_SKU, reinsert_product_into_calendar_event, go_to_next_sku)
         else:
             if self.main_algo.is_sku_in_timer_discount():
-                if self.is_sku_in_timer_discount_more_then_23_hours:
+                if self.is_sku_in_timer_discount_more_then_23_hours():
                     '''Вынимаем из акции, и меняем цену на планируемую без повторного вхождения в акцию с таймером.'''
                     self.main_algo.remove_sku_from_timer_discount(self.main_algo.product_db_data.timer_discount.discount_id)
                     self.main_algo.set_new_price(self.main_algo.product_db_data.result.product.sku.price.new)
-                    self.main_algo.product_db_data.result.text += ('Вынимаем из акции и меняем цену на планируемую без повторного вхождения в акцию с таймером.\n')
+                    self.main_algo.add_text('Вынимаем из акции и меняем цену на планируемую без повторного вхождения в акцию с таймером.\n')
                     self.main_algo.update_mark("3B")
                 else:
                     """Ничего не делаем, дожидаемся завершения акции с таймером"""
-                    self.main_algo.product_db_data.result.text += ('Ничего не делаем, дожидаемся завершения акции с таймером\n')
+                    self.main_algo.add_text('Ничего не делаем, дожидаемся завершения акции с таймером\n')
                     self.main_algo.update_mark("3A")
                     self.main_algo.set_new_price(None)
             else:
@@ -211,65 +233,79 @@ class SalesAccelerationAlgorithm:
                     if self.is_max_price_calendar_event__greater_then__new_price():
                         self.main_algo.set_new_calendar_event_price(
                             self.main_algo.product_db_data.result.product.sku.price.new)
-                        if self.main_algo.is_price_for_calendar_event_calculated_for_every_sku_in_product():
+
+                        def add_product_to_calendar_event():
                             self.main_algo.add_product_to_calendar_event()
                             self.main_algo.update_mark("8")
-                            self.main_algo.product_db_data.result.text += "Вставляем в распродажу весь продукт\n"
-                        else:
+                            self.main_algo.add_text("Вставляем в распродажу весь продукт\n")
+
+                        def go_to_next_sku():
                             # self.main_algo.set_new_price(None)
-                            self.main_algo.product_db_data.result.text += "Переходим к следующему ску\n"
+                            self.main_algo.add_text("Переходим к следующему ску\n")
+
+                        self.main_algo.product_check(CALENDAR_PRICE_FOR_EVERY_SKU, add_product_to_calendar_event,
+                                                     go_to_next_sku)
 
                     else:
                         if self.is_max_price_calendar_event__greater_then__min_price():
-                            self.main_algo.set_new_calendar_event_price(self.main_algo.product_db.most_suitable_calendar_event.recommended_price)
-                            if self.main_algo.is_price_for_calendar_event_calculated_for_every_sku_in_product():
+                            self.main_algo.set_new_calendar_event_price(self.main_algo.calendar_event().recommended_price)
+
+                            def add_product_to_calendar_event():
                                 # self.main_algo.set_new_price(
                                 #     self.main_algo.product_db_data.result.product.sku.price.for_calendar_event)
                                 self.main_algo.add_product_to_calendar_event()
                                 self.main_algo.update_mark("10")
-                                self.main_algo.product_db_data.result.text += "Вставляем в распродажу весь продукт\n"
-                            else:
+                                self.main_algo.add_text("Вставляем в распродажу весь продукт\n")
+
+                            def go_to_next_sku():
                                 # self.main_algo.set_new_price(None)
-                                self.main_algo.product_db_data.result.text += "Переходим к следующему ску\n"
+                                self.main_algo.add_text("Переходим к следующему ску\n")
+
+                            self.main_algo.product_check(CALENDAR_PRICE_FOR_EVERY_SKU, add_product_to_calendar_event,
+                                                         go_to_next_sku)
                         else:
                             """Оповещаем в чат о том, что есть позиции, которые не могут быть добавлены в распродажу из-за того, что будет нарушена граница минимальной цены. Необходимо перевести в ручное управление"""
                             self.main_algo.send_message('Есть позиции, которые не могут быть добавлены в распродажу из-за того, что будет нарушена граница минимальной цены.\n'
                                                         f'Необходимо перевести в ручное управление. {self.main_algo.get_responsible_person_username()}\n'
                                                         f'ЦЕНУ НЕ МЕНЯЕМ НИ В ОДНОМ СКУ ЭТОГО ПРОДУКТА\n')
-                            self.main_algo.product_db_data.result.text += (f'Оповещаем в чат о том, что есть позиции, которые не могут быть добавлены в распродажу из-за того, что будет нарушена граница минимальной цены.\n'
-                                                                           f' Необходимо перевести в ручное управление. {self.main_algo.get_responsible_person_username()}\n'
-                                                                           f'ЦЕНУ НЕ МЕНЯЕМ НИ В ОДНОМ СКУ ЭТОГО ПРОДУКТА\n')
+                            self.main_algo.add_text(f'Оповещаем в чат о том, что есть позиции, которые не могут быть добавлены в распродажу из-за того, что будет нарушена граница минимальной цены.\n'
+                                                    f' Необходимо перевести в ручное управление. {self.main_algo.get_responsible_person_username()}\n'
+                                                    f'ЦЕНУ НЕ МЕНЯЕМ НИ В ОДНОМ СКУ ЭТОГО ПРОДУКТА\n', intern=False)
                             self.main_algo.update_mark("9")
                             self.main_algo.set_new_price_for_product(None)
                 else:
                     if self.has_free_timer_discounts():
                         if self.is_max_price_timer_discount__greater_then__new_price():
-                            if self.main_algo.product_db.top:
+                            if self.main_algo.product_db.top and not self.may_take_timer_discount():
+                                self.timer_discount_slot_taken()
+                            elif self.main_algo.product_db.top:
                                 '''Добавляем в акцию с таймером на 48 часов с планируемой ценой в ближайший доступный интервал времени'''
                                 self.main_algo.add_sku_to_timer_discount(for_hours=48)
-                                self.main_algo.product_db_data.result.text += ('1. Меняем цену на планируемую без участия\n2. Конец метки 4A\n')
+                                self.main_algo.add_text('1. Меняем цену на планируемую без участия\n2. Конец метки 4A\n')
                                 self.main_algo.update_mark("4A")
                             else:
                                 self.main_algo.set_new_price(self.main_algo.product_db_data.result.product.sku.price.new)
-                                self.main_algo.product_db_data.result.text += ('1. Добавляем в акцию с таймером на 48 часов с планируемой ценой в ближайший доступный интервал времени\n2.Оповещаем о своем действии в ча\n3. Конец метки 4B\n')
+                                self.main_algo.add_text('1. Добавляем в акцию с таймером на 48 часов с планируемой ценой в ближайший доступный интервал времени\n2.Оповещаем о своем действии в ча\n3. Конец метки 4B\n')
                                 self.main_algo.update_mark("4B")
                         else:
                             if self.is_max_price_timer_discount__greater_then__min_price():
-                                if self.main_algo.product_db.top:
+                                if self.main_algo.product_db.top and not self.may_take_timer_discount():
+                                    self.timer_discount_slot_taken()
+                                elif self.main_algo.product_db.top:
                                     self.main_algo.set_new_price(self.main_algo.product_db_data.timer_discount_condition.max_price)
                                     self.main_algo.add_sku_to_timer_discount(for_hours=48)
-                                    self.main_algo.product_db_data.result.text += ('1. Добавляем в акцию с таймером по максимальной цене с таймером\n2. Конец метки 6A\n3. Переходим к след skuid\n')
+                                    self.main_algo.add_text('1. Добавляем в акцию с таймером по максимальной цене с таймером\n2. Конец метки 6A\n3. Переходим к след skuid\n')
                                     self.main_algo.update_mark("6A")
                                 else:
                                     self.main_algo.set_new_price(self.main_algo.product_db_data.result.product.sku.price.new)
-                                    self.main_algo.product_db_data.result.text += ('1. Меняем цену на планируемую без участия\n2. Конец метки 6B\n')
+                                    self.main_algo.add_text('1. Меняем цену на планируемую без участия\n2. Конец метки 6B\n')
                                     self.main_algo.update_mark("6B")
 
                             else:
                                 """Оповещаем в чат о том, что данный skuid не может быть добавлен в акцию с таймером из-за того, что будет нарушена граница минимальной цены. Необходимо перевести в ручное управление\n"""
                                 self.main_algo.update_mark("5")
                                 # self.main_algo.set_new_price(None)
-                                self.main_algo.product_db_data.result.text += (f'1. Данный skuid не может быть добавлен в акцию с таймером из-за того, что будет нарушена граница минимальной цены.\nНеобходимо перевести в ручное управление. {self.main_algo.get_responsible_person_username()}\n'
-                                                                               f'2. Меняем цену на планируемую без участия в акции.\n')
+                                self.main_algo.add_text(f'1. Данный skuid не может быть добавлен в акцию с таймером из-за того, что будет нарушена граница минимальной цены.\nНеобходимо перевести в ручное управление. {self.main_algo.get_responsible_person_username()}\n'
+                                                        f'2. Меняем цену на планируемую без участия в акции.\n', intern=False)
                     else:
                         self.main_algo.update_mark("7")
@@ -0,0 +1,231 @@
+import datetime
+import heapq
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+from database.models import Competitor, Product as ProductDb
+from utils import dt
+
+
+class SchedulerWeights:
+    """Вклады в приоритет продукта в "часах устаревания": top весит как сутки без пересчета и т.д."""
+    __slots__ = ("staleness_per_hour", "top", "day_without_sales", "out_of_stock", "competitor_activity",
+                 "never_updated_hours")
+
+    def __init__(self, staleness_per_hour: float = 1.0, top: float = 24.0, day_without_sales: float = 6.0,
+                 out_of_stock: float = -24.0, competitor_activity: float = 12.0, never_updated_hours: float = 24 * 7):
+        self.staleness_per_hour = staleness_per_hour
+        self.top = top
+        self.day_without_sales = day_without_sales
+        # без остатка дерево почти всегда сразу ставит метку 1.x, такие продукты подождут
+        self.out_of_stock = out_of_stock
+        # конкурент менял цену не дольше competitor_price_age_days назад
+        self.competitor_activity = competitor_activity
+        # цену продукта еще ни разу не меняли
+        self.never_updated_hours = never_updated_hours
+
+
+DEFAULT_WEIGHTS = SchedulerWeights()
+
+
+class ScheduledProduct:
+    """Продукт в очереди. Планируется продукт целиком: решения его skuid зависят друг от друга."""
+    __slots__ = ("product_id", "shop_id", "sku_count", "priority", "ready_at")
+
+    def __init__(self, product_id: int, shop_id: int, sku_count: int, priority: float, ready_at: datetime.datetime):
+        self.product_id = product_id
+        self.shop_id = shop_id
+        self.sku_count = sku_count
+        self.priority = priority
+        self.ready_at = ready_at
+
+
+class RepricingScheduler:
+    """
+    Очередь продуктов на пересчет по приоритету вместо полного прохода по магазину.
+    Приоритет растет с временем с последнего изменения цены, у top, с днями без продаж и при активности
+    конкурента; продукты без остатка опускаются. Продукт, цену которого меняли меньше чем
+    strategy.min_time_between_price_changing назад, ждет в отложенной очереди.
+    Выдача ограничена rate skuid в секунду (token bucket с запасом burst), чтобы нагрузка шла равномерно.
+    refresh перечитывает приоритеты двумя агрегирующими запросами; выданные и еще не завершенные
+    продукты при этом не возвращаются в очередь.
+    Готовые продукты лежат в куче своего магазина, а heads - куча вершин этих куч: выдача партии магазина
+    не трогает очереди остальных магазинов.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None, strategy: StrategyConfig = DEFAULT_STRATEGY,
+                 weights: SchedulerWeights = DEFAULT_WEIGHTS,
+                 now: Callable[[], datetime.datetime] = dt.now, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self.strategy = strategy
+        self.weights = weights
+        self.now = now
+        self.clock = clock
+        self.tokens: float = self.burst
+        self.tokens_at: float = clock()
+        # shop_id -> куча (-приоритет, порядковый номер, продукт) и куча (готовность, порядковый номер, продукт)
+        self.ready: dict[int, list[tuple[float, int, ScheduledProduct]]] = {}
+        self.delayed: list[tuple[datetime.datetime, int, ScheduledProduct]] = []
+        # (-приоритет, порядковый номер, shop_id) вершин self.ready; устаревшие записи удаляет _head
+        self.heads: list[tuple[float, int, int]] = []
+        self.queued: dict[int, ScheduledProduct] = {}
+        self.in_flight: dict[int, ScheduledProduct] = {}
+        # по порядку завершения; записи старше min_time_between_price_changing удаляет _prune_completed
+        self.completed_at: OrderedDict[int, datetime.datetime] = OrderedDict()
+        self._counter = 0
+        self.released_skus: int = 0
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    def refresh(self, db: Session, shop_ids: Iterable[int] = None):
+        """Пересобирает очередь по текущим данным продуктов shop_ids (всех магазинов, если не заданы)."""
+        now = self.now()
+        skus = db.query(ProductDb.product_id, ProductDb.shop_id, func.count(ProductDb.sku_id),
+                        func.max(case((ProductDb.top, 1), else_=0)), func.max(ProductDb.days_without_sales),
+                        func.max(ProductDb.stock),
+                        func.min(ProductDb.price_update_datetime), func.max(ProductDb.price_update_datetime),
+                        ).group_by(ProductDb.product_id, ProductDb.shop_id)
+        competitors = db.query(ProductDb.product_id, func.max(Competitor.price_change_date)).join(
+            Competitor, Competitor.sku_id == ProductDb.sku_id).group_by(ProductDb.product_id)
+        if shop_ids is not None:
+            shop_ids = list(shop_ids)
+            skus = skus.filter(ProductDb.shop_id.in_(shop_ids))
+            competitors = competitors.filter(ProductDb.shop_id.in_(shop_ids))
+        competitor_changed = dict(competitors)
+        min_interval = self.min_interval()
+        self._prune_completed(now)
+
+        self.ready, self.delayed, self.heads, self.queued = {}, [], [], {}
+        for product_id, shop_id, sku_count, top, days_without_sales, stock, oldest_update, latest_update in skus:
+            if product_id in self.in_flight:
+                continue
+            priority = self.priority(now, top, days_without_sales, stock, oldest_update,
+                                     competitor_changed.get(product_id))
+            ready_at = dt.with_tz(latest_update) + min_interval if latest_update else now
+            completed_at = self.completed_at.get(product_id)
+            if completed_at is not None:
+                ready_at = max(ready_at, completed_at + min_interval)
+            self.push(ScheduledProduct(product_id, shop_id, sku_count, priority, ready_at))
+
+    def min_interval(self) -> datetime.timedelta:
+        return datetime.timedelta(seconds=self.strategy.min_time_between_price_changing)
+
+    def priority(self, now: datetime.datetime, top: bool, days_without_sales: Optional[int], stock: Optional[int],
+                 oldest_update: Optional[datetime.datetime], competitor_changed: Optional[datetime.date]) -> float:
+        w = self.weights
+        if oldest_update is None:
+            priority = w.never_updated_hours * w.staleness_per_hour
+        else:
+            priority = (now - dt.with_tz(oldest_update)).total_seconds() / 3600 * w.staleness_per_hour
+        if top:
+            priority += w.top
+        priority += (days_without_sales or 0) * w.day_without_sales
+        if not stock:
+            priority += w.out_of_stock
+        if competitor_changed is not None and \
+                (now.date() - competitor_changed).days <= self.strategy.competitor_price_age_days:
+            priority += w.competitor_activity
+        return priority
+
+    def push(self, product: ScheduledProduct):
+        self.queued[product.product_id] = product
+        self._counter += 1
+        if product.ready_at > self.now():
+            heapq.heappush(self.delayed, (product.ready_at, self._counter, product))
+        else:
+            self._push_ready((-product.priority, self._counter, product))
+
+    def _push_ready(self, item: tuple[float, int, ScheduledProduct]):
+        shop_id = item[2].shop_id
+        shop_ready = self.ready.setdefault(shop_id, [])
+        heapq.heappush(shop_ready, item)
+        if shop_ready[0] is item:
+            heapq.heappush(self.heads, (item[0], item[1], shop_id))
+
+    def _head(self) -> Optional[ScheduledProduct]:
+        """Самый приоритетный готовый продукт; по пути удаляет записи heads, вершины которых уже выданы."""
+        while self.heads:
+            _, counter, shop_id = self.heads[0]
+            shop_ready = self.ready.get(shop_id)
+            if shop_ready and shop_ready[0][1] == counter:
+                return shop_ready[0][2]
+            heapq.heappop(self.heads)
+        return None
+
+    def _promote(self):
+        now = self.now()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, counter, product = heapq.heappop(self.delayed)
+            self._push_ready((-product.priority, counter, product))
+
+    def _refill(self):
+        clock = self.clock()
+        self.tokens = min(self.burst, self.tokens + (clock - self.tokens_at) * self.rate)
+        self.tokens_at = clock
+
+    def _cost(self, product: ScheduledProduct) -> float:
+        # продукт больше запаса выдается целиком при полном запасе, иначе он не вышел бы никогда
+        return min(product.sku_count, self.burst)
+
+    def next_batch(self, max_skus: int) -> Optional[tuple[int, list[int]]]:
+        """
+        (магазин, продукты) - самые приоритетные готовые продукты одного магазина, не больше max_skus skuid
+        и не больше накопленного запаса; None, если сейчас выдавать нечего.
+        """
+        self._promote()
+        self._refill()
+        head = self._head()
+        if head is None or self.tokens < self._cost(head):
+            return None
+        shop_id = head.shop_id
+        shop_ready = self.ready[shop_id]
+        batch: list[int] = []
+        skus = 0
+        while shop_ready:
+            product = shop_ready[0][2]
+            if batch and (skus + product.sku_count > max_skus or self.tokens < self._cost(product)):
+                break
+            heapq.heappop(shop_ready)
+            self.tokens -= self._cost(product)
+            skus += product.sku_count
+            batch.append(product.product_id)
+            self.in_flight[product.product_id] = self.queued.pop(product.product_id)
+        if shop_ready:
+            heapq.heappush(self.heads, shop_ready[0][:2] + (shop_id,))
+        else:
+            del self.ready[shop_id]
+        self.released_skus += skus
+        return shop_id, batch
+
+    def seconds_until_next(self) -> Optional[float]:
+        """Сколько ждать до следующей выдачи; None - очередь пуста."""
+        self._promote()
+        head = self._head()
+        if head is not None:
+            self._refill()
+            return max(0.0, (self._cost(head) - self.tokens) / self.rate)
+        if self.delayed:
+            return max(0.0, (self.delayed[0][0] - self.now()).total_seconds())
+        return None
+
+    def complete(self, product_ids: Iterable[int]):
+        now = self.now()
+        for product_id in product_ids:
+            self.in_flight.pop(product_id, None)
+            self.completed_at[product_id] = now
+            self.completed_at.move_to_end(product_id)
+        self._prune_completed(now)
+
+    def _prune_completed(self, now: datetime.datetime):
+        # после min_time_between_price_changing завершение уже не сдвигает ready_at продукта в refresh
+        expired = now - self.min_interval()
+        while self.completed_at and next(iter(self.completed_at.values())) <= expired:
+            self.completed_at.popitem(last=False)
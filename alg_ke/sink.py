@@ -0,0 +1,114 @@
+import io
+from typing import Callable, Iterable
+
+from sqlalchemy import Table, insert
+from sqlalchemy.orm import Session
+
+from database.models import CalculationResult
+
+DEFAULT_FLUSH_SIZE = 1000
+
+
+def calculation_result_row(result: CalculationResult) -> dict:
+    product = result.product
+    sku = product.sku
+    return {
+        "shop_id": getattr(result.shop, "id", result.shop),
+        "product_id": product.product_id,
+        "sku_id": sku.sku_id,
+        "mark": sku.mark,
+        "new_price": sku.price.new,
+        "price_for_calendar_event": sku.price.for_calendar_event,
+        "add_calendar_event_id_in_lk": product.add_calendar_event_id_in_lk,
+        "remove_calendar_event_id_in_lk": product.remove_calendar_event_id_in_lk,
+        "add_to_timer_discount_for_hours": sku.add_to_timer_discount_for_hours,
+        "remove_from_timer_discount_id": sku.remove_from_timer_discount_id,
+        "error": result.error,
+        "error_text": result.error_text,
+        "path": result.path,
+        "text": result.text,
+    }
+
+
+def _csv_value(value) -> str:
+    # в CSV для COPY пустое поле без кавычек - NULL, а пустая строка должна быть в кавычках
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+class CalculationResultSink:
+    """
+    Пишет CalculationResult в таблицу результатов пачками по flush_size строк:
+    один executemany (или COPY для PostgreSQL/psycopg2 при use_copy=True) на пачку вместо INSERT на каждый skuid.
+    to_row переводит результат в словарь колонок table; лишние ключи отбрасываются.
+    """
+
+    def __init__(self, db: Session, table: Table, flush_size: int = DEFAULT_FLUSH_SIZE,
+                 to_row: Callable[[CalculationResult], dict] = calculation_result_row, use_copy: bool = False,
+                 commit: bool = True):
+        self.db = db
+        self.table = table
+        self.flush_size = flush_size
+        self.to_row = to_row
+        self.use_copy = use_copy
+        self.commit = commit
+        self.columns: list[str] = [column.name for column in table.columns]
+        self.rows: list[dict] = []
+        self.written: int = 0
+        self.flushes: int = 0
+
+    def __enter__(self) -> "CalculationResultSink":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, result: CalculationResult):
+        row = self.to_row(result)
+        self.rows.append({column: row[column] for column in self.columns if column in row})
+        if len(self.rows) >= self.flush_size:
+            self.flush()
+
+    def write_all(self, results: Iterable[CalculationResult]) -> int:
+        for result in results:
+            self.add(result)
+        self.flush()
+        return self.written
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        dialect = self.db.get_bind().dialect
+        if self.use_copy and dialect.name == "postgresql" and dialect.driver == "psycopg2":
+            self._copy(rows)
+        else:
+            self.db.execute(insert(self.table), rows)
+        if self.commit:
+            self.db.commit()
+        self.written += len(rows)
+        self.flushes += 1
+
+    def _copy(self, rows: list[dict]):
+        columns = [column for column in self.columns if column in rows[0]]
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(",".join(_csv_value(row.get(column)) for column in columns))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {self.table.fullname} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                               buffer)
+        finally:
+            cursor.close()
+
+
+def write_results(results: Iterable[CalculationResult], db: Session, table: Table,
+                  flush_size: int = DEFAULT_FLUSH_SIZE, use_copy: bool = False) -> int:
+    with CalculationResultSink(db, table, flush_size, use_copy=use_copy) as sink:
+        return sink.write_all(results)
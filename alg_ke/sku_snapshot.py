@@ -0,0 +1,153 @@
+"""
+Компактные копии объектов ORM, которые читает расчет: только нужные поля, в __slots__, без сессии.
+Ленивых загрузок нет (все связи скопированы при построении), объекты дешевле по памяти и доступу к атрибутам
+и пиклятся без SQLAlchemy. Алгоритм меняет у skuid только mark и last_price, у конкурента - дельту;
+дельты копятся в SkuSnapshotBatch.dirty и пишутся write_deltas.
+"""
+import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from crud.algorithms.bin_ladder import BinLadder
+from crud.algorithms.calendar_index import CalendarEventIndex
+from crud.algorithms.competitor_cache import CompetitorCache, CompetitorSnapshot, write_competitor_deltas
+from crud.algorithms.consistent_read import load_skus
+from crud.algorithms.instrumentation import AlgorithmInstrumentation
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from database.models import Product as ProductDb
+
+
+class _Detached:
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, obj):
+        if obj is None:
+            return None
+        snapshot = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(snapshot, name, getattr(obj, name))
+        return snapshot
+
+
+class ResponsiblePersonSnapshot(_Detached):
+    __slots__ = ("id", "username")
+
+
+class ShopSnapshot(_Detached):
+    __slots__ = ("id", "quantity_available_timer_discounts", "responsible_person")
+
+    @classmethod
+    def of(cls, shop):
+        snapshot = cls.__new__(cls)
+        snapshot.id = shop.id
+        snapshot.quantity_available_timer_discounts = shop.quantity_available_timer_discounts
+        snapshot.responsible_person = ResponsiblePersonSnapshot.of(shop.responsible_person)
+        return snapshot
+
+
+class CalendarParticipationSnapshot(_Detached):
+    __slots__ = ("calendar_event_id_in_lk", "priority", "recommended_price", "is_involved", "search_position")
+
+
+class BinSnapshot(_Detached):
+    __slots__ = ("sku_id", "number", "from_value", "to_value", "profit", "sales_speed")
+
+
+class DeliverySnapshot(_Detached):
+    __slots__ = ("sku_id", "date")
+
+
+class TimerDiscountSnapshot(_Detached):
+    __slots__ = ("sku_id", "discount_id", "date_start")
+
+
+class TimerDiscountConditionSnapshot(_Detached):
+    __slots__ = ("max_price",)
+
+
+class SkuSnapshot:
+    """Поля ProductDb, которые читают дерево решений, отпечатки и пачки DecisionEngine."""
+    _COLUMNS = ("sku_id", "product_id", "shop_id", "sku_full_title", "search_key", "status_title", "active",
+                "stock", "reserved_stock", "last_price", "min_price", "days_without_sales", "top",
+                "average_sales_speed", "min_sales_speed", "search_position", "mark", "on_calendar_event",
+                "on_timer_discount", "price_update_datetime")
+    __slots__ = _COLUMNS + ("shop", "participations_in_calendar_event", "most_suitable_calendar_event",
+                            "involved_calendar_event")
+
+    sku_id: int
+    product_id: int
+    shop_id: int
+    shop: ShopSnapshot
+    last_price: float
+    min_price: float
+    mark: str
+    price_update_datetime: Optional[datetime.datetime]
+    participations_in_calendar_event: tuple[CalendarParticipationSnapshot, ...]
+    most_suitable_calendar_event: Optional[CalendarParticipationSnapshot]
+    involved_calendar_event: Optional[CalendarParticipationSnapshot]
+
+    @classmethod
+    def of(cls, product_db: ProductDb, shop: ShopSnapshot) -> "SkuSnapshot":
+        snapshot = cls.__new__(cls)
+        for name in cls._COLUMNS:
+            setattr(snapshot, name, getattr(product_db, name))
+        snapshot.shop = shop
+        participations = {id(p): CalendarParticipationSnapshot.of(p)
+                          for p in product_db.participations_in_calendar_event}
+        snapshot.participations_in_calendar_event = tuple(participations.values())
+        # свойства модели считаются один раз: участия в акциях расчет не меняет
+        snapshot.most_suitable_calendar_event = participations.get(id(product_db.most_suitable_calendar_event))
+        snapshot.involved_calendar_event = participations.get(id(product_db.involved_calendar_event))
+        return snapshot
+
+
+class SkuSnapshotBatch:
+    """skuid и их AlgorithmPrefetch в виде снимков; пиклится целиком для передачи в воркер."""
+    __slots__ = ("skus", "prefetch", "dirty")
+
+    def __init__(self, skus: list[SkuSnapshot], prefetch: AlgorithmPrefetch, dirty: set[CompetitorSnapshot]):
+        self.skus = skus
+        self.prefetch = prefetch
+        # конкуренты, у которых расчет изменил дельту
+        self.dirty = dirty
+
+    @classmethod
+    def of(cls, sku_list: list[ProductDb], prefetch: AlgorithmPrefetch,
+           competitor_cache: CompetitorCache) -> "SkuSnapshotBatch":
+        """prefetch должен быть загружен с competitor_cache: его конкуренты уже снимки."""
+        shops: dict[int, ShopSnapshot] = {}
+        skus = []
+        for sku in sku_list:
+            shop = shops.get(sku.shop_id)
+            if shop is None:
+                shop = shops[sku.shop_id] = ShopSnapshot.of(sku.shop)
+            skus.append(SkuSnapshot.of(sku, shop))
+
+        detached = AlgorithmPrefetch()
+        detached.competitors.update(prefetch.competitors)
+        detached.bin_ladders = {sku_id: BinLadder([BinSnapshot.of(b) for b in ladder.bins])
+                                for sku_id, ladder in prefetch.bin_ladders.items()}
+        detached.nearest_delivery = {sku_id: DeliverySnapshot.of(delivery)
+                                     for sku_id, delivery in prefetch.nearest_delivery.items()}
+        detached.timer_discount = {sku_id: TimerDiscountSnapshot.of(timer_discount)
+                                   for sku_id, timer_discount in prefetch.timer_discount.items()}
+        detached.timer_discount_condition = {sku_id: TimerDiscountConditionSnapshot.of(condition)
+                                             for sku_id, condition in prefetch.timer_discount_condition.items()}
+        detached.shop_product = prefetch.shop_product
+        detached.timer_slots = prefetch.timer_slots
+        detached.calendar_events = CalendarEventIndex.build(skus)
+        return cls(skus, detached, competitor_cache.dirty)
+
+    def write_deltas(self, db: Session) -> int:
+        return write_competitor_deltas(db, self.dirty)
+
+
+async def load_sku_snapshots(product_ids: list[int], db: Session,
+                             instrumentation: Optional[AlgorithmInstrumentation] = None) -> SkuSnapshotBatch:
+    """skuid продуктов и все их входные данные: запросы load_skus и AlgorithmPrefetch, затем копирование в снимки."""
+    competitor_cache = CompetitorCache()
+    sku_list = load_skus(product_ids, db)
+    prefetch = await AlgorithmPrefetch.for_sku_list(sku_list, db, instrumentation, competitor_cache)
+    return SkuSnapshotBatch.of(sku_list, prefetch, competitor_cache)
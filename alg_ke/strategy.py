@@ -0,0 +1,81 @@
+from typing import Any
+
+MIN_TIME_BETWEEN_PRICE_CHANGING = 60 * 60  # час
+
+
+class StrategyConfig:
+    """
+    Пороги и шаги цен веток ProfitIncreaseAlgorithm и SalesAccelerationAlgorithm.
+    Значения по умолчанию - константы исходных веток; множители хранятся как в исходных формулах
+    (last_price * 1.02), чтобы конфигурация по умолчанию давала те же цены до последнего знака.
+    Неизменяемый и хешируемый: входит в отпечатки входных данных и служит ключом результатов перебора.
+    """
+    __slots__ = ("position_lead", "last_price_up_fast", "last_price_up", "last_price_down", "last_price_down_fast",
+                 "competitor_overprice_ratio", "competitor_markup", "competitor_price_age_days",
+                 "competitor_price_age_days_short", "timer_discount_hours", "min_time_between_price_changing")
+
+    def __init__(self, position_lead: int = 8, last_price_up_fast: float = 1.02, last_price_up: float = 1.01,
+                 last_price_down: float = 0.99, last_price_down_fast: float = 0.98,
+                 competitor_overprice_ratio: float = 1.1, competitor_markup: float = 1.09,
+                 competitor_price_age_days: int = 3, competitor_price_age_days_short: int = 2,
+                 timer_discount_hours: int = 23,
+                 min_time_between_price_changing: int = MIN_TIME_BETWEEN_PRICE_CHANGING):
+        # "наша позиция выше конкурента более чем на position_lead позиций"
+        object.__setattr__(self, "position_lead", position_lead)
+        # 3B / 3H / 3F / 3J: действующая цена, умноженная на шаг
+        object.__setattr__(self, "last_price_up_fast", last_price_up_fast)
+        object.__setattr__(self, "last_price_up", last_price_up)
+        object.__setattr__(self, "last_price_down", last_price_down)
+        object.__setattr__(self, "last_price_down_fast", last_price_down_fast)
+        # "наша цена выше цены конкурента на 10%" и 3E: цена конкурента + 9%
+        object.__setattr__(self, "competitor_overprice_ratio", competitor_overprice_ratio)
+        object.__setattr__(self, "competitor_markup", competitor_markup)
+        # "цена конкурента менялась более 3 / 2 дней назад"
+        object.__setattr__(self, "competitor_price_age_days", competitor_price_age_days)
+        object.__setattr__(self, "competitor_price_age_days_short", competitor_price_age_days_short)
+        object.__setattr__(self, "timer_discount_hours", timer_discount_hours)
+        object.__setattr__(self, "min_time_between_price_changing", min_time_between_price_changing)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("StrategyConfig неизменяем, используйте replace()")
+
+    def __getstate__(self) -> dict[str, Any]:
+        return self.to_dict()
+
+    def __setstate__(self, state: dict[str, Any]):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def percent(self, name: str) -> str:
+        """Шаг или порог name в процентах для path/text: last_price_up_fast=1.02 -> "2%", last_price_down=0.99 -> "1%"."""
+        return f"{round(abs(getattr(self, name) - 1) * 100, 4):g}%"
+
+    def key(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def replace(self, **changes) -> "StrategyConfig":
+        unknown = set(changes) - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"Неизвестные параметры стратегии: {', '.join(sorted(unknown))}")
+        return StrategyConfig(**{**self.to_dict(), **changes})
+
+    def diff(self, other: "StrategyConfig" = None) -> dict[str, Any]:
+        """Параметры, отличающиеся от other (по умолчанию - от стратегии по умолчанию)."""
+        other = other or DEFAULT_STRATEGY
+        return {name: value for name, value in self.to_dict().items() if getattr(other, name) != value}
+
+    def __eq__(self, other):
+        return isinstance(other, StrategyConfig) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        changes = ", ".join(f"{name}={value!r}" for name, value in self.diff().items())
+        return f"StrategyConfig({changes})"
+
+
+DEFAULT_STRATEGY = StrategyConfig()
@@ -0,0 +1,88 @@
+"""
+Перебор параметров стратегии (StrategyConfig) на фиксированном наборе снимков бэктеста.
+
+Каждый воркер пула один раз загружает снимки и строит из них пачки build_snapshot_batch; DecisionEngine
+не меняет пачку, поэтому она переиспользуется для всех стратегий, доставшихся воркеру.
+Перебирать имеет смысл пороги, которые читает DecisionEngine, включая timer_discount_hours (возраст акции
+с таймером, strategy_predicates). Не влияют на результат: competitor_price_age_days_short - его читает только
+date_change_price_competitor_more_then_two_days, которую дерево не вызывает, и min_time_between_price_changing -
+его учитывает RepricingScheduler, а не дерево решений.
+"""
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional, Union
+
+from crud.algorithms.backtest import BACKTEST_CHUNK_SIZE, BacktestReport, BinMatrix, Snapshot, \
+    build_snapshot_batch, iter_chunks, load_snapshot
+from crud.algorithms.decision_tree import Batch, DecisionEngine
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+
+PreparedChunk = tuple[Snapshot, Batch, BinMatrix]
+
+_worker_chunks: Optional[list[PreparedChunk]] = None
+
+
+def strategy_grid(base: StrategyConfig = DEFAULT_STRATEGY, **values: Iterable) -> list[StrategyConfig]:
+    """Декартово произведение значений: strategy_grid(position_lead=(6, 8, 10), last_price_up=(1.01, 1.02))."""
+    names = list(values)
+    return [base.replace(**dict(zip(names, combination)))
+            for combination in itertools.product(*(tuple(values[name]) for name in names))]
+
+
+def prepare_chunks(snapshot_paths: list[str], chunk_size: int = BACKTEST_CHUNK_SIZE) -> list[PreparedChunk]:
+    chunks = []
+    for path in snapshot_paths:
+        for chunk in iter_chunks(load_snapshot(path), chunk_size):
+            batch, bins = build_snapshot_batch(chunk)
+            chunks.append((chunk, batch, bins))
+    return chunks
+
+
+def evaluate_strategy(strategy: StrategyConfig, chunks: list[PreparedChunk]) -> BacktestReport:
+    engine = DecisionEngine(strategy=strategy)
+    report = BacktestReport()
+    for chunk, batch, bins in chunks:
+        report.add(chunk, batch, bins, engine.evaluate(batch))
+    return report
+
+
+def _init_worker(snapshot_paths: list[str], chunk_size: int):
+    global _worker_chunks
+    _worker_chunks = prepare_chunks(snapshot_paths, chunk_size)
+
+
+def _run_strategy(strategy: StrategyConfig) -> tuple[StrategyConfig, BacktestReport]:
+    return strategy, evaluate_strategy(strategy, _worker_chunks)
+
+
+def run_sweep(snapshot_paths: Union[str, list[str]], strategies: Iterable[StrategyConfig],
+              max_workers: Optional[int] = None,
+              chunk_size: int = BACKTEST_CHUNK_SIZE) -> list[tuple[StrategyConfig, BacktestReport]]:
+    """
+    Бэктест каждой стратегии на снимках snapshot_paths (файлы save_snapshot) в пуле процессов.
+    Повторяющиеся стратегии считаются один раз; результаты - в порядке первого появления стратегии.
+    max_workers=1 считает в текущем процессе без пула.
+    """
+    if isinstance(snapshot_paths, str):
+        snapshot_paths = [snapshot_paths]
+    strategies = list(dict.fromkeys(strategies))
+    if max_workers == 1 or len(strategies) <= 1:
+        chunks = prepare_chunks(snapshot_paths, chunk_size)
+        return [(strategy, evaluate_strategy(strategy, chunks)) for strategy in strategies]
+
+    with ProcessPoolExecutor(max_workers=min(max_workers or len(strategies), len(strategies)),
+                             initializer=_init_worker, initargs=(snapshot_paths, chunk_size)) as pool:
+        return list(pool.map(_run_strategy, strategies))
+
+
+def revenue_lift(report: BacktestReport) -> float:
+    return report.simulated_revenue - report.baseline_revenue
+
+
+def sweep_summary(results: list[tuple[StrategyConfig, BacktestReport]], top: int = 10) -> str:
+    """Стратегии по убыванию прироста смоделированной выручки."""
+    lines = [f"{'прирост выручки':>18}{'строк':>12}{'fallback':>10}{'цена ↑':>10}{'цена ↓':>10}  стратегия"]
+    for strategy, report in sorted(results, key=lambda item: revenue_lift(item[1]), reverse=True)[:top]:
+        lines.append(f"{revenue_lift(report):>18,.0f}{report.rows:>12}{report.fallback_rows:>10}"
+                     f"{report.price_up:>10}{report.price_down:>10}  {strategy.diff() or 'по умолчанию'}")
+    return "\n".join(lines)
@@ -0,0 +1,41 @@
+"""Модули алгоритма импортируются как crud.algorithms.* на подменных crud/database из benchmark/standin."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark"))
+
+import standin  # noqa: E402
+
+standin.install()
+
+
+@pytest.fixture
+def make_result():
+    """Фабрика CalculationResult skuid без БД; поля решения задаются именованными аргументами."""
+    from database.models import CalculationResult, Product, Shop, ShopProduct
+
+    def make(sku_id: int, product_id: int = 1, shop_id: int = 1, price=None, mark: str = "", error: bool = False,
+             path: str = "", calendar_price=None, timer_hours=None, timer_remove=None, calendar_add=None,
+             calendar_remove=None) -> CalculationResult:
+        shop_product = ShopProduct(Product(sku_id=sku_id, product_id=product_id, shop_id=shop_id, mark=mark),
+                                   Shop(id=shop_id))
+        sku = shop_product.product.sku
+        sku.price.new = price
+        sku.price.for_calendar_event = calendar_price
+        sku.add_to_timer_discount_for_hours = timer_hours
+        sku.remove_from_timer_discount_id = timer_remove
+        shop_product.product.add_calendar_event_id_in_lk = calendar_add
+        shop_product.product.remove_calendar_event_id_in_lk = calendar_remove
+        return CalculationResult(shop=shop_product.shop, product=shop_product.product, error=error, path=path)
+
+    return make
+
+
+@pytest.fixture
+def db():
+    """Сессия пустой БД в памяти."""
+    session = standin.create_session_factory()()
+    yield session
+    session.close()
@@ -0,0 +1,59 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from crud.algorithms import backtest
+from crud.algorithms.algorithm import AlgorithmDataForSku
+from crud.algorithms.event_loop import run_sync
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from database.models import Product
+
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def snapshot(db) -> backtest.Snapshot:
+    populate(db, 1, SyntheticShopConfig(products=40))
+    sku_list = db.query(Product).order_by(Product.sku_id).all()
+    prefetch = run_sync(AlgorithmPrefetch.for_sku_list(sku_list, db))
+    data_list = [run_sync(AlgorithmDataForSku.load(sku, db, prefetch)) for sku in sku_list]
+    days = [backtest.snapshot_from_data(sku_list, data_list, datetime.date(2026, 1, day)) for day in (1, 2)]
+    return backtest.concat_snapshots(days)
+
+
+def test_fallback_rows_count_as_unchanged_price(snapshot):
+    report = backtest.run_backtest([snapshot])
+    assert 0 < report.fallback_rows < report.rows == len(snapshot["sku_id"])
+    assert sum(report.marks.values()) == report.rows
+    assert report.marks[backtest.FALLBACK_MARK] == report.fallback_rows
+    baseline, simulated = report.revenue_by_mark[backtest.FALLBACK_MARK]
+    assert baseline == simulated > 0
+    assert report.revenue_rows > report.rows - report.fallback_rows
+    assert sum(report.price_change_histogram) == report.price_up + report.price_down + report.price_same
+    by_day = report.to_dict()["rows_by_day"]
+    assert by_day == {day: {"rows": report.rows // 2, "fallback_rows": report.fallback_rows // 2}
+                      for day in ("2026-01-01", "2026-01-02")}
+
+
+def test_chunks_do_not_change_report(snapshot):
+    whole = backtest.run_backtest([snapshot])
+    chunked = backtest.run_backtest([snapshot], chunk_size=7)
+    assert (chunked.rows, chunked.fallback_rows, chunked.marks, chunked.rows_by_day) == \
+        (whole.rows, whole.fallback_rows, whole.marks, whole.rows_by_day)
+    assert np.array_equal(chunked.price_change_histogram, whole.price_change_histogram)
+    assert chunked.simulated_revenue == pytest.approx(whole.simulated_revenue)
+    assert chunked.revenue_by_mark.keys() == whole.revenue_by_mark.keys()
+
+
+def test_gap_price_keeps_last_price(snapshot):
+    row = 0
+    snapshot = {name: values.copy() for name, values in snapshot.items()}
+    # цена в промежутке между двумя бинами: заглушка цены выше бинов ее не трогает, как в set_bin_ladder
+    gap = (snapshot["bin_to"][row, 0] + snapshot["bin_from"][row, 1]) / 2
+    assert snapshot["bin_to"][row, 0] < gap < snapshot["bin_from"][row, 1]
+    snapshot["last_price"][row] = gap
+    snapshot["min_price"][row] = 0
+    batch, _ = backtest.build_snapshot_batch(snapshot)
+    assert batch["last_price"][row] == gap
+    assert np.isnan(batch["current_bin_number"][row])
@@ -0,0 +1,109 @@
+import pytest
+
+from crud.algorithms import batch
+from crud.algorithms.algorithm import AsyncAlgorithm
+from crud.algorithms.scheduler import RepricingScheduler
+from database.models import Competitor, Product
+
+import standin
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # файл, а не память: воркеры пула открывают свои соединения
+    session_factory = standin.create_session_factory(f"sqlite:///{tmp_path / 'batch.db'}")
+    db = session_factory()
+    populate(db, 2, SyntheticShopConfig(products=12))
+    db.commit()
+    db.close()
+    return session_factory
+
+
+def sku_ids(session_factory, shop_ids) -> set[int]:
+    db = session_factory()
+    try:
+        return {sku_id for sku_id, in db.query(Product.sku_id).filter(Product.shop_id.in_(shop_ids))}
+    finally:
+        db.close()
+
+
+def crashing_product(session_factory, monkeypatch) -> int:
+    """Продукт из середины первого магазина, расчет которого падает; воркеры наследуют подмену при fork."""
+    db = session_factory()
+    product_ids = sorted({product_id for product_id, in db.query(Product.product_id).filter(Product.shop_id == 1)})
+    db.close()
+    crash_id = product_ids[len(product_ids) // 2]
+    run = AsyncAlgorithm.run
+
+    async def crash(self):
+        if self.product_id == crash_id:
+            raise RuntimeError("boom")
+        return await run(self)
+
+    monkeypatch.setattr(AsyncAlgorithm, "run", crash)
+    return crash_id
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_crashing_product_does_not_abort_run(session_factory, monkeypatch, snapshot):
+    crash_id = crashing_product(session_factory, monkeypatch)
+    results = list(batch.run_for_shops([1, 2], session_factory, max_workers=2, chunk_size=6, snapshot=snapshot))
+    assert {result.product.sku.sku_id for result in results} == sku_ids(session_factory, [1, 2])
+    crashed = [result for result in results if result.product.product_id == crash_id]
+    assert crashed and all(result.error and result.error_text == "RuntimeError: boom" for result in crashed)
+    assert any(not result.error for result in results if result.product.product_id > crash_id)
+
+
+def test_crashing_product_in_iter_shop(session_factory, monkeypatch):
+    crash_id = crashing_product(session_factory, monkeypatch)
+    db = session_factory()
+    results = list(batch.iter_shop(1, db, chunk_size=6))
+    db.close()
+    assert {result.product.sku.sku_id for result in results} == sku_ids(session_factory, [1])
+    assert all(result.error for result in results if result.product.product_id == crash_id)
+
+
+def competitor_deltas(session_factory) -> dict[int, int]:
+    db = session_factory()
+    try:
+        return dict(db.query(Competitor.id, Competitor.last_delta_between_us_and_cmp))
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("mode", [{}, {"vectorized": True}, {"snapshot": True}])
+def test_worker_commits_chunk_changes(session_factory, mode):
+    before = competitor_deltas(session_factory)
+    results = list(batch.run_for_shops([1, 2], session_factory, max_workers=2, chunk_size=6, **mode))
+    after = competitor_deltas(session_factory)
+    changes = sorted(after[competitor_id] - before[competitor_id] for competitor_id in after
+                     if after[competitor_id] != before[competitor_id])
+    # ветки 3L/3N сдвигают дельту с лучшим конкурентом на +1/-1
+    marks = [result.product.sku.mark or "" for result in results]
+    assert changes and changes == sorted([1] * sum(mark.startswith("3L") for mark in marks) +
+                                         [-1] * sum(mark.startswith("3N") for mark in marks))
+    if not mode.get("snapshot"):
+        db = session_factory()
+        stored = dict(db.query(Product.sku_id, Product.mark))
+        db.close()
+        assert all(stored[result.product.sku.sku_id] == result.product.sku.mark for result in results)
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_run_scheduled_covers_queue(session_factory, snapshot):
+    scheduler = RepricingScheduler(rate=1e6)
+    db = session_factory()
+    scheduler.refresh(db, [1])
+    db.close()
+    queued = len(scheduler)
+    results = list(batch.run_scheduled(scheduler, session_factory, max_workers=2, chunk_size=6, snapshot=snapshot))
+    assert sorted(result.product.sku.sku_id for result in results) == sorted(sku_ids(session_factory, [1]))
+    assert len(scheduler) == 0 and not scheduler.in_flight
+    assert len(scheduler.completed_at) == queued
+
+    # только что пересчитанные продукты ждут min_time_between_price_changing и в очередь не возвращаются сразу
+    db = session_factory()
+    scheduler.refresh(db, [1])
+    db.close()
+    assert scheduler.next_batch(100) is None and scheduler.seconds_until_next() > 0
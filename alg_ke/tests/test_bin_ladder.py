@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from crud.algorithms.algorithm import BINS_QUANTYITY, AlgorithmDataForSku
+from crud.algorithms.bin_ladder import BinLadder
+from crud.algorithms.memo import AlgorithmMemo
+from database import Bin
+
+
+def ladder(*bins) -> BinLadder:
+    # (номер, от, до, прибыль, скорость продаж); порядок на входе не важен
+    return BinLadder([Bin(number=n, from_value=f, to_value=t, profit=p, sales_speed=s) for n, f, t, p, s in bins])
+
+
+LADDER = ((3, 300, 399, 30, 1.0), (1, 100, 199, 50, 3.0), (2, 200, 299, 70, None), (4, 400, 499, 10, 0.5))
+
+
+def test_sorted_by_number():
+    assert ladder(*LADDER).numbers == [1, 2, 3, 4]
+
+
+def test_current():
+    bins = ladder(*LADDER)
+    assert bins.current(250).number == 2
+    assert bins.current(200).number == 2
+    assert bins.current(199.5) is None
+    assert bins.current(50) is None
+    assert bins.current(500) is None
+
+
+def test_neighbours_and_min_price():
+    bins = ladder(*LADDER)
+    assert bins.lower(250).number == 1
+    assert bins.lower(250, min_price=199) is None
+    assert bins.upper(250).number == 3
+    assert bins.upper(450) is None
+    assert bins.lower(50) is None
+
+
+def test_by_competitor_price():
+    bins = ladder(*LADDER)
+    assert bins.lower_by_competitor(350).number == 2
+    assert bins.upper_by_competitor(350).number == 4
+    assert bins.lower_by_competitor(150) is None
+
+
+def test_by_number_and_max_profit():
+    bins = ladder(*LADDER)
+    assert bins.by_number(3).to_value == 399
+    assert bins.by_number(7) is None
+    assert bins.max_profit().number == 2
+
+
+def test_optimal_skips_bins_without_speed():
+    bins = ladder(*LADDER)
+    assert bins.optimal(2.9).number == 1
+    assert bins.optimal(0.7).number == 4
+    assert ladder((1, 100, 199, 5, None)).optimal(1.0) is None
+
+
+def test_empty():
+    bins = ladder()
+    assert len(bins) == 0
+    assert bins.current(100) is None
+    assert bins.max_profit() is None
+
+
+# полная лестница: бин n - от 100 * n до 100 * n + 99, между бинами промежутки в 1
+FULL_LADDER = [(n, 100 * n, 100 * n + 99, n, 1.0) for n in range(1, BINS_QUANTYITY + 1)]
+
+
+@pytest.mark.parametrize("last_price, expected_price, expected_bin", [
+    (250, 250, 2),
+    # цена в промежутке между бинами остается как есть и без текущего бина
+    (199.5, 199.5, None),
+    # заглушка: цена выше верхнего бина переписывается на его to_value
+    (5000, 100 * BINS_QUANTYITY + 99, BINS_QUANTYITY),
+])
+def test_set_bin_ladder_stub_only_above_top_bin(last_price, expected_price, expected_bin):
+    data = AlgorithmDataForSku()
+    data.memo = AlgorithmMemo()
+    product = SimpleNamespace(last_price=last_price, min_price=50)
+    data.set_bin_ladder(ladder(*FULL_LADDER), product)
+    assert product.last_price == expected_price
+    assert (data.current_bin and data.current_bin.number) == expected_bin
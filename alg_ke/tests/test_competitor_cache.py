@@ -0,0 +1,91 @@
+from crud.algorithms.competitor_cache import CompetitorCache
+from database.models import Competitor
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self) -> float:
+        return self.seconds
+
+
+def add_competitors(db, *rows):
+    db.add_all(Competitor(id=competitor_id, sku_id=sku_id, price=price, last_delta_between_us_and_cmp=delta)
+               for competitor_id, sku_id, price, delta in rows)
+    db.commit()
+
+
+def stored_delta(db, competitor_id: int) -> int:
+    db.expire_all()
+    return db.get(Competitor, competitor_id).last_delta_between_us_and_cmp
+
+
+def test_warm_up_best_first_and_hits(db):
+    add_competitors(db, (1, 10, 300.0, 0), (2, 10, 100.0, 0), (3, 11, 200.0, 0))
+    cache = CompetitorCache()
+    loaded = cache.warm_up([10, 11, 12], db)
+    assert [c.price for c in loaded[10]] == [100.0, 300.0]
+    assert loaded[12] == []
+    assert cache.warm_up([10], db)[10] is loaded[10]
+    assert cache.stats()["hits"] == 1
+
+
+def test_ttl_and_lru_eviction(db):
+    add_competitors(db, (1, 10, 100.0, 0), (2, 11, 100.0, 0))
+    clock = Clock()
+    cache = CompetitorCache(ttl=10, max_skus=1, clock=clock)
+    snapshot = cache.warm_up([10], db)[10][0]
+    clock.seconds = 11
+    assert cache.get(10) is None
+    # перезагрузка обновляет тот же снимок
+    assert cache.warm_up([10], db)[10][0] is snapshot
+    cache.warm_up([11], db)
+    assert cache.get(10) is None and cache.evictions == 1
+
+
+def test_concurrent_changes_are_added_not_overwritten(db):
+    add_competitors(db, (1, 10, 100.0, 5))
+    first, second = CompetitorCache(), CompetitorCache()
+    a = first.warm_up([10], db)[10][0]
+    b = second.warm_up([10], db)[10][0]
+    a.last_delta_between_us_and_cmp += 1
+    b.last_delta_between_us_and_cmp -= 3
+    assert first.write_deltas(db) == 1
+    db.commit()
+    assert second.write_deltas(db) == 1
+    db.commit()
+    assert stored_delta(db, 1) == 3
+
+
+def test_written_skus_reload_after_rollback(db):
+    add_competitors(db, (1, 10, 100.0, 0))
+    cache = CompetitorCache()
+    cache.warm_up([10], db)[10][0].last_delta_between_us_and_cmp = 2
+    cache.write_deltas(db)
+    db.rollback()
+    assert cache.get(10) is None
+    assert cache.warm_up([10], db)[10][0].last_delta_between_us_and_cmp == 0
+    assert stored_delta(db, 1) == 0
+
+
+def test_write_after_write_adds_only_new_change(db):
+    add_competitors(db, (1, 10, 100.0, 0))
+    cache = CompetitorCache()
+    snapshot = cache.warm_up([10], db)[10][0]
+    snapshot.last_delta_between_us_and_cmp = 1
+    cache.write_deltas(db)
+    snapshot.last_delta_between_us_and_cmp = 2
+    cache.write_deltas(db)
+    db.commit()
+    assert stored_delta(db, 1) == 2
+
+
+def test_discard_forgets_change(db):
+    add_competitors(db, (1, 10, 100.0, 4))
+    cache = CompetitorCache()
+    snapshot = cache.warm_up([10], db)[10][0]
+    snapshot.last_delta_between_us_and_cmp = 7
+    snapshot.discard()
+    assert snapshot.last_delta_between_us_and_cmp == 4
+    assert cache.write_deltas(db) == 0
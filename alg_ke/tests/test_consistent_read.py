@@ -0,0 +1,63 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import inspect
+
+from crud.algorithms.consistent_read import load_skus, read_snapshot, snapshot_execution_options
+from database.models import Product
+
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def shop_db(db):
+    populate(db, 1, SyntheticShopConfig(products=10))
+    db.commit()
+    return db
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("postgresql", {"isolation_level": "REPEATABLE READ", "postgresql_readonly": True}),
+    ("mysql", {"isolation_level": "REPEATABLE READ"}),
+    ("sqlite", {"isolation_level": "SERIALIZABLE"}),
+])
+def test_snapshot_execution_options(name, expected):
+    assert snapshot_execution_options(SimpleNamespace(name=name)) == expected
+
+
+def test_objects_are_detached_with_loaded_relations(shop_db):
+    product_ids = [product_id for product_id, in shop_db.query(Product.product_id).distinct()]
+    shop_db.commit()
+    with read_snapshot(shop_db) as db:
+        assert db.in_transaction()
+        skus = load_skus(product_ids, db)
+    assert not shop_db.in_transaction()
+    assert skus and all(inspect(sku).detached for sku in skus)
+    # связи, которые читает расчет, загружены внутри блока
+    assert all(sku.shop.responsible_person.username for sku in skus)
+    assert sum(len(sku.participations_in_calendar_event) for sku in skus) > 0
+    assert [(sku.product_id, sku.sku_id) for sku in skus] == sorted((sku.product_id, sku.sku_id) for sku in skus)
+
+
+def test_rolls_back_on_error(shop_db):
+    with pytest.raises(RuntimeError):
+        with read_snapshot(shop_db):
+            shop_db.query(Product).first().mark = "изменена"
+            raise RuntimeError("boom")
+    assert not shop_db.in_transaction()
+    assert "изменена" not in {mark for mark, in shop_db.query(Product.mark)}
+
+
+def test_requires_fresh_transaction(shop_db):
+    shop_db.query(Product).first()
+    with pytest.raises(RuntimeError):
+        with read_snapshot(shop_db):
+            pass
+
+
+def test_read_slots_held_during_snapshot(shop_db):
+    slots = threading.Semaphore(1)
+    with read_snapshot(shop_db, slots):
+        assert not slots.acquire(blocking=False)
+    assert slots.acquire(blocking=False)
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from crud.algorithms import crud_batch
+from database.models import Product
+
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def shop_db(db):
+    populate(db, 1, SyntheticShopConfig(products=40))
+    return db
+
+
+def _sku_ids(db) -> list[int]:
+    return [sku_id for sku_id, in db.query(Product.sku_id).order_by(Product.sku_id)]
+
+
+def test_matches_per_sku_crud(shop_db):
+    assert asyncio.run(crud_batch.check_against_crud(_sku_ids(shop_db), shop_db)) == []
+
+
+class Conditions:
+    def __init__(self, max_price: float, sku_id: int = None):
+        self.max_price = max_price
+        if sku_id is not None:
+            self.sku_id = sku_id
+
+
+def fake_conditions(monkeypatch, by_sku: dict, batch_response):
+    async def conditions_db(ids, session):
+        conditions = [by_sku.get(sku_id) for sku_id in ids]
+        # ответ на один skuid верный, пакетный - как задаст batch_response
+        return conditions if len(ids) == 1 else batch_response(conditions)
+
+    monkeypatch.setattr(crud_batch, "get_product_timer_discount_conditions_db", conditions_db)
+
+
+def test_reordered_conditions_with_sku_id_fall_back(monkeypatch, db):
+    by_sku = {sku_id: Conditions(float(sku_id), sku_id) for sku_id in (1, 2, 3)}
+    fake_conditions(monkeypatch, by_sku, lambda conditions: list(reversed(conditions)))
+    assert asyncio.run(crud_batch.timer_discount_conditions([1, 2, 3], db)) == by_sku
+
+
+def test_conditions_without_gaps_fall_back(monkeypatch, db):
+    # объекты без sku_id, как Conditions kazexapi; у skuid 2 условия нет, а пакетный ответ его просто пропускает
+    by_sku = {1: Conditions(10.0), 3: Conditions(30.0)}
+    fake_conditions(monkeypatch, by_sku, lambda conditions: [c for c in conditions if c is not None])
+    assert asyncio.run(crud_batch.timer_discount_conditions([1, 2, 3], db)) == by_sku
+
+
+def test_aligned_conditions_keyed_by_requested_sku_id(monkeypatch, db):
+    by_sku = {3: Conditions(3.0), 1: Conditions(1.0)}
+    fake_conditions(monkeypatch, by_sku, lambda conditions: conditions)
+    assert asyncio.run(crud_batch.timer_discount_conditions([3, 2, 1], db)) == by_sku
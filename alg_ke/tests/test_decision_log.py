@@ -0,0 +1,65 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from crud.algorithms.bin_ladder import BinLadder
+from crud.algorithms.decision_log import DecisionInputs, DecisionLogWriter, read_decision_log
+from database import Bin
+
+DAY = datetime.datetime(2024, 3, 1, 4, 30)
+
+
+def write(root, results, timestamp=DAY, **kwargs) -> int:
+    with DecisionLogWriter(str(root), timestamp, **kwargs) as writer:
+        for result in results:
+            writer.add(result)
+    return writer.written
+
+
+def test_round_trip(tmp_path, make_result):
+    ladder = BinLadder([Bin(number=1, from_value=100, to_value=199, profit=1, sales_speed=1),
+                        Bin(number=2, from_value=200, to_value=299, profit=1, sales_speed=1)])
+    inputs = {1: DecisionInputs(150.0, 210.0, ladder)}
+    write(tmp_path, [make_result(1, price=250.0, mark="2A6B", path="a,b,", timer_hours=48),
+                     make_result(2, mark="1.2"), make_result(3, error=True)], inputs=inputs)
+    log = read_decision_log(str(tmp_path))
+    assert log["sku_id"].tolist() == [1, 2, 3]
+    assert log["mark"].tolist() == ["2A6B", "1.2", ""]
+    assert log["path"].tolist() == ["a,b,", "", ""]
+    assert log["old_price"][0] == 150.0 and log["competitor_price"][0] == 210.0
+    assert (log["old_bin"][0], log["new_bin"][0]) == (1.0, 2.0)
+    assert np.isnan(log["new_price"][1]) and np.isnan(log["old_bin"][1])
+    assert log["timer_discount_hours"][0] == 48.0
+    assert log["error"].tolist() == [False, False, True]
+    assert log["timestamp"][0] == np.datetime64(DAY, "s")
+
+
+def test_partitions_and_selected_columns(tmp_path, make_result):
+    write(tmp_path, [make_result(1, shop_id=1, price=1.0), make_result(2, shop_id=2, price=2.0)])
+    write(tmp_path, [make_result(1, shop_id=1, price=3.0)], timestamp=DAY + datetime.timedelta(days=1))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["shop=1", "shop=2"]
+
+    log = read_decision_log(str(tmp_path), ["new_price"], shop_ids=[1])
+    assert list(log) == ["new_price"]
+    assert log["new_price"].tolist() == [1.0, 3.0]
+    assert read_decision_log(str(tmp_path), ["sku_id"], start=(DAY + datetime.timedelta(days=1)).date())[
+        "sku_id"].tolist() == [1]
+    assert len(read_decision_log(str(tmp_path), ["sku_id"], shop_ids=[3])["sku_id"]) == 0
+
+
+def test_flush_size_splits_parts(tmp_path, make_result):
+    assert write(tmp_path, [make_result(sku_id) for sku_id in range(5)], flush_size=2) == 5
+    partition = tmp_path / "shop=1" / f"date={DAY.date().isoformat()}"
+    assert len([path for path in partition.iterdir() if path.name.startswith("part-")]) == 3
+    assert sorted(read_decision_log(str(tmp_path), ["sku_id"])["sku_id"].tolist()) == list(range(5))
+
+
+def test_single_part_is_memory_mapped(tmp_path, make_result):
+    write(tmp_path, [make_result(1, price=1.0)])
+    assert isinstance(read_decision_log(str(tmp_path), ["new_price"])["new_price"], np.memmap)
+
+
+def test_unknown_column(tmp_path):
+    with pytest.raises(ValueError):
+        read_decision_log(str(tmp_path), ["price"])
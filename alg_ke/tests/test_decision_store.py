@@ -0,0 +1,36 @@
+from crud.algorithms.decision_store import DecisionStore
+
+
+def test_emits_only_changed(make_result):
+    store = DecisionStore()
+    assert len(list(store.emit([make_result(1, price=10.0), make_result(2, mark="1.2")]))) == 2
+    emitted = list(store.emit([make_result(1, price=10.0), make_result(2, mark="1.3")]))
+    assert [result.product.sku.sku_id for result in emitted] == [2]
+    assert store.stats() == {"skus": 2, "emitted": 3, "suppressed": 1}
+
+
+def test_every_decision_field_counts(make_result):
+    store = DecisionStore()
+    store.changed(make_result(1, price=10.0))
+    for changes in ({"calendar_price": 9.0}, {"timer_hours": 48}, {"timer_remove": 3}, {"calendar_add": 4},
+                    {"calendar_remove": 5}, {"mark": "7"}):
+        assert store.changed(make_result(1, price=10.0, **changes))
+        assert store.changed(make_result(1, price=10.0))
+
+
+def test_errors_always_emitted_and_forget_decision(make_result):
+    store = DecisionStore()
+    store.changed(make_result(1, price=10.0))
+    assert store.changed(make_result(1, error=True))
+    assert store.changed(make_result(1, error=True))
+    assert store.last(1) is None
+    assert store.changed(make_result(1, price=10.0))
+
+
+def test_save_and_load(tmp_path, make_result):
+    path = str(tmp_path / "decisions.pickle")
+    assert DecisionStore.load(path).entries == {}
+    store = DecisionStore()
+    store.changed(make_result(1, price=10.0))
+    store.save(path)
+    assert not DecisionStore.load(path).changed(make_result(1, price=10.0))
@@ -0,0 +1,71 @@
+import pytest
+
+from crud.algorithms.algorithm import AlgorithmDataForSku, AsyncAlgorithm
+from crud.algorithms.decision_tree import DecisionEngine, build_sku_batch
+from crud.algorithms.event_loop import run_sync
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from crud.algorithms.strategy import DEFAULT_STRATEGY, StrategyConfig
+from database.models import Product
+
+import standin
+from synthetic import SyntheticShopConfig, populate
+
+
+class Notifications:
+    def __init__(self):
+        self.sent: dict[int, list[tuple]] = {}
+        self.sku_id = None
+
+    def enqueue(self, kind: str, shop_id: int, username: str, text: str):
+        self.sent.setdefault(self.sku_id, []).append((kind, shop_id, username, text))
+
+
+def load(db) -> tuple[list[Product], AlgorithmPrefetch, list[AlgorithmDataForSku]]:
+    populate(db, 1, SyntheticShopConfig(products=60))
+    sku_list = db.query(Product).order_by(Product.product_id, Product.sku_id).all()
+    prefetch = run_sync(AlgorithmPrefetch.for_sku_list(sku_list, db))
+    return sku_list, prefetch, [run_sync(AlgorithmDataForSku.load(sku, db, prefetch)) for sku in sku_list]
+
+
+def decision(sku: Product, data: AlgorithmDataForSku) -> tuple:
+    result = data.result.product.sku
+    return (result.price.new, result.mark, sku.mark, result.add_to_timer_discount_for_hours,
+            result.remove_from_timer_discount_id,
+            data.competitors[0].last_delta_between_us_and_cmp if data.competitors else None)
+
+
+@pytest.mark.parametrize("strategy", [DEFAULT_STRATEGY, StrategyConfig(position_lead=2, last_price_up_fast=1.03)])
+def test_engine_matches_algorithm(strategy):
+    """Решения DecisionEngine по skuid без fallback совпадают с объектным путем, включая уведомления."""
+    db = standin.create_session_factory()()
+    sku_list, prefetch, data_list = load(db)
+    notifications = Notifications()
+    decisions = DecisionEngine(strategy=strategy).evaluate(build_sku_batch(sku_list, data_list))
+    fallback_products = {sku.product_id for sku, fallback in zip(sku_list, decisions.fallback) if fallback}
+    engine = {}
+    for i, (sku, data) in enumerate(zip(sku_list, data_list)):
+        if sku.product_id not in fallback_products:
+            notifications.sku_id = sku.sku_id
+            decisions.apply(i, sku, data, notifications)
+            engine[sku.sku_id] = decision(sku, data)
+    engine_sent, notifications.sent = notifications.sent, {}
+    db.close()
+
+    db = standin.create_session_factory()()
+    sku_list, prefetch, _ = load(db)
+    expected = {}
+    for product_id in dict.fromkeys(sku.product_id for sku in sku_list):
+        if product_id in fallback_products:
+            continue
+        skus = [sku for sku in sku_list if sku.product_id == product_id]
+        algorithm = AsyncAlgorithm(1, product_id, db, sku_list=skus, prefetch=prefetch, notifier=notifications,
+                                   strategy=strategy)
+        for sku in skus:
+            notifications.sku_id = sku.sku_id
+            run_sync(algorithm.run_for_sku(sku))
+            expected[sku.sku_id] = decision(sku, algorithm.product_db_data)
+    db.close()
+
+    assert engine and fallback_products
+    assert engine == expected
+    assert engine_sent == notifications.sent
@@ -0,0 +1,35 @@
+import datetime
+
+import numpy as np
+
+from crud.algorithms.delivery_solver import days_until_delivery, solve_delivery_prices
+
+
+def test_days_until_delivery():
+    today = datetime.date(2024, 1, 10)
+    assert days_until_delivery(datetime.date(2024, 1, 15), today) == 5
+    assert days_until_delivery(today, today) == 0
+
+
+def test_closest_speed_wins_ties_go_to_lower_bin():
+    to_values = np.array([[100.0, 200.0, 300.0]] * 3)
+    speeds = np.array([[3.0, 2.0, 1.0]] * 3)
+    # остаток 20 за 10 дней - 2 в день; 25 за 10 - 2.5, равноудален от 1-го и 2-го бина
+    prices = solve_delivery_prices(np.array([20.0, 25.0, 10.0]), np.array([10.0, 10.0, 10.0]), to_values, speeds,
+                                   np.full(3, 999.0))
+    assert prices.tolist() == [200.0, 100.0, 300.0]
+
+
+def test_falls_back_to_max_profit():
+    to_values = np.array([[100.0, 200.0], [100.0, np.nan], [100.0, 200.0]])
+    speeds = np.array([[3.0, 2.0], [np.nan, np.nan], [3.0, 2.0]])
+    # поставка сегодня, у бинов нет скорости, поставки нет (NaN)
+    prices = solve_delivery_prices(np.array([10.0, 10.0, 10.0]), np.array([0.0, 5.0, 5.0]), to_values, speeds,
+                                   np.array([111.0, 222.0, 333.0]))
+    assert prices[:2].tolist() == [111.0, 222.0]
+
+
+def test_no_bins():
+    prices = solve_delivery_prices(np.array([10.0]), np.array([5.0]), np.empty((1, 0)), np.empty((1, 0)),
+                                   np.array([7.0]))
+    assert prices.tolist() == [7.0]
@@ -0,0 +1,63 @@
+import asyncio
+import datetime
+
+import pytest
+
+from crud.algorithms import batch
+from crud.algorithms.fingerprint import FingerprintStore, sku_fingerprint
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from database.models import Product
+
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def shop_db(db):
+    populate(db, 1, SyntheticShopConfig(products=12))
+    return db
+
+
+def run(db, fingerprints: FingerprintStore) -> dict[int, tuple]:
+    results = list(batch.iter_shop(1, db, fingerprints=fingerprints))
+    db.commit()
+    return {result.product.sku.sku_id: (result.product.sku.price.new, result.product.sku.mark, result.error)
+            for result in results}
+
+
+def test_fingerprint_covers_input_mark(shop_db):
+    sku_list = shop_db.query(Product).order_by(Product.sku_id).all()
+    prefetch = asyncio.run(AlgorithmPrefetch.for_sku_list(sku_list, shop_db))
+    now = datetime.datetime(2026, 1, 1, 12)
+    sku = sku_list[0]
+    before = sku_fingerprint(sku, prefetch, now)
+    assert sku_fingerprint(sku, prefetch, now) == before
+    sku.mark = (sku.mark or "") + "3L"
+    assert sku_fingerprint(sku, prefetch, now) != before
+
+
+def test_reuse_matches_evaluation(shop_db):
+    fingerprints = FingerprintStore()
+    run(shop_db, fingerprints)
+    # второй запуск видит метки первого на входе, третий - те же входные данные, что второй
+    evaluated = run(shop_db, fingerprints)
+    fingerprints.reused_skus = 0
+    assert run(shop_db, fingerprints) == evaluated
+    assert fingerprints.reused_skus > 0
+
+
+def test_changed_input_mark_is_not_reused(shop_db, make_result):
+    # невалидный skuid не сбрасывает метку, и в его результат идет входная метка: после ее правки
+    # переиспользование записало бы в skuid старую
+    product_id = shop_db.query(Product.product_id).order_by(Product.product_id).first()[0]
+    sku_list = shop_db.query(Product).filter(Product.product_id == product_id).order_by(Product.sku_id).all()
+    prefetch = asyncio.run(AlgorithmPrefetch.for_sku_list(sku_list, shop_db))
+    now = datetime.datetime(2026, 1, 1, 12)
+    fingerprints = FingerprintStore()
+    assert fingerprints.reuse_product(sku_list, prefetch, now) is None
+    fingerprints.remember_product(sku_list, [make_result(sku.sku_id, mark="3L") for sku in sku_list], prefetch)
+
+    mark, sku_list[0].mark = sku_list[0].mark, "ручная"
+    assert fingerprints.reuse_product(sku_list, prefetch, now) is None
+    sku_list[0].mark = mark
+    reused = fingerprints.reuse_product(sku_list, prefetch, now)
+    assert [result.product.sku.mark for result in reused] == [sku.mark for sku in sku_list] == ["3L"] * len(sku_list)
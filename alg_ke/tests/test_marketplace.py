@@ -0,0 +1,53 @@
+from crud.algorithms.marketplace import (CALENDAR_EVENT_ADD, CALENDAR_EVENT_REMOVE, PRICE, TIMER_DISCOUNT_ADD,
+                                         TIMER_DISCOUNT_REMOVE, collect_actions, group_batches)
+
+
+def by_kind(actions) -> dict:
+    kinds = {}
+    for action in actions:
+        kinds.setdefault(action.kind, []).append(action)
+    return kinds
+
+
+def test_noop_prices_and_errors_are_skipped(make_result):
+    results = [make_result(1, price=100.0), make_result(2, price=200.0), make_result(3, price=300.0, error=True),
+               make_result(4)]
+    actions, noops = collect_actions(results, {1: 100.0, 2: 150.0, 3: 1.0}, "run")
+    assert noops == 1
+    assert [(action.kind, action.target_id, action.payload) for action in actions] == \
+        [(PRICE, 2, {"price": 200.0})]
+
+
+def test_timer_actions(make_result):
+    actions, _ = collect_actions([make_result(1, price=90.0, timer_hours=48, timer_remove=None),
+                                  make_result(2, timer_remove=77)], {}, "run")
+    kinds = by_kind(actions)
+    assert kinds[TIMER_DISCOUNT_ADD][0].payload == {"hours": 48, "price": 90.0}
+    assert kinds[TIMER_DISCOUNT_REMOVE][0].payload == {"discount_id": 77}
+
+
+def test_calendar_actions_merged_per_product(make_result):
+    results = [make_result(1, product_id=10, calendar_add=5, calendar_price=90.0),
+               make_result(2, product_id=10, calendar_add=5, calendar_price=95.0),
+               make_result(3, product_id=11, calendar_remove=6), make_result(4, product_id=11, calendar_remove=6)]
+    kinds = by_kind(collect_actions(results, {}, "run")[0])
+    assert len(kinds[CALENDAR_EVENT_ADD]) == 1
+    add = kinds[CALENDAR_EVENT_ADD][0]
+    assert (add.target_id, add.payload) == (10, {"calendar_event_id": 5, "prices": {1: 90.0, 2: 95.0}})
+    assert [action.target_id for action in kinds[CALENDAR_EVENT_REMOVE]] == [11]
+
+
+def test_keys_are_stable_per_run(make_result):
+    first, _ = collect_actions([make_result(1, price=10.0)], {}, "run")
+    again, _ = collect_actions([make_result(1, price=10.0)], {}, "run")
+    other, _ = collect_actions([make_result(1, price=10.0)], {}, "other")
+    assert first[0].key == again[0].key != other[0].key
+
+
+def test_group_batches(make_result):
+    results = [make_result(sku_id, shop_id=1 + sku_id % 2, price=float(sku_id)) for sku_id in range(1, 8)]
+    batches = group_batches(collect_actions(results, {}, "run")[0], batch_size=2)
+    assert set(batches) == {PRICE}
+    assert [(batch.shop_id, [action.target_id for action in batch.actions]) for batch in batches[PRICE]] == \
+        [(2, [1, 3]), (2, [5, 7]), (1, [2, 4]), (1, [6])]
+    assert len({batch.key for batch in batches[PRICE]}) == 4
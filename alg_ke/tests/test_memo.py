@@ -0,0 +1,42 @@
+import asyncio
+
+from crud.algorithms.memo import AlgorithmMemo
+
+
+def test_loads_once():
+    memo = AlgorithmMemo()
+    calls = []
+    for _ in range(3):
+        assert memo.get("key", lambda: calls.append(1) or 42) == 42
+    assert calls == [1]
+    assert memo.stats() == {"hits": 2, "misses": 1}
+
+
+def test_seed_counts_as_loaded():
+    memo = AlgorithmMemo()
+    memo.seed("key", None)
+    assert memo.get("key", lambda: 1) is None
+
+
+def test_invalidate_drops_only_dependents():
+    memo = AlgorithmMemo()
+    memo.seed("current_bin", 1, depends_on=("last_price",))
+    memo.seed("competitors", 2)
+    memo.invalidate("last_price")
+    assert memo.get("current_bin", lambda: 10, depends_on=("last_price",)) == 10
+    assert memo.get("competitors", lambda: 20) == 2
+    # зависимость зарегистрирована заново при перезагрузке
+    memo.invalidate("last_price")
+    assert memo.get("current_bin", lambda: 11) == 11
+    memo.invalidate("unknown")
+
+
+def test_aget():
+    memo = AlgorithmMemo()
+
+    async def load():
+        return 5
+
+    assert asyncio.run(memo.aget("key", load)) == 5
+    assert asyncio.run(memo.aget("key", load)) == 5
+    assert memo.stats() == {"hits": 1, "misses": 1}
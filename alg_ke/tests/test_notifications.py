@@ -0,0 +1,24 @@
+from crud.algorithms.notifications import NotificationDispatcher
+
+
+async def transport(digest):
+    pass
+
+
+def test_drain_groups_by_kind_shop_recipient():
+    dispatcher = NotificationDispatcher(transport, max_digest_size=2)
+    for kind, shop_id, recipient, text in (("message", 1, "a", "1"), ("task", 1, "a", "2"),
+                                           ("message", 1, "a", "3"), ("message", 2, "a", "4"),
+                                           ("message", 1, "b", "5"), ("message", 1, "a", "6")):
+        dispatcher.enqueue(kind, shop_id, recipient, text)
+    digests = [(digest.kind, digest.shop_id, digest.recipient, digest.texts) for digest in dispatcher.drain()]
+    assert digests == [("message", 1, "a", ["1", "3"]), ("message", 1, "a", ["6"]), ("task", 1, "a", ["2"]),
+                       ("message", 2, "a", ["4"]), ("message", 1, "b", ["5"])]
+    assert dispatcher.drain() == []
+
+
+def test_empty_texts_are_dropped():
+    dispatcher = NotificationDispatcher(transport)
+    dispatcher.enqueue("log", 1, "a", "")
+    assert dispatcher.enqueued == 0
+    assert dispatcher.drain() == []
@@ -0,0 +1,49 @@
+from collections import Counter
+
+from crud.algorithms import product_reduce
+from crud.algorithms.algorithm import AsyncAlgorithm
+from crud.algorithms.event_loop import run_sync
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from crud.algorithms.product_reduce import ProductReduce
+from database.models import Product
+
+import standin
+from synthetic import SyntheticShopConfig, populate
+
+
+def decisions(two_phase: bool) -> dict[int, tuple]:
+    """Решения по skuid синтетического магазина; падение продукта - ("crash", тип) у каждого его skuid."""
+    db = standin.create_session_factory()()
+    populate(db, 1, SyntheticShopConfig(products=60))
+    products: dict[int, list[Product]] = {}
+    for sku in db.query(Product).order_by(Product.product_id, Product.sku_id):
+        products.setdefault(sku.product_id, []).append(sku)
+    result = {}
+    for product_id, skus in products.items():
+        prefetch = run_sync(AlgorithmPrefetch.for_sku_list(skus, db))
+        algorithm = AsyncAlgorithm(1, product_id, db, sku_list=skus, prefetch=prefetch, two_phase=two_phase)
+        try:
+            decided = [(r.product.sku.price.new, r.product.sku.price.for_calendar_event, r.product.sku.mark,
+                        r.error, r.path, r.product.add_calendar_event_id_in_lk)
+                       for r in run_sync(algorithm.run_for_product())]
+        except Exception as e:
+            decided = [("crash", type(e).__name__)] * len(skus)
+        result.update(zip((sku.sku_id for sku in skus), decided))
+    db.close()
+    return result
+
+
+def test_two_phase_matches_sequential(monkeypatch):
+    applied = Counter()
+    apply = ProductReduce.apply
+
+    def counting_apply(self, algorithm):
+        applied["deferred"] += sum(sku.deferred is not None for sku in self.skus)
+        applied["price_for_product"] += sum(sku.price_for_product is not product_reduce._UNSET for sku in self.skus)
+        return apply(self, algorithm)
+
+    monkeypatch.setattr(ProductReduce, "apply", counting_apply)
+    expected = decisions(two_phase=False)
+    assert decisions(two_phase=True) == expected
+    # в синтетике есть и отложенные продуктовые проверки, и цена на весь продукт
+    assert applied["deferred"] and applied["price_for_product"]
@@ -0,0 +1,113 @@
+import datetime
+
+from crud.algorithms.scheduler import RepricingScheduler, ScheduledProduct
+
+NOW = datetime.datetime(2024, 1, 1, 12)
+
+
+class Clock:
+    def __init__(self):
+        self.now = NOW
+        self.seconds = 0.0
+
+    def advance(self, seconds: float):
+        self.now += datetime.timedelta(seconds=seconds)
+        self.seconds += seconds
+
+
+def scheduler(clock: Clock, rate: float = 1000.0, burst: int = None) -> RepricingScheduler:
+    return RepricingScheduler(rate, burst, now=lambda: clock.now, clock=lambda: clock.seconds)
+
+
+def product(product_id: int, shop_id: int, priority: float, sku_count: int = 1, ready_in: float = 0.0):
+    return ScheduledProduct(product_id, shop_id, sku_count, priority, NOW + datetime.timedelta(seconds=ready_in))
+
+
+def drain(queue: RepricingScheduler, max_skus: int = 100) -> list:
+    batches = []
+    while (batch := queue.next_batch(max_skus)) is not None:
+        batches.append(batch)
+    return batches
+
+
+def test_batches_by_shop_in_priority_order():
+    queue = scheduler(Clock())
+    for item in (product(1, 1, 5.0), product(2, 2, 9.0), product(3, 1, 7.0), product(4, 2, 1.0),
+                 product(5, 1, 3.0)):
+        queue.push(item)
+    assert drain(queue) == [(2, [2, 4]), (1, [3, 1, 5])]
+    assert len(queue) == 0
+
+
+def test_other_shops_keep_their_order():
+    queue = scheduler(Clock())
+    for item in (product(1, 1, 10.0), product(2, 2, 9.0), product(3, 1, 8.0), product(4, 3, 7.0),
+                 product(5, 2, 6.0)):
+        queue.push(item)
+    assert drain(queue, max_skus=1) == [(1, [1]), (2, [2]), (1, [3]), (3, [4]), (2, [5])]
+
+
+def test_max_skus_limits_batch():
+    queue = scheduler(Clock())
+    for product_id in range(1, 5):
+        queue.push(product(product_id, 1, float(-product_id), sku_count=3))
+    assert drain(queue, max_skus=7) == [(1, [1, 2]), (1, [3, 4])]
+
+
+def test_delayed_until_ready():
+    clock = Clock()
+    queue = scheduler(clock)
+    queue.push(product(1, 1, 1.0, ready_in=60))
+    assert queue.next_batch(10) is None
+    assert queue.seconds_until_next() == 60
+    clock.advance(60)
+    assert queue.next_batch(10) == (1, [1])
+    assert queue.seconds_until_next() is None
+
+
+def test_rate_limit():
+    clock = Clock()
+    queue = scheduler(clock, rate=2.0, burst=2)
+    for product_id in range(1, 4):
+        queue.push(product(product_id, 1, float(-product_id)))
+    assert queue.next_batch(10) == (1, [1, 2])
+    assert queue.next_batch(10) is None
+    assert queue.seconds_until_next() == 0.5
+    clock.advance(0.5)
+    assert queue.next_batch(10) == (1, [3])
+
+
+def test_complete_releases_in_flight():
+    queue = scheduler(Clock())
+    queue.push(product(1, 1, 1.0))
+    queue.next_batch(10)
+    assert 1 in queue.in_flight
+    queue.complete([1])
+    assert not queue.in_flight
+
+
+def test_higher_priority_push_overtakes_shop_head():
+    queue = scheduler(Clock())
+    for item in (product(1, 1, 5.0), product(2, 2, 6.0)):
+        queue.push(item)
+    assert queue.next_batch(1) == (2, [2])
+    queue.push(product(3, 1, 9.0))
+    queue.push(product(4, 2, 1.0))
+    assert drain(queue, max_skus=1) == [(1, [3]), (1, [1]), (2, [4])]
+    assert not queue.ready and len(queue) == 0
+
+
+def test_completed_at_pruned_after_min_interval():
+    clock = Clock()
+    queue = scheduler(clock)
+    interval = queue.min_interval().total_seconds()
+    queue.complete([1, 2])
+    clock.advance(interval / 2)
+    queue.complete([1])
+    assert list(queue.completed_at) == [2, 1]
+    clock.advance(interval / 2)
+    queue.complete([])
+    assert list(queue.completed_at) == [1]
+    clock.advance(interval)
+    queue.complete([3])
+    assert list(queue.completed_at) == [3]
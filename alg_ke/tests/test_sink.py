@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Boolean, Column, Float, Integer, MetaData, String, Table, select
+
+from crud.algorithms.sink import CalculationResultSink, write_results
+
+
+@pytest.fixture
+def table(db) -> Table:
+    table = Table("calculation_result", MetaData(), Column("id", Integer, primary_key=True),
+                  Column("sku_id", Integer), Column("mark", String), Column("new_price", Float),
+                  Column("error", Boolean), Column("path", String))
+    table.create(db.get_bind())
+    return table
+
+
+def rows(db, table: Table) -> list[tuple]:
+    return list(db.execute(select(table.c.sku_id, table.c.mark, table.c.new_price, table.c.error)
+                           .order_by(table.c.sku_id)))
+
+
+def test_writes_in_batches(db, table, make_result):
+    results = [make_result(sku_id, mark="3L", price=100.0 + sku_id) for sku_id in range(1, 8)]
+    with CalculationResultSink(db, table, flush_size=3) as sink:
+        sink.write_all(results)
+    assert (sink.written, sink.flushes) == (7, 3)
+    # лишние ключи calculation_result_row (shop_id, text, ...) в таблицу не попадают
+    assert rows(db, table) == [(sku_id, "3L", 100.0 + sku_id, False) for sku_id in range(1, 8)]
+
+
+def test_exception_skips_final_flush(db, table, make_result):
+    with pytest.raises(RuntimeError):
+        with CalculationResultSink(db, table, flush_size=2) as sink:
+            for sku_id in range(1, 4):
+                sink.add(make_result(sku_id))
+            raise RuntimeError("boom")
+    assert [row[0] for row in rows(db, table)] == [1, 2]
+
+
+def test_write_results(db, table, make_result):
+    assert write_results((make_result(sku_id, error=True) for sku_id in range(5)), db, table, flush_size=2) == 5
+    assert len(rows(db, table)) == 5
+
+
+class CopyCursor:
+    def __init__(self):
+        self.copies: list[tuple[str, str]] = []
+
+    def copy_expert(self, sql: str, buffer):
+        self.copies.append((sql, buffer.read()))
+
+    def close(self):
+        pass
+
+
+def test_copy_for_psycopg2(table, make_result):
+    cursor = CopyCursor()
+    committed = []
+    dialect = SimpleNamespace(name="postgresql", driver="psycopg2")
+    db = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=dialect),
+                         connection=lambda: SimpleNamespace(connection=SimpleNamespace(cursor=lambda: cursor)),
+                         commit=lambda: committed.append(True))
+    results = [make_result(1, mark='3"L', price=99.5), make_result(2, mark="", path="a,b")]
+    assert write_results(results, db, table, use_copy=True) == 2
+    assert committed == [True]
+    [(sql, payload)] = cursor.copies
+    assert sql == "COPY calculation_result (sku_id, mark, new_price, error, path) FROM STDIN WITH (FORMAT csv)"
+    # пустая строка - в кавычках, None - пустое поле (NULL)
+    assert payload == '1,"3""L",99.5,False,""\n2,"",,False,"a,b"\n'
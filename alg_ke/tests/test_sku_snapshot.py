@@ -0,0 +1,79 @@
+import pickle
+
+import pytest
+
+from crud.algorithms import batch
+from crud.algorithms.competitor_cache import CompetitorSnapshot
+from crud.algorithms.consistent_read import load_skus, read_snapshot
+from crud.algorithms.event_loop import run_sync
+from crud.algorithms.sku_snapshot import SkuSnapshot, load_sku_snapshots
+from database.models import Competitor, Product
+
+import standin
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def shop_db(db):
+    populate(db, 1, SyntheticShopConfig(products=20))
+    db.commit()
+    return db
+
+
+def product_ids(db) -> list[int]:
+    ids = sorted({product_id for product_id, in db.query(Product.product_id)})
+    db.commit()
+    return ids
+
+
+def test_snapshot_copies_orm_fields(shop_db):
+    ids = product_ids(shop_db)
+    with read_snapshot(shop_db):
+        loaded = run_sync(load_sku_snapshots(ids, shop_db))
+        sku_list = load_skus(ids, shop_db)
+    assert [sku.sku_id for sku in loaded.skus] == [sku.sku_id for sku in sku_list]
+    for snapshot, sku in zip(loaded.skus, sku_list):
+        assert all(getattr(snapshot, name) == getattr(sku, name) for name in SkuSnapshot._COLUMNS)
+        assert snapshot.shop.responsible_person.username == sku.shop.responsible_person.username
+        assert [p.calendar_event_id_in_lk for p in snapshot.participations_in_calendar_event] == \
+            [p.calendar_event_id_in_lk for p in sku.participations_in_calendar_event]
+        expected, actual = sku.most_suitable_calendar_event, snapshot.most_suitable_calendar_event
+        assert (actual and actual.calendar_event_id_in_lk) == (expected and expected.calendar_event_id_in_lk)
+    # skuid одного магазина делят один снимок магазина
+    assert len({id(snapshot.shop) for snapshot in loaded.skus}) == 1
+    assert all(isinstance(c, CompetitorSnapshot) for cs in loaded.prefetch.competitors.values() for c in cs)
+
+
+def test_snapshot_batch_pickles_without_session(shop_db):
+    ids = product_ids(shop_db)
+    with read_snapshot(shop_db):
+        loaded = run_sync(load_sku_snapshots(ids, shop_db))
+    restored = pickle.loads(pickle.dumps(loaded))
+    assert [(sku.sku_id, sku.last_price, sku.shop.id) for sku in restored.skus] == \
+        [(sku.sku_id, sku.last_price, sku.shop.id) for sku in loaded.skus]
+    assert restored.prefetch.bin_ladders.keys() == loaded.prefetch.bin_ladders.keys()
+
+
+def decisions(snapshot: bool) -> tuple[dict[int, tuple], dict[int, int]]:
+    """Решения по skuid и изменения дельт конкурентов после расчета магазина."""
+    db = standin.create_session_factory()()
+    populate(db, 1, SyntheticShopConfig(products=20))
+    before = dict(db.query(Competitor.id, Competitor.last_delta_between_us_and_cmp))
+    db.commit()
+    results = {}
+    for result in batch.iter_shop(1, db, snapshot=snapshot):
+        sku = result.product.sku
+        results[sku.sku_id] = sku.price.new, sku.mark, result.error, result.path
+        # без снимка iter_shop очищает сессию после чанка: изменения сохраняются до перехода к следующему
+        db.commit()
+    changes = {competitor_id: delta - before[competitor_id]
+               for competitor_id, delta in db.query(Competitor.id, Competitor.last_delta_between_us_and_cmp)
+               if delta != before[competitor_id]}
+    db.close()
+    return results, changes
+
+
+def test_snapshot_evaluation_matches_orm():
+    results, changes = decisions(snapshot=False)
+    assert changes
+    assert decisions(snapshot=True) == (results, changes)
@@ -0,0 +1,45 @@
+import datetime
+
+import pytest
+
+from crud.algorithms import backtest
+from crud.algorithms.algorithm import AlgorithmDataForSku
+from crud.algorithms.decision_tree import DecisionEngine
+from crud.algorithms.event_loop import run_sync
+from crud.algorithms.prefetch import AlgorithmPrefetch
+from crud.algorithms.strategy import DEFAULT_STRATEGY
+from crud.algorithms.sweep import run_sweep, strategy_grid
+from database.models import Product
+
+from synthetic import SyntheticShopConfig, populate
+
+
+@pytest.fixture
+def snapshot_path(db, tmp_path) -> str:
+    populate(db, 1, SyntheticShopConfig(products=30))
+    sku_list = db.query(Product).order_by(Product.sku_id).all()
+    prefetch = run_sync(AlgorithmPrefetch.for_sku_list(sku_list, db))
+    data_list = [run_sync(AlgorithmDataForSku.load(sku, db, prefetch)) for sku in sku_list]
+    path = str(tmp_path / "snapshot.npz")
+    backtest.save_snapshot(path, backtest.snapshot_from_data(sku_list, data_list, datetime.date(2026, 1, 1)))
+    return path
+
+
+def test_strategy_grid():
+    grid = strategy_grid(position_lead=(6, 10), last_price_up=(1.01, 1.02))
+    assert [(s.position_lead, s.last_price_up) for s in grid] == [(6, 1.01), (6, 1.02), (10, 1.01), (10, 1.02)]
+    assert all(s.competitor_markup == DEFAULT_STRATEGY.competitor_markup for s in grid)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_sweep_matches_backtest(snapshot_path, max_workers):
+    strategies = strategy_grid(position_lead=(2, DEFAULT_STRATEGY.position_lead, 20))
+    results = run_sweep(snapshot_path, strategies + strategies[:1], max_workers=max_workers, chunk_size=11)
+    # повторы стратегий считаются один раз, порядок - как на входе
+    assert [strategy for strategy, _ in results] == strategies
+    for strategy, report in results:
+        expected = backtest.run_backtest([backtest.load_snapshot(snapshot_path)], DecisionEngine(strategy=strategy),
+                                         chunk_size=11)
+        assert report.to_dict() == expected.to_dict()
+    # стратегии сетки действительно дают разные решения
+    assert len({repr(report.to_dict()) for _, report in results}) > 1
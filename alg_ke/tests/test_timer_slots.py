@@ -0,0 +1,18 @@
+from crud.algorithms.timer_slots import TimerSlotCandidate, allocate_timer_slots
+
+
+def test_ranking():
+    candidates = [TimerSlotCandidate(1, False, 100.0, 0.5), TimerSlotCandidate(2, True, 10.0, 0.1),
+                  TimerSlotCandidate(3, True, 50.0, 0.1), TimerSlotCandidate(4, True, 50.0, 0.3)]
+    assert allocate_timer_slots(candidates, 2) == {4, 3}
+    assert allocate_timer_slots(candidates, 3) == {4, 3, 2}
+
+
+def test_ties_by_sku_id():
+    candidates = [TimerSlotCandidate(sku_id, True, 1.0, 0.1) for sku_id in (5, 2, 9)]
+    assert allocate_timer_slots(candidates, 1) == {2}
+
+
+def test_no_slots():
+    assert allocate_timer_slots([TimerSlotCandidate(1, True, 1.0, 0.1)], 0) == frozenset()
+    assert allocate_timer_slots([], 3) == frozenset()
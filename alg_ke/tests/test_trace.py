@@ -0,0 +1,43 @@
+from crud.algorithms import trace
+from crud.algorithms.trace import DecisionTrace
+
+
+def test_render_interned_and_extra():
+    decision = DecisionTrace()
+    decision.add_path("1.")
+    decision.add_path("2", intern=False)
+    decision.add_text("цена ")
+    decision.set_text("итог", intern=False)
+    assert decision.render_path() == "1.2"
+    assert decision.render_text() == "итог"
+
+
+def test_full_table_is_replaced_and_old_traces_still_render(monkeypatch):
+    monkeypatch.setattr(trace, "MAX_TABLE_STRINGS", 2)
+    monkeypatch.setattr(trace, "_table", trace.StringTable())
+    first = DecisionTrace()
+    for value in ("a", "b", "c"):
+        first.add_path(value)
+    second = DecisionTrace()
+    second.add_path("d")
+    assert second.strings is not first.strings
+    assert len(second.strings) == 1
+    assert first.render_path() == "abc"
+    assert second.render_path() == "d"
+
+
+def test_sync_algorithm_render_trace_flag(db):
+    from crud.algorithms.algorithm import Algorithm
+    from database.models import Product
+    from synthetic import SyntheticShopConfig, populate
+
+    populate(db, 1, SyntheticShopConfig(products=5))
+    product_id = db.query(Product.product_id).order_by(Product.product_id).first()[0]
+    rendered = Algorithm(1, product_id, db).run_for_product()
+    db.rollback()
+    silent = Algorithm(1, product_id, db, render_trace=False)
+    results = silent.run_for_product()
+    assert rendered and len(results) == len(rendered) and all(result.path for result in rendered)
+    assert all(result.path == "" and result.text == "" for result in results)
+    # трассировка не собрана в результат, но осталась у последнего skuid
+    assert silent.product_db_data.trace.render_path() == rendered[-1].path
@@ -0,0 +1,75 @@
+"""
+Распределение свободных акций с таймером магазина между skuid до расчета.
+
+Дерево решений добавляет в акцию с таймером только top skuid (метки 4A и 6A), а проверка has_free_timer_discounts
+смотрит лишь на счетчик магазина: каждый skuid видит те же свободные акции, и при расчете skuid по очереди
+или параллельно магазин получает больше заявок, чем у него акций. allocate_timer_slots заранее собирает всех
+кандидатов магазина, ранжирует их и отдает акции первым; skuid без выделенной акции получают метку 7, как при
+занятых акциях. Набор выделенных sku_id передается в расчет через AlgorithmPrefetch.timer_slots.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from crud.algorithms.crud_batch import timer_discount_conditions
+from crud.algorithms.prefetch import chunked
+from database.models import Shop, Product as ProductDb
+
+
+class TimerSlotCandidate:
+    """skuid, который может дойти до добавления в акцию с таймером."""
+    __slots__ = ("sku_id", "top", "expected_gain", "headroom")
+
+    def __init__(self, sku_id: int, top: bool, expected_gain: float, headroom: float):
+        self.sku_id = sku_id
+        self.top = top
+        # ожидаемая выручка за день в акции: скорость продаж по цене не выше максимальной цены акции
+        self.expected_gain = expected_gain
+        # доля максимальной цены акции над минимальной ценой skuid
+        self.headroom = headroom
+
+    def rank(self) -> tuple:
+        return not self.top, -self.expected_gain, -self.headroom, self.sku_id
+
+
+def allocate_timer_slots(candidates: Iterable[TimerSlotCandidate], slots: int) -> frozenset[int]:
+    """sku_id первых slots кандидатов: top, затем больший ожидаемый доход, затем больший запас до min цены."""
+    if slots <= 0:
+        return frozenset()
+    return frozenset(candidate.sku_id for candidate in sorted(candidates, key=TimerSlotCandidate.rank)[:slots])
+
+
+async def load_timer_slot_candidates(shop_id: int, db: Session) -> list[TimerSlotCandidate]:
+    """
+    top skuid в продаже с остатком, еще не в акциях, у которых максимальная цена акции с таймером выше
+    минимальной цены: остальные до добавления в акцию не дойдут. Участие в календарных акциях не проверяется,
+    такие skuid занимают акцию зря, но лимит магазина от этого не нарушается.
+    """
+    skus = db.query(ProductDb.sku_id, ProductDb.top, ProductDb.last_price, ProductDb.min_price,
+                    ProductDb.average_sales_speed).filter(
+        ProductDb.shop_id == shop_id, ProductDb.top.is_(True), ProductDb.active.is_(True),
+        ProductDb.status_title == "В продаже", ProductDb.stock > 0, ProductDb.last_price > ProductDb.min_price,
+        ProductDb.on_timer_discount.isnot(True), ProductDb.on_calendar_event.isnot(True)).all()
+
+    candidates = []
+    for chunk in chunked(skus):
+        conditions = await timer_discount_conditions([sku.sku_id for sku in chunk], db)
+        for sku in chunk:
+            condition = conditions.get(sku.sku_id)
+            max_price = condition.max_price if condition else None
+            if max_price is None or max_price <= sku.min_price:
+                continue
+            candidates.append(TimerSlotCandidate(
+                sku.sku_id, bool(sku.top),
+                (sku.average_sales_speed or 0.0) * min(sku.last_price, max_price),
+                (max_price - sku.min_price) / max_price))
+    return candidates
+
+
+async def allocate_shop_timer_slots(shop_id: int, db: Session, slots: Optional[int] = None) -> frozenset[int]:
+    """Акции магазина для его skuid; slots по умолчанию - Shop.quantity_available_timer_discounts."""
+    if slots is None:
+        slots = db.query(Shop.quantity_available_timer_discounts).filter(Shop.id == shop_id).scalar() or 0
+    if slots <= 0:
+        return frozenset()
+    return allocate_timer_slots(await load_timer_slot_candidates(shop_id, db), slots)
@@ -0,0 +1,94 @@
+from array import array
+
+from crud.algorithms.models import CheckResult
+
+# после стольких строк процесс начинает новую таблицу, старая живет, пока на нее ссылаются трассировки
+MAX_TABLE_STRINGS = 50_000
+
+
+class StringTable:
+    """Таблица строк пути и текста: в трассировке skuid хранятся только их номера."""
+    __slots__ = ("strings", "codes")
+
+    def __init__(self):
+        self.strings: list[str] = []
+        self.codes: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def intern(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+_table = StringTable()
+
+
+def current_table() -> StringTable:
+    """
+    Общая таблица процесса. Если в путь или текст попадают строки с данными, таблица долгоживущего воркера
+    росла бы без предела, поэтому заполненная таблица заменяется новой.
+    """
+    global _table
+    if len(_table) >= MAX_TABLE_STRINGS:
+        _table = StringTable()
+    return _table
+
+
+class DecisionTrace:
+    """
+    Путь и текст решения по skuid в виде массивов кодов строк.
+    Строки с данными конкретного skuid (цены, проценты) не интернируются, а лежат в extra и кодируются
+    отрицательными номерами. Читаемые path/text собираются только в render, по таблице strings,
+    взятой при создании трассировки.
+    """
+    __slots__ = ("path", "text", "extra", "strings")
+
+    def __init__(self):
+        self.strings = current_table()
+        self.path: array = array("i")
+        self.text: array = array("i")
+        self.extra: list[str] = []
+
+    def _code(self, value: str, intern: bool) -> int:
+        if intern:
+            return self.strings.intern(value)
+        self.extra.append(value)
+        return -len(self.extra)
+
+    def add_path(self, value: str, intern: bool = True):
+        self.path.append(self._code(value, intern))
+
+    def add_text(self, value: str, intern: bool = True):
+        self.text.append(self._code(value, intern))
+
+    def set_text(self, value: str, intern: bool = True):
+        del self.text[:]
+        self.add_text(value, intern)
+
+    def apply(self, result: CheckResult):
+        if result.path is not None:
+            self.add_path(result.path)
+        if result.text is not None:
+            self.add_text(result.text)
+        if result.full_text is not None:
+            self.set_text(result.full_text)
+        return result.result
+
+    def _render(self, codes: array) -> str:
+        strings = self.strings.strings
+        return "".join(self.extra[-code - 1] if code < 0 else strings[code] for code in codes)
+
+    def render_path(self) -> str:
+        return self._render(self.path)
+
+    def render_text(self) -> str:
+        return self._render(self.text)
+
+    def render_into(self, calculation_result):
+        calculation_result.path = self.render_path()
+        calculation_result.text = self.render_text()